@@ -0,0 +1,176 @@
+import os
+from datetime import date
+from typing import Optional, Tuple
+
+# --- SKEMA attendance_logs (INDEKS + PARTISI BULANAN) ---
+#
+# Filter `absent_at::date = CURRENT_DATE` tidak bisa memakai indeks. Tabel kini
+# punya kolom tersimpan `absent_date` (generated dari absent_at, waktu WIB naive)
+# dan indeks komposit (intern_*, absent_date, absent_at DESC), sehingga query
+# "log hari ini" cukup membaca satu rentang indeks.
+#
+# Opsional (ATTENDANCE_PARTITIONING=1): tabel dipartisi RANGE per bulan pada
+# absent_at, dengan partisi DEFAULT sebagai penampung. Tabel lama (non-partisi)
+# dimigrasikan lewat `python -m backend.setup_tables --migrate-attendance`.
+
+ATTENDANCE_TABLE = "attendance_logs"
+ATTENDANCE_PARTITIONING = os.getenv("ATTENDANCE_PARTITIONING", "0") == "1"
+ATTENDANCE_PARTITIONS_AHEAD = int(os.getenv("ATTENDANCE_PARTITIONS_AHEAD", "2")) # Bulan ke depan yang disiapkan
+
+ATTENDANCE_COPY_COLUMNS = "log_id, intern_id, intern_name, instansi, kategori, image_url, absent_at, type, spool_id"
+
+
+def _month_start(day: date, offset: int = 0) -> date:
+    month_index = day.year * 12 + (day.month - 1) + offset
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(month: date, table: str = ATTENDANCE_TABLE) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def attendance_table_ddl(partitioned: bool, cascade: bool = False, table: str = ATTENDANCE_TABLE) -> str:
+    """
+    DDL tabel log absensi. Pada tabel partisi, kunci primer wajib memuat kolom
+    partisi (absent_at), jadi PK menjadi (log_id, absent_at).
+    """
+    on_delete = " ON DELETE CASCADE" if cascade else ""
+    primary_key = "log_id BIGSERIAL," if partitioned else "log_id SERIAL PRIMARY KEY,"
+    trailer = ",\n            PRIMARY KEY (log_id, absent_at)" if partitioned else ""
+    partition_clause = " PARTITION BY RANGE (absent_at)" if partitioned else ""
+    return f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            {primary_key}
+            intern_id INTEGER REFERENCES interns(id){on_delete},
+            intern_name TEXT NOT NULL,
+            instansi TEXT,
+            kategori TEXT,
+            image_url TEXT,
+            absent_at TIMESTAMP WITHOUT TIME ZONE,
+            absent_date DATE GENERATED ALWAYS AS (absent_at::date) STORED,
+            type TEXT NOT NULL DEFAULT 'IN',
+            spool_id TEXT{trailer}
+        ){partition_clause};
+    """
+
+
+def is_partitioned(cursor, table: str = ATTENDANCE_TABLE) -> bool:
+    cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s AND relkind IN ('r', 'p')", (table,))
+    row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def ensure_attendance_columns(cursor, table: str = ATTENDANCE_TABLE):
+    """Migrasi kolom untuk tabel lama: spool_id (write-behind) dan absent_date (generated)."""
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS spool_id TEXT;")
+    cursor.execute(f"""
+        ALTER TABLE {table}
+            ADD COLUMN IF NOT EXISTS absent_date DATE GENERATED ALWAYS AS (absent_at::date) STORED;
+    """)
+
+
+def ensure_attendance_indexes(cursor, table: str = ATTENDANCE_TABLE):
+    """Indeks komposit untuk cek per intern/hari + kunci idempotensi spool write-behind."""
+    cursor.execute(f"""
+        CREATE INDEX IF NOT EXISTS {table}_intern_day_idx
+        ON {table} (intern_id, absent_date, absent_at DESC);
+    """)
+    cursor.execute(f"""
+        CREATE INDEX IF NOT EXISTS {table}_name_day_idx
+        ON {table} (intern_name, absent_date, absent_at DESC);
+    """)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {table}_day_idx ON {table} (absent_date);")
+    cursor.execute(f"""
+        CREATE UNIQUE INDEX IF NOT EXISTS {table}_spool_id_key
+        ON {table} (spool_id, absent_at);
+    """)
+
+
+def ensure_monthly_partitions(cursor, today: date, months_ahead: int = ATTENDANCE_PARTITIONS_AHEAD,
+                              first_month: Optional[date] = None, table: str = ATTENDANCE_TABLE) -> int:
+    """
+    Membuat partisi bulanan dari first_month (default: bulan ini) sampai
+    months_ahead bulan ke depan, plus partisi DEFAULT. Mengembalikan jumlah partisi baru.
+    """
+    month = _month_start(first_month or today)
+    last_month = _month_start(today, months_ahead)
+    created = 0
+    while month <= last_month:
+        name = partition_name(month, table)
+        cursor.execute("SELECT to_regclass(%s)", (name,))
+        if cursor.fetchone()[0] is None:
+            cursor.execute(
+                f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s);",
+                (month, _month_start(month, 1)),
+            )
+            created += 1
+        month = _month_start(month, 1)
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT;")
+    return created
+
+
+def ensure_attendance_schema(cursor, today: date, partitioned: bool = ATTENDANCE_PARTITIONING, cascade: bool = False):
+    """Membuat/memigrasikan tabel log absensi secara idempoten (dipanggil saat startup API)."""
+    cursor.execute("SELECT to_regclass(%s)", (ATTENDANCE_TABLE,))
+    exists = cursor.fetchone()[0] is not None
+    if not exists:
+        cursor.execute(attendance_table_ddl(partitioned, cascade))
+    else:
+        ensure_attendance_columns(cursor)
+        if partitioned and not is_partitioned(cursor):
+            print("⚠️ ATTENDANCE_PARTITIONING=1 tetapi attendance_logs belum dipartisi. "
+                  "Jalankan: python -m backend.setup_tables --migrate-attendance")
+
+    if is_partitioned(cursor):
+        ensure_monthly_partitions(cursor, today)
+    ensure_attendance_indexes(cursor)
+
+
+def migrate_to_partitioned(conn, today: date) -> Tuple[int, int]:
+    """
+    Memigrasikan attendance_logs non-partisi ke tabel partisi bulanan dalam satu transaksi.
+    Tabel lama disimpan sebagai attendance_logs_legacy (hapus manual setelah diverifikasi).
+    Baris tanpa absent_at tidak bisa masuk tabel partisi (kolom partisi bagian dari PK),
+    jadi dilewati dan tetap ada di tabel legacy.
+    Mengembalikan (jumlah baris disalin, jumlah baris absent_at NULL yang dilewati).
+    """
+    legacy = f"{ATTENDANCE_TABLE}_legacy"
+    with conn.cursor() as cursor:
+        if is_partitioned(cursor):
+            print("✅ attendance_logs sudah dipartisi, tidak ada yang dimigrasikan.")
+            return 0, 0
+        cursor.execute("SELECT to_regclass(%s)", (legacy,))
+        if cursor.fetchone()[0] is not None:
+            raise RuntimeError(f"Tabel '{legacy}' sudah ada; hapus atau ganti namanya sebelum migrasi ulang.")
+
+        cursor.execute(f"ALTER TABLE {ATTENDANCE_TABLE} ADD COLUMN IF NOT EXISTS spool_id TEXT;")
+
+        # Lepaskan nama indeks & sequence lama agar bisa dipakai tabel baru
+        cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = %s", (ATTENDANCE_TABLE,))
+        for (index_name,) in cursor.fetchall():
+            cursor.execute(f"ALTER INDEX {index_name} RENAME TO {index_name}_legacy;")
+        cursor.execute(f"ALTER TABLE {ATTENDANCE_TABLE} RENAME TO {legacy};")
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'log_id')", (legacy,))
+        sequence = cursor.fetchone()[0]
+        if sequence:
+            cursor.execute(f"ALTER SEQUENCE {sequence} RENAME TO {legacy}_log_id_seq;")
+
+        cursor.execute(attendance_table_ddl(partitioned=True))
+        cursor.execute(f"SELECT MIN(absent_at) FROM {legacy}")
+        oldest = cursor.fetchone()[0]
+        ensure_monthly_partitions(cursor, today, first_month=oldest.date() if oldest else None)
+        ensure_attendance_indexes(cursor)
+
+        cursor.execute(f"""
+            INSERT INTO {ATTENDANCE_TABLE} ({ATTENDANCE_COPY_COLUMNS})
+            SELECT {ATTENDANCE_COPY_COLUMNS} FROM {legacy} WHERE absent_at IS NOT NULL;
+        """)
+        copied = cursor.rowcount
+        cursor.execute(f"SELECT COUNT(*) FROM {legacy} WHERE absent_at IS NULL")
+        skipped = cursor.fetchone()[0]
+        cursor.execute(f"""
+            SELECT setval(pg_get_serial_sequence('{ATTENDANCE_TABLE}', 'log_id'),
+                          COALESCE((SELECT MAX(log_id) FROM {ATTENDANCE_TABLE}), 0) + 1, false);
+        """)
+    conn.commit()
+    return copied, skipped
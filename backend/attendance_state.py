@@ -0,0 +1,72 @@
+import threading
+from datetime import date
+from typing import Dict, List, Optional
+
+# --- STATE ABSENSI HARI INI (IN-MEMORY) ---
+#
+# Menyimpan log terakhir (IN/OUT) per intern untuk hari berjalan, sehingga cek
+# duplikat di /recognize dan endpoint /attendance/today tidak perlu query ke
+# attendance_logs. Dimuat saat startup, diperbarui di setiap log_attendance,
+# dan dikosongkan saat reset harian atau otomatis saat tanggal (WIB) berganti.
+
+
+class TodayAttendance:
+    """Peta intern -> log terakhir hari ini. Semua waktu berupa datetime naive WIB."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._day: Optional[date] = None
+        self._latest: Dict[str, dict] = {}
+
+    @property
+    def loaded(self) -> bool:
+        return self._day is not None
+
+    def _roll(self, today: date):
+        """Mengosongkan state jika hari sudah berganti (dipanggil dengan _lock dipegang)."""
+        if self._day != today:
+            self._day = today
+            self._latest = {}
+
+    def load(self, today: date, entries: List[dict]):
+        """Mengganti seluruh state dengan log hari ini (dari DB + antrean write-behind)."""
+        with self._lock:
+            self._day = today
+            self._latest = {}
+        for entry in entries:
+            self.record(entry)
+
+    def record(self, entry: dict):
+        """
+        Mencatat satu log: {name, instansi, kategori, type, absent_at, image_url}.
+        Log dari hari lain diabaikan; log yang lebih lama dari state tidak menimpa.
+        """
+        entry_day = entry["absent_at"].date()
+        with self._lock:
+            if self._day is None:
+                return  # Belum dimuat dari DB; state parsial tidak boleh dipakai
+            if entry_day > self._day:
+                self._roll(entry_day)
+            elif entry_day < self._day:
+                return
+            current = self._latest.get(entry["name"])
+            if current is None or entry["absent_at"] >= current["absent_at"]:
+                self._latest[entry["name"]] = dict(entry)
+
+    def latest(self, name: str, today: date) -> Optional[dict]:
+        with self._lock:
+            self._roll(today)
+            entry = self._latest.get(name)
+            return dict(entry) if entry else None
+
+    def entries(self, today: date) -> List[dict]:
+        """Log terakhir semua intern hari ini, terbaru lebih dulu."""
+        with self._lock:
+            self._roll(today)
+            entries = [dict(entry) for entry in self._latest.values()]
+        return sorted(entries, key=lambda entry: entry["absent_at"], reverse=True)
+
+    def clear(self, today: date):
+        with self._lock:
+            self._day = today
+            self._latest = {}
@@ -0,0 +1,141 @@
+import hashlib
+import os
+import queue
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional
+
+# --- KATALOG AUDIO TTS ---
+#
+# File audio diberi nama dari hash teks pesannya (tts_<hash>.mp3), sehingga
+# pesan berbeda (misal "terlambat" vs "selamat datang") tidak pernah berbagi file.
+# Sintesis gTTS berjalan di satu thread latar belakang; request tidak pernah
+# menunggu sintesis. Jika audio belum siap, request memakai audio fallback
+# generik dan pesan personalnya diantrekan untuk request berikutnya.
+
+
+def audio_filename_for(text: str) -> str:
+    """Nama file deterministik untuk satu teks pesan."""
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+    return f"tts_{digest}.mp3"
+
+
+class AudioCatalog:
+    """
+    Cache file audio TTS di satu folder dengan batas ukuran LRU.
+
+    - `register_static()` mendaftarkan audio sistem (S00x.mp3) yang tidak pernah dihapus.
+    - `track_for()` mengembalikan nama file jika sudah ada, atau fallback + antrekan sintesis.
+    - `prefetch()` mengantrekan sintesis tanpa menunggu (dipakai setelah indexing).
+
+    Urutan LRU memakai mtime file (disentuh setiap kali dipakai), sehingga
+    tetap konsisten di antara beberapa worker yang berbagi folder yang sama.
+    """
+
+    def __init__(self, directory: Path, synthesize: Callable[[str, str], None], max_files: int = 2000):
+        self.directory = Path(directory)
+        self.synthesize = synthesize
+        self.max_files = max_files
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._static: Dict[str, str] = {}  # nama file -> teks
+        self.stats = {"hits": 0, "misses": 0, "generated": 0, "failed": 0, "evicted": 0}
+        self._thread = threading.Thread(target=self._run, name="tts-catalog", daemon=True)
+        self._thread.start()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def register_static(self, filename: str, text: str) -> str:
+        """Mendaftarkan audio sistem dengan nama tetap; disintesis di latar belakang jika belum ada."""
+        self._static[filename] = text
+        if not (self.directory / filename).exists():
+            self._enqueue(filename, text)
+        return filename
+
+    def track_for(self, text: str, fallback: Optional[str] = None) -> Optional[str]:
+        """
+        Nama file audio untuk `text` jika sudah tersedia (tanpa I/O jaringan).
+        Jika belum, sintesis diantrekan dan `fallback` yang dikembalikan.
+        """
+        filename = audio_filename_for(text)
+        path = self.directory / filename
+        try:
+            os.utime(path)  # Sentuh mtime -> posisi terbaru di LRU
+        except FileNotFoundError:
+            self.stats["misses"] += 1
+            self._enqueue(filename, text)
+            return fallback
+        self.stats["hits"] += 1
+        return filename
+
+    def prefetch(self, texts: Iterable[str]) -> int:
+        """Mengantrekan sintesis untuk semua teks yang belum punya file. Mengembalikan jumlah yang diantrekan."""
+        queued = 0
+        for text in texts:
+            filename = audio_filename_for(text)
+            if not (self.directory / filename).exists() and self._enqueue(filename, text):
+                queued += 1
+        return queued
+
+    def _enqueue(self, filename: str, text: str) -> bool:
+        with self._pending_lock:
+            if filename in self._pending:
+                return False
+            self._pending.add(filename)
+        self._queue.put((filename, text))
+        return True
+
+    def _run(self):
+        while True:
+            filename, text = self._queue.get()
+            try:
+                self._generate(filename, text)
+            finally:
+                with self._pending_lock:
+                    self._pending.discard(filename)
+
+    def _generate(self, filename: str, text: str):
+        path = self.directory / filename
+        if path.exists():
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # Tulis ke file sementara lalu rename agar /audio tidak pernah menyajikan file setengah jadi
+        # (nama sementara per proses: beberapa worker bisa mensintesis file yang sama bersamaan)
+        tmp_path = self.directory / f".{filename}.{os.getpid()}.tmp"
+        try:
+            print(f"   -> 🔊 Generating TTS file: {filename} for text: '{text}'...")
+            self.synthesize(text, str(tmp_path))
+            os.replace(tmp_path, path)
+            self.stats["generated"] += 1
+        except Exception as e:
+            self.stats["failed"] += 1
+            print(f"❌ ERROR: Gagal generate file audio {filename}. Pastikan Anda memiliki koneksi internet: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        self._evict()
+
+    def _evict(self):
+        """Menghapus file tts_* paling lama dipakai jika jumlahnya melewati max_files."""
+        try:
+            entries = [
+                entry for entry in os.scandir(self.directory)
+                if entry.name.startswith("tts_") and entry.name.endswith(".mp3")
+            ]
+        except FileNotFoundError:
+            return
+        excess = len(entries) - self.max_files
+        if excess <= 0:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:excess]:
+            try:
+                os.remove(entry.path)
+                self.stats["evicted"] += 1
+            except OSError:
+                pass
@@ -0,0 +1,398 @@
+import argparse
+import csv
+import struct
+import sys
+import time
+from datetime import date
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# --- BULK INGESTION (COPY ... FROM STDIN) ---
+#
+# INSERT dengan literal teks vektor butuh parsing ~512 angka desimal per
+# embedding. COPY binary mengirim vektor dalam format vector_recv pgvector apa
+# adanya (float4 big-endian), satu stream untuk seluruh batch. Tabel dengan
+# kunci unik (centroid, running sum, interns) diisi lewat tabel staging
+# sementara lalu INSERT ... ON CONFLICT (upsert).
+#
+# CLI:
+#   python -m backend.bulk_copy export-embeddings --npy gallery.npy --manifest gallery.csv
+#   python -m backend.bulk_copy import-embeddings --npy gallery.npy --manifest gallery.csv [--replace]
+#   python -m backend.bulk_copy import-attendance --csv attendance.csv
+
+from backend.vector_codec import encode_vector_binary, vector_send_sql, decode_vector_matrix
+
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+PGCOPY_TRAILER = struct.pack(">h", -1)
+_NULL_FIELD = struct.pack(">i", -1)
+
+# Encoder nilai -> format biner (recv) PostgreSQL per tipe kolom
+_BINARY_ENCODERS: Dict[str, Callable[[object], bytes]] = {
+    "int2": lambda value: struct.pack(">h", value),
+    "int4": lambda value: struct.pack(">i", value),
+    "int8": lambda value: struct.pack(">q", value),
+    "float4": lambda value: struct.pack(">f", value),
+    "float8": lambda value: struct.pack(">d", value),
+    "text": lambda value: str(value).encode("utf-8"),
+    "bytea": bytes,
+    "vector": encode_vector_binary,
+}
+
+# Kolom (nama, tipe biner) yang diisi lewat COPY
+EMBEDDING_COPY_COLUMNS = (
+    ("intern_id", "int4"), ("name", "text"), ("instansi", "text"), ("kategori", "text"),
+    ("file_path", "text"), ("content_hash", "text"), ("file_mtime", "float8"), ("file_size", "int8"),
+    ("pipeline_version", "int2"), ("embedding", "vector"),
+)
+CENTROID_COPY_COLUMNS = (
+    ("intern_id", "int4"), ("name", "text"), ("instansi", "text"), ("kategori", "text"),
+    ("embedding", "vector"), ("match_threshold", "float4"),
+)
+CENTROID_SUM_COPY_COLUMNS = (("intern_id", "int4"), ("embedding_sum", "bytea"), ("embedding_count", "int4"))
+INTERN_COPY_COLUMNS = (("name", "text"), ("instansi", "text"), ("kategori", "text"))
+# Kolom CSV log absensi historis (header wajib; intern_name dan absent_at minimal)
+ATTENDANCE_CSV_COLUMNS = ("intern_name", "instansi", "kategori", "image_url", "absent_at", "type")
+
+
+def encode_binary_copy(rows: Iterable[Sequence], types: Sequence[str]) -> Iterator[bytes]:
+    """Stream format COPY binary PostgreSQL untuk baris bertipe `types` (None -> NULL)."""
+    encoders = [_BINARY_ENCODERS[t] for t in types]
+    field_count = struct.pack(">h", len(types))
+    yield PGCOPY_HEADER
+    for row in rows:
+        parts = [field_count]
+        for encode, value in zip(encoders, row):
+            if value is None:
+                parts.append(_NULL_FIELD)
+            else:
+                data = encode(value)
+                parts.append(struct.pack(">i", len(data)))
+                parts.append(data)
+        yield b"".join(parts)
+    yield PGCOPY_TRAILER
+
+
+class _ChunkStream:
+    """File-like (read) di atas iterator bytes, agar copy_expert tidak perlu menampung seluruh data."""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = chunks
+        self._buffer = b""
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def copy_binary(cursor, table: str, columns: Sequence[Tuple[str, str]], rows: Iterable[Sequence]) -> int:
+    """COPY table (kolom) FROM STDIN (FORMAT binary). Mengembalikan jumlah baris (tanpa commit)."""
+    count = 0
+
+    def counted():
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield row
+
+    names = ", ".join(name for name, _ in columns)
+    stream = _ChunkStream(encode_binary_copy(counted(), [type_name for _, type_name in columns]))
+    cursor.copy_expert(f"COPY {table} ({names}) FROM STDIN WITH (FORMAT binary)", stream)
+    return count
+
+
+def copy_upsert(cursor, table: str, columns: Sequence[Tuple[str, str]], rows: Iterable[Sequence], conflict: str,
+                keep_existing_on_null: bool = False, extra_updates: Sequence[str] = ()) -> int:
+    """
+    Upsert massal: COPY binary ke tabel staging sementara (tipe kolom sama dengan tabel
+    tujuan), lalu satu INSERT ... ON CONFLICT (conflict) DO UPDATE. Tanpa commit.
+    """
+    names = [name for name, _ in columns]
+    stage = f"_stage_{table}"
+    cursor.execute(f"DROP TABLE IF EXISTS {stage};")
+    cursor.execute(f"CREATE TEMP TABLE {stage} ON COMMIT DROP AS SELECT {', '.join(names)} FROM {table} WITH NO DATA;")
+    copy_binary(cursor, stage, columns, rows)
+
+    key_columns = {column.strip() for column in conflict.split(",")}
+    updates = [
+        f"{name} = COALESCE(EXCLUDED.{name}, {table}.{name})" if keep_existing_on_null else f"{name} = EXCLUDED.{name}"
+        for name in names if name not in key_columns
+    ] + list(extra_updates)
+    cursor.execute(f"""
+        INSERT INTO {table} ({', '.join(names)})
+        SELECT {', '.join(names)} FROM {stage}
+        ON CONFLICT ({conflict}) DO UPDATE SET {', '.join(updates)};
+    """)
+    return cursor.rowcount
+
+
+# --- EMBEDDING: EXPORT / IMPORT (.npy + manifest CSV) ---
+
+MANIFEST_COLUMNS = ("name", "instansi", "kategori", "file_path", "content_hash", "file_mtime", "file_size",
+                    "pipeline_version")
+
+
+def export_embeddings(conn, npy_path: Path, manifest_path: Path) -> int:
+    """Menulis semua intern_embeddings ke matriks float32 .npy + manifest CSV (baris ke-i = vektor ke-i)."""
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT i.name, i.instansi, i.kategori, e.file_path, e.content_hash, e.file_mtime, e.file_size,
+                   e.pipeline_version, {vector_send_sql('e.embedding')}
+            FROM intern_embeddings e
+            JOIN interns i ON i.id = e.intern_id
+            ORDER BY e.id
+        """)
+        rows = cursor.fetchall()
+    matrix = decode_vector_matrix([row[-1] for row in rows]) if rows else np.zeros((0, 0), dtype=np.float32)
+    np.save(npy_path, matrix)
+    with open(manifest_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(MANIFEST_COLUMNS)
+        writer.writerows(row[:-1] for row in rows)
+    return len(rows)
+
+
+def read_manifest(manifest_path: Path) -> List[dict]:
+    with open(manifest_path, newline="", encoding="utf-8") as f:
+        entries = list(csv.DictReader(f))
+    for number, entry in enumerate(entries, start=2):
+        if not (entry.get("name") or "").strip():
+            raise ValueError(f"Manifest baris {number}: kolom 'name' kosong.")
+    return entries
+
+
+def _optional(entry: dict, key: str, cast=str):
+    value = (entry.get(key) or "").strip()
+    return cast(value) if value else None
+
+
+def upsert_interns(cursor, entries: Sequence[dict]) -> Dict[str, int]:
+    """Mendaftarkan semua intern di manifest sekaligus. Mengembalikan {name: id}."""
+    interns = {}
+    for entry in entries:
+        interns.setdefault(entry["name"].strip(), (_optional(entry, "instansi"), _optional(entry, "kategori")))
+    copy_upsert(cursor, "interns", INTERN_COPY_COLUMNS,
+                ((name, instansi, kategori) for name, (instansi, kategori) in interns.items()),
+                conflict="name", keep_existing_on_null=True)
+    cursor.execute("SELECT name, id FROM interns WHERE name = ANY(%s)", (list(interns),))
+    return dict(cursor.fetchall())
+
+
+def rebuild_intern_centroids(cursor, intern_ids: Sequence[int],
+                             threshold_fn: Callable[[np.ndarray, np.ndarray], Optional[float]]) -> int:
+    """
+    Menghitung ulang running sum, centroid dan ambang adaptif banyak intern dari
+    intern_embeddings dalam satu query baca + dua COPY upsert (tanpa commit).
+    threshold_fn(embeddings, sum) -> ambang atau None.
+    """
+    cursor.execute(f"""
+        SELECT e.intern_id, i.name, i.instansi, i.kategori, {vector_send_sql('e.embedding')}
+        FROM intern_embeddings e
+        JOIN interns i ON i.id = e.intern_id
+        WHERE e.intern_id = ANY(%s)
+        ORDER BY e.intern_id
+    """, (list(intern_ids),))
+    rows = cursor.fetchall()
+    if not rows:
+        return 0
+    matrix = decode_vector_matrix([row[-1] for row in rows])
+    ids = np.array([row[0] for row in rows])
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    ends = np.r_[starts[1:], len(ids)]
+
+    sum_rows, centroid_rows = [], []
+    for start, end in zip(starts, ends):
+        intern_id, name, instansi, kategori, _ = rows[start]
+        embeddings = matrix[start:end]
+        embedding_sum = embeddings.astype(np.float64).sum(axis=0)
+        norm = np.linalg.norm(embedding_sum)
+        centroid = embedding_sum / norm if norm > 1e-6 else embedding_sum
+        sum_rows.append((intern_id, embedding_sum.tobytes(), int(end - start)))
+        centroid_rows.append((intern_id, name, instansi, kategori, centroid, threshold_fn(embeddings, embedding_sum)))
+
+    copy_upsert(cursor, "intern_centroid_sums", CENTROID_SUM_COPY_COLUMNS, sum_rows,
+                conflict="intern_id", extra_updates=("updated_at = NOW()",))
+    copy_upsert(cursor, "intern_centroids", CENTROID_COPY_COLUMNS, centroid_rows, conflict="intern_id")
+    return len(centroid_rows)
+
+
+def import_embeddings(conn, vectors: np.ndarray, entries: Sequence[dict], replace: bool,
+                      threshold_fn: Callable[[np.ndarray, np.ndarray], Optional[float]],
+                      project_root: Optional[Path] = None) -> Dict[str, int]:
+    """
+    Mengimpor embedding hasil export (.npy + manifest) dalam satu transaksi:
+    upsert interns -> COPY intern_embeddings -> rebuild centroid/running sum/ambang intern terdampak.
+    replace=True mengganti seluruh embedding intern yang ada di manifest (restore galeri);
+    tanpa replace, baris dengan (intern, file_path) yang sudah ada dilewati (import idempoten).
+    Manifest tanpa pipeline_version (ekspor lama) disimpan NULL: index_data.py meng-embed ulang file-nya.
+    """
+    if len(vectors) != len(entries):
+        raise ValueError(f"Jumlah vektor ({len(vectors)}) tidak sama dengan baris manifest ({len(entries)}).")
+    vectors = np.asarray(vectors, dtype=np.float32)
+    try:
+        with conn.cursor() as cursor:
+            intern_ids = upsert_interns(cursor, entries)
+            existing = set()
+            if replace:
+                cursor.execute("DELETE FROM intern_embeddings WHERE intern_id = ANY(%s)", (list(intern_ids.values()),))
+            else:
+                cursor.execute("SELECT intern_id, file_path FROM intern_embeddings WHERE intern_id = ANY(%s)",
+                               (list(intern_ids.values()),))
+                existing = set(cursor.fetchall())
+
+            rows, skipped, missing_files = [], 0, 0
+            for index, entry in enumerate(entries):
+                name = entry["name"].strip()
+                intern_id = intern_ids[name]
+                file_path = _optional(entry, "file_path") or f"import/{name}/{index}"
+                if (intern_id, file_path) in existing:
+                    skipped += 1
+                    continue
+                existing.add((intern_id, file_path))
+                if project_root is not None and not (project_root / file_path).exists():
+                    missing_files += 1
+                rows.append((intern_id, name, _optional(entry, "instansi"), _optional(entry, "kategori"), file_path,
+                             _optional(entry, "content_hash"), _optional(entry, "file_mtime", float),
+                             _optional(entry, "file_size", int), _optional(entry, "pipeline_version", int),
+                             vectors[index]))
+            inserted = copy_binary(cursor, "intern_embeddings", EMBEDDING_COPY_COLUMNS, rows)
+            centroids = rebuild_intern_centroids(cursor, list(intern_ids.values()), threshold_fn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {"interns": len(intern_ids), "inserted": inserted, "skipped": skipped,
+            "centroids": centroids, "missing_files": missing_files}
+
+
+# --- LOG ABSENSI HISTORIS (CSV) ---
+
+def import_attendance_csv(conn, csv_path: Path, today: Optional[date] = None) -> Tuple[int, int]:
+    """
+    Memuat log absensi historis dari CSV (header: subset ATTENDANCE_CSV_COLUMNS) dengan
+    COPY (FORMAT csv) ke tabel staging, lalu satu INSERT ke attendance_logs.
+    intern_id dicocokkan dari nama; spool_id deterministik (import:<md5>) membuat
+    import ulang file yang sama tidak menggandakan log. Mengembalikan (baris dibaca, baris baru).
+    """
+    from backend.attendance_schema import ATTENDANCE_TABLE, ensure_monthly_partitions, is_partitioned
+
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        header = [column.strip() for column in next(csv.reader([f.readline()]))]
+        unknown = [column for column in header if column not in ATTENDANCE_CSV_COLUMNS]
+        if unknown or "intern_name" not in header or "absent_at" not in header:
+            raise ValueError(f"Header CSV harus subset dari {ATTENDANCE_CSV_COLUMNS} dan memuat intern_name + absent_at "
+                             f"(tidak dikenal: {unknown}).")
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    CREATE TEMP TABLE _stage_attendance (
+                        intern_name TEXT, instansi TEXT, kategori TEXT, image_url TEXT,
+                        absent_at TIMESTAMP WITHOUT TIME ZONE, type TEXT
+                    ) ON COMMIT DROP;
+                """)
+                cursor.copy_expert(f"COPY _stage_attendance ({', '.join(header)}) FROM STDIN WITH (FORMAT csv)", f)
+                cursor.execute("SELECT COUNT(*) FROM _stage_attendance")
+                staged = cursor.fetchone()[0]
+
+                if is_partitioned(cursor):
+                    cursor.execute("SELECT MIN(absent_at) FROM _stage_attendance")
+                    oldest = cursor.fetchone()[0]
+                    cursor.execute("SAVEPOINT partitions")
+                    try:
+                        ensure_monthly_partitions(cursor, today or date.today(),
+                                                  first_month=oldest.date() if oldest else None)
+                        cursor.execute("RELEASE SAVEPOINT partitions")
+                    except Exception as e:
+                        # Partisi DEFAULT sudah berisi baris bulan tsb -> biarkan log masuk ke DEFAULT
+                        cursor.execute("ROLLBACK TO SAVEPOINT partitions")
+                        print(f"     ⚠️ Partisi bulanan historis tidak dibuat ({e}); log masuk partisi DEFAULT.")
+
+                cursor.execute(f"""
+                    INSERT INTO {ATTENDANCE_TABLE} (intern_id, intern_name, instansi, kategori, image_url, absent_at, type, spool_id)
+                    SELECT i.id, s.intern_name, COALESCE(s.instansi, i.instansi), COALESCE(s.kategori, i.kategori),
+                           s.image_url, s.absent_at, COALESCE(s.type, 'IN'),
+                           'import:' || md5(s.intern_name || '|' || s.absent_at::text || '|' || COALESCE(s.type, 'IN'))
+                    FROM _stage_attendance s
+                    LEFT JOIN interns i ON i.name = s.intern_name
+                    WHERE s.absent_at IS NOT NULL
+                    ON CONFLICT (spool_id, absent_at) DO NOTHING;
+                """)
+                inserted = cursor.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return staged, inserted
+
+
+if __name__ == "__main__":
+    # .env dimuat sebelum index_data membaca konfigurasi DB
+    from dotenv import load_dotenv
+    load_dotenv()
+    # Import berat (model/DeepFace lewat utils) hanya untuk CLI
+    from backend.index_data import PROJECT_ROOT, connect_db, ensure_index_schema, publish_gallery_snapshot
+    from backend.gallery import adaptive_threshold, spread_distances
+    from backend.utils import (DISTANCE_THRESHOLD, EMBEDDING_DIM, ADAPTIVE_THRESHOLD_PERCENTILE, ADAPTIVE_THRESHOLD_SLACK,
+                               ADAPTIVE_THRESHOLD_FLOOR, ADAPTIVE_THRESHOLD_MIN_SAMPLES)
+
+    def intern_threshold(embeddings, embedding_sum):
+        return adaptive_threshold(
+            spread_distances(embeddings, embedding_sum), ceiling=DISTANCE_THRESHOLD, floor=ADAPTIVE_THRESHOLD_FLOOR,
+            slack=ADAPTIVE_THRESHOLD_SLACK, percentile=ADAPTIVE_THRESHOLD_PERCENTILE,
+            min_samples=ADAPTIVE_THRESHOLD_MIN_SAMPLES,
+        )
+
+    parser = argparse.ArgumentParser(description="Bulk import/export embedding dan log absensi via COPY.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export-embeddings", help="Tulis intern_embeddings ke .npy + manifest CSV.")
+    export_parser.add_argument("--npy", type=Path, required=True)
+    export_parser.add_argument("--manifest", type=Path, required=True)
+    import_parser = commands.add_parser("import-embeddings", help="Muat .npy + manifest CSV ke intern_embeddings.")
+    import_parser.add_argument("--npy", type=Path, required=True)
+    import_parser.add_argument("--manifest", type=Path, required=True)
+    import_parser.add_argument("--replace", action="store_true",
+                               help="Ganti seluruh embedding intern yang ada di manifest (restore galeri).")
+    attendance_parser = commands.add_parser("import-attendance", help="Muat log absensi historis dari CSV.")
+    attendance_parser.add_argument("--csv", type=Path, required=True)
+    args = parser.parse_args()
+
+    conn = connect_db()
+    start = time.perf_counter()
+    try:
+        if args.command == "export-embeddings":
+            count = export_embeddings(conn, args.npy, args.manifest)
+            print(f"✅ {count} embedding diekspor ke {args.npy} + {args.manifest} ({time.perf_counter() - start:.1f}s).")
+        elif args.command == "import-embeddings":
+            ensure_index_schema(conn)
+            vectors = np.load(args.npy, mmap_mode="r")
+            if vectors.ndim != 2 or vectors.shape[1] != EMBEDDING_DIM:
+                print(f"❌ ERROR: Matriks {args.npy} berukuran {vectors.shape}, seharusnya (N, {EMBEDDING_DIM}).")
+                sys.exit(1)
+            result = import_embeddings(conn, vectors, read_manifest(args.manifest), args.replace,
+                                       intern_threshold, project_root=PROJECT_ROOT)
+            print(f"✅ {result['inserted']} embedding diimpor ({result['skipped']} sudah ada), "
+                  f"{result['centroids']} centroid dihitung ulang untuk {result['interns']} intern "
+                  f"({time.perf_counter() - start:.1f}s).")
+            if result["missing_files"]:
+                print(f"     ⚠️ {result['missing_files']} file_path tidak ada di disk: index_data.py akan menghapus "
+                      "embedding tersebut kecuali file gambarnya ikut disalin ke data/dataset.")
+            publish_gallery_snapshot(conn)
+            print("     -> API memuat snapshot baru otomatis (atau panggil POST /reload_db).")
+        else:
+            staged, inserted = import_attendance_csv(conn, args.csv)
+            print(f"✅ {inserted} dari {staged} log absensi diimpor ({staged - inserted} sudah ada/dilewati) "
+                  f"({time.perf_counter() - start:.1f}s).")
+    except Exception as e:
+        print(f"❌ ERROR FATAL: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
@@ -0,0 +1,204 @@
+import numpy as np
+import psycopg2
+
+from backend.utils import (EMBEDDING_DIM, DISTANCE_THRESHOLD, ADAPTIVE_THRESHOLD_PERCENTILE, ADAPTIVE_THRESHOLD_SLACK,
+                           ADAPTIVE_THRESHOLD_FLOOR, ADAPTIVE_THRESHOLD_MIN_SAMPLES)
+from backend.gallery import adaptive_threshold, spread_distances
+from backend.vector_codec import vector_send_sql, decode_vector_binary, decode_vector_matrix
+from backend.bulk_copy import copy_upsert
+
+# --- PENYIMPANAN EMBEDDING & CENTROID (DIPAKAI index_data.py DAN API) ---
+#
+# Fungsi yang sama dipakai indexing (CLI / job in-process) dan enrollment
+# /upload_dataset, sehingga centroid, running sum dan ambang adaptif selalu
+# dihitung dengan cara yang sama. Modul ini sengaja ringan: tidak memuat .env
+# dan tidak punya fallback konfigurasi, jadi aman diimpor oleh main.py.
+
+DB_TABLE_INTERNS = "interns"
+DB_TABLE_EMBEDDINGS = "intern_embeddings"
+DB_TABLE_CENTROIDS = "intern_centroids"
+DB_TABLE_CENTROID_SUMS = "intern_centroid_sums"
+# Kolom centroid yang ditulis store_centroid_state (match_threshold diatur terpisah)
+CENTROID_UPSERT_COLUMNS = (("intern_id", "int4"), ("name", "text"), ("instansi", "text"), ("kategori", "text"),
+                           ("embedding", "vector"))
+
+
+def get_existing_files(conn, intern_id: int) -> dict:
+    """
+    Mengambil semua file yang sudah di-index untuk intern tertentu:
+    {file_path: (id, content_hash, mtime, size, pipeline_version)}.
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            f"""SELECT file_path, id, content_hash, file_mtime, file_size, pipeline_version
+                FROM {DB_TABLE_EMBEDDINGS} WHERE intern_id = %s""",
+            (intern_id,)
+        )
+        return {row[0]: row[1:] for row in cur.fetchall()}
+    finally:
+        cur.close()
+
+def delete_embeddings(conn, embedding_ids: list) -> list:
+    """
+    Menghapus baris embedding berdasarkan id (tanpa commit).
+    Mengembalikan [(intern_id, vektor)] yang dihapus, untuk dikurangkan dari running sum centroid.
+    """
+    if not embedding_ids:
+        return []
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            f"DELETE FROM {DB_TABLE_EMBEDDINGS} WHERE id = ANY(%s) RETURNING intern_id, {vector_send_sql()}",
+            (list(embedding_ids),)
+        )
+        return [(intern_id, decode_vector_binary(raw)) for intern_id, raw in cur.fetchall()]
+    finally:
+        cur.close()
+
+
+# --- FUNGSI CENTROID (RUNNING SUM) ---
+#
+# Per intern disimpan jumlah (float64) seluruh embedding + jumlahnya. Centroid
+# ter-normalisasi = sum / ||sum|| (sama dengan mean / ||mean||), jadi menambah
+# atau menghapus satu embedding cukup O(dim) tanpa membaca ulang embedding lain.
+
+def normalize_centroid(embedding_sum: np.ndarray) -> np.ndarray:
+    """Normalisasi Centroid (penting untuk cosine distance)."""
+    norm = np.linalg.norm(embedding_sum)
+    if norm > 1e-6: # Hindari pembagian dengan nol
+        return embedding_sum / norm
+    print("     ⚠️ Peringatan: Centroid mendekati nol. Normalisasi dilewati.")
+    return embedding_sum
+
+def store_centroid_state(cur, intern_id: int, embedding_sum: np.ndarray, count: int):
+    """Menyimpan running sum + centroid ter-normalisasi (tanpa commit). count <= 0 menghapus keduanya."""
+    if count <= 0:
+        cur.execute(f"DELETE FROM {DB_TABLE_CENTROIDS} WHERE intern_id = %s", (intern_id,))
+        cur.execute(f"DELETE FROM {DB_TABLE_CENTROID_SUMS} WHERE intern_id = %s", (intern_id,))
+        return
+
+    embedding_sum = np.asarray(embedding_sum, dtype=np.float64)
+    cur.execute(
+        f"""
+        INSERT INTO {DB_TABLE_CENTROID_SUMS} (intern_id, embedding_sum, embedding_count, updated_at)
+        VALUES (%s, %s, %s, NOW())
+        ON CONFLICT (intern_id) DO UPDATE SET
+            embedding_sum = EXCLUDED.embedding_sum,
+            embedding_count = EXCLUDED.embedding_count,
+            updated_at = EXCLUDED.updated_at;
+        """,
+        (intern_id, psycopg2.Binary(embedding_sum.tobytes()), count)
+    )
+    # UPSERT Centroid ke Tabel intern_centroids (metadata diambil dari tabel interns).
+    # Vektor dikirim lewat COPY binary (format vector_recv), match_threshold tidak disentuh.
+    cur.execute(f"SELECT name, instansi, kategori FROM {DB_TABLE_INTERNS} WHERE id = %s", (intern_id,))
+    intern = cur.fetchone()
+    if intern is None:
+        return
+    copy_upsert(cur, DB_TABLE_CENTROIDS, CENTROID_UPSERT_COLUMNS,
+                [(intern_id, *intern, normalize_centroid(embedding_sum))], conflict="intern_id")
+
+def load_intern_embeddings(cur, intern_id: int) -> np.ndarray:
+    """Semua embedding satu intern sebagai matriks float32 (N x dim)."""
+    cur.execute(f"SELECT {vector_send_sql()} FROM {DB_TABLE_EMBEDDINGS} WHERE intern_id = %s", (intern_id,))
+    rows = [row[0] for row in cur.fetchall()]
+    if not rows:
+        return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+    # bytea biner pgvector -> matriks float32 (N x dim)
+    return decode_vector_matrix(rows)
+
+def store_intern_threshold(cur, intern_id: int, embeddings: np.ndarray, embedding_sum: np.ndarray):
+    """
+    Menyimpan ambang jarak adaptif intern (tanpa commit): persentil jarak setiap
+    embedding ke centroid-nya + slack, dibatasi [FLOOR, DISTANCE_THRESHOLD].
+    NULL jika foto terlalu sedikit (API memakai ambang global).
+    """
+    threshold = None
+    if len(embeddings):
+        threshold = adaptive_threshold(
+            spread_distances(embeddings, normalize_centroid(embedding_sum)),
+            ceiling=DISTANCE_THRESHOLD, floor=ADAPTIVE_THRESHOLD_FLOOR, slack=ADAPTIVE_THRESHOLD_SLACK,
+            percentile=ADAPTIVE_THRESHOLD_PERCENTILE, min_samples=ADAPTIVE_THRESHOLD_MIN_SAMPLES,
+        )
+    cur.execute(
+        f"UPDATE {DB_TABLE_CENTROIDS} SET match_threshold = %s WHERE intern_id = %s",
+        (threshold, intern_id)
+    )
+    return threshold
+
+def rebuild_centroid(conn, intern_id: int) -> tuple:
+    """Hitung ulang penuh centroid (+ ambang adaptif) satu intern dari semua embedding-nya (tanpa commit). Mengembalikan (count, sum)."""
+    cur = conn.cursor()
+    try:
+        embeddings = load_intern_embeddings(cur, intern_id)
+        embedding_sum = embeddings.astype(np.float64).sum(axis=0)
+        store_centroid_state(cur, intern_id, embedding_sum, len(embeddings))
+        if len(embeddings):
+            store_intern_threshold(cur, intern_id, embeddings, embedding_sum)
+        return len(embeddings), embedding_sum
+    finally:
+        cur.close()
+
+def update_centroid_incremental(conn, intern_id: int, added=None, removed=None, refresh_threshold: bool = False) -> int:
+    """
+    Memperbarui centroid dengan menambah/mengurangi vektor dari running sum (tanpa commit), O(dim).
+    Jika intern belum punya running sum (data lama), dihitung penuh sekali.
+    Ambang adaptif (butuh semua embedding intern) hanya dihitung ulang jika refresh_threshold
+    atau jumlah foto melewati ADAPTIVE_THRESHOLD_MIN_SAMPLES; indexing menghitungnya sekali
+    per intern di akhir run (refresh_intern_thresholds).
+    Mengembalikan jumlah embedding intern setelah perubahan.
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            f"SELECT embedding_sum, embedding_count FROM {DB_TABLE_CENTROID_SUMS} WHERE intern_id = %s FOR UPDATE",
+            (intern_id,)
+        )
+        row = cur.fetchone()
+        if row is None:
+            return rebuild_centroid(conn, intern_id)[0]
+
+        embedding_sum = np.frombuffer(row[0], dtype=np.float64).copy()
+        count = previous_count = row[1]
+        if added is not None and len(added):
+            embedding_sum += np.asarray(added, dtype=np.float64).sum(axis=0)
+            count += len(added)
+        if removed is not None and len(removed):
+            embedding_sum -= np.asarray(removed, dtype=np.float64).sum(axis=0)
+            count -= len(removed)
+        store_centroid_state(cur, intern_id, embedding_sum, count)
+        crossed = (previous_count >= ADAPTIVE_THRESHOLD_MIN_SAMPLES) != (count >= ADAPTIVE_THRESHOLD_MIN_SAMPLES)
+        if count > 0 and (refresh_threshold or crossed):
+            store_intern_threshold(cur, intern_id, load_intern_embeddings(cur, intern_id), embedding_sum)
+        return count
+    finally:
+        cur.close()
+
+def refresh_intern_thresholds(conn, intern_ids) -> int:
+    """
+    Menghitung ulang ambang adaptif banyak intern dalam satu query baca (tanpa commit).
+    Dipanggil sekali di akhir indexing untuk intern yang embedding-nya berubah.
+    Mengembalikan jumlah intern yang ambangnya diperbarui.
+    """
+    if not intern_ids:
+        return 0
+    cur = conn.cursor()
+    try:
+        cur.execute(f"""
+            SELECT intern_id, {vector_send_sql()} FROM {DB_TABLE_EMBEDDINGS}
+            WHERE intern_id = ANY(%s) ORDER BY intern_id
+        """, (list(intern_ids),))
+        rows = cur.fetchall()
+        if not rows:
+            return 0
+        matrix = decode_vector_matrix([row[1] for row in rows])
+        ids = np.array([row[0] for row in rows])
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        ends = np.r_[starts[1:], len(ids)]
+        for start, end in zip(starts, ends):
+            embeddings = matrix[start:end]
+            store_intern_threshold(cur, int(ids[start]), embeddings, embeddings.astype(np.float64).sum(axis=0))
+        return len(starts)
+    finally:
+        cur.close()
@@ -0,0 +1,236 @@
+import json
+import select
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+import psycopg2
+import psycopg2.extensions
+
+# --- KOORDINASI MULTI-WORKER (POSTGRES LISTEN/NOTIFY + ADVISORY LOCK) ---
+#
+# Dengan N worker gunicorn, setiap worker punya galeri in-memory (read-only,
+# berbagi page cache lewat snapshot memmap) dan state absensi hari ini sendiri.
+# Perubahan dikabarkan lewat NOTIFY:
+#   gallery_changed      trigger baris intern_centroids -> payload intern_id
+#   gallery_snapshot     versi snapshot galeri baru yang sudah dipasang di disk
+#   attendance_logged    log absensi yang baru ditulis (cek duplikat lintas worker)
+#   attendance_reset     reset absensi harian (payload JSON origin + cutoff WIB)
+#   indexing_cancel      permintaan batal untuk job indexing di worker lain
+# Setiap worker memegang satu koneksi LISTEN khusus. Koneksi yang sama dipakai
+# untuk pemilihan leader: worker yang memegang advisory lock LEADER menjalankan
+# job terjadwal (reset harian, partisi, pre-generate audio). Jika worker itu mati, koneksinya putus,
+# lock dilepas PostgreSQL dan worker lain mengambil alih.
+
+CHANNEL_GALLERY_CHANGED = "gallery_changed"
+CHANNEL_GALLERY_SNAPSHOT = "gallery_snapshot"
+CHANNEL_ATTENDANCE_LOGGED = "attendance_logged"
+CHANNEL_ATTENDANCE_RESET = "attendance_reset"
+CHANNEL_INDEXING_CANCEL = "indexing_cancel"
+
+# Kunci advisory lock (bigint) untuk seluruh aplikasi
+LOCK_SCHEMA = 7_301_001       # initialize_db: DDL startup diserialkan antar worker
+LOCK_LEADER = 7_301_002       # job terjadwal hanya di satu worker
+LOCK_INDEXING = 7_301_003     # maksimal satu job indexing di seluruh worker
+LOCK_SNAPSHOT_EXPORT = 7_301_004  # satu ekspor snapshot galeri sekaligus
+
+
+def notify(cursor, channel: str, payload: str = ""):
+    """NOTIFY transaksional: dikirim saat transaksi pemanggil di-commit (payload maks. ~8000 byte)."""
+    cursor.execute("SELECT pg_notify(%s, %s)", (channel, payload))
+
+
+def try_advisory_lock(cursor, key: int) -> bool:
+    """Advisory lock level sesi tanpa menunggu. Lepas dengan advisory_unlock atau saat koneksi ditutup."""
+    cursor.execute("SELECT pg_try_advisory_lock(%s)", (key,))
+    return bool(cursor.fetchone()[0])
+
+
+def advisory_unlock(cursor, key: int):
+    cursor.execute("SELECT pg_advisory_unlock(%s)", (key,))
+
+
+def advisory_lock_held(cursor, key: int) -> bool:
+    """True jika sesi mana pun sedang memegang advisory lock `key`."""
+    cursor.execute("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_locks
+            WHERE locktype = 'advisory' AND granted
+              AND objsubid = 1 AND ((classid::bigint << 32) | objid::bigint) = %s
+        )
+    """, (key,))
+    return bool(cursor.fetchone()[0])
+
+
+def ensure_gallery_notify_trigger(cursor):
+    """
+    Trigger baris pada intern_centroids: setiap perubahan centroid (indexing, enrollment,
+    hapus wajah, import bulk, termasuk dari CLI) mengirim NOTIFY gallery_changed <intern_id>.
+    NOTIFY dengan payload sama dalam satu transaksi digabung PostgreSQL.
+    """
+    cursor.execute(f"""
+        CREATE OR REPLACE FUNCTION notify_gallery_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('{CHANNEL_GALLERY_CHANGED}', COALESCE(NEW.intern_id, OLD.intern_id)::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    cursor.execute("DROP TRIGGER IF EXISTS intern_centroids_notify ON intern_centroids;")
+    cursor.execute("""
+        CREATE TRIGGER intern_centroids_notify
+        AFTER INSERT OR UPDATE OR DELETE ON intern_centroids
+        FOR EACH ROW EXECUTE FUNCTION notify_gallery_changed();
+    """)
+
+
+class ClusterListener:
+    """
+    Thread LISTEN per worker. Notifikasi dikumpulkan selama `debounce_ms` lalu
+    diserahkan per channel ke handler: handler(payloads) dengan payload urut commit.
+    Handler dipanggil dalam urutan pendaftaran di `handlers`.
+
+    `on_connect()` dipanggil setiap kali koneksi (ulang) tersambung: notifikasi selama
+    koneksi putus hilang, jadi pemanggil sebaiknya menyinkronkan ulang state-nya.
+    `on_leader(is_leader)` dipanggil saat worker ini menjadi / berhenti menjadi leader.
+    """
+
+    def __init__(self, connect: Callable[[], "psycopg2.extensions.connection"],
+                 handlers: Dict[str, Callable[[List[str]], None]],
+                 on_connect: Optional[Callable[[], None]] = None,
+                 on_leader: Optional[Callable[[bool], None]] = None,
+                 debounce_ms: float = 200, leader_retry_seconds: float = 10):
+        self.connect = connect
+        self.handlers = handlers
+        self.on_connect = on_connect
+        self.on_leader = on_leader
+        self.debounce = debounce_ms / 1000.0
+        self.leader_retry = leader_retry_seconds
+        self.is_leader = False
+        self.connected = False
+        self.stats = {"notifications": 0, "reconnects": 0, "handler_errors": 0}
+        self._stopping = threading.Event()
+        self._connected_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._conn = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="cluster-listener", daemon=True)
+            self._thread.start()
+
+    def wait_connected(self, timeout: float) -> bool:
+        """Menunggu LISTEN aktif (agar sinkronisasi awal tidak melewatkan notifikasi)."""
+        return self._connected_event.wait(timeout)
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._close()
+
+    def _open(self):
+        conn = self.connect()
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cursor:
+            for channel in self.handlers:
+                cursor.execute(f"LISTEN {channel};")
+        self._conn = conn
+        self.connected = True
+        self._connected_event.set()
+
+    def _close(self):
+        self.connected = False
+        self._connected_event.clear()
+        self._set_leader(False)
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _set_leader(self, is_leader: bool):
+        if is_leader == self.is_leader:
+            return
+        self.is_leader = is_leader
+        print(f"👑 [Cluster] Worker ini {'menjadi' if is_leader else 'berhenti menjadi'} leader job terjadwal.")
+        if self.on_leader is not None:
+            try:
+                self.on_leader(is_leader)
+            except Exception as e:
+                print(f"❌ [Cluster] Gagal memproses pergantian leader: {e}")
+
+    def _try_lead(self):
+        with self._conn.cursor() as cursor:
+            if try_advisory_lock(cursor, LOCK_LEADER):
+                self._set_leader(True)
+
+    def _drain(self) -> List[tuple]:
+        self._conn.poll()
+        notifies = [(n.channel, n.payload) for n in self._conn.notifies]
+        self._conn.notifies.clear()
+        return notifies
+
+    def _dispatch(self, notifies: Iterable[tuple]):
+        grouped: Dict[str, List[str]] = {}
+        for channel, payload in notifies:
+            grouped.setdefault(channel, []).append(payload)
+        # Urutan handler = urutan pendaftaran (misal: snapshot dipasang sebelum refresh per intern)
+        for channel in self.handlers:
+            payloads = grouped.get(channel)
+            if not payloads:
+                continue
+            self.stats["notifications"] += len(payloads)
+            try:
+                self.handlers[channel](payloads)
+            except Exception as e:
+                self.stats["handler_errors"] += 1
+                print(f"❌ [Cluster] Handler '{channel}' gagal: {e}")
+
+    def _run(self):
+        backoff = 1.0
+        next_lead_attempt = 0.0
+        while not self._stopping.is_set():
+            try:
+                if self._conn is None:
+                    self._open()
+                    backoff = 1.0
+                    if self.on_connect is not None:
+                        self.on_connect()
+                    next_lead_attempt = 0.0
+                if not self.is_leader and time.monotonic() >= next_lead_attempt:
+                    self._try_lead()
+                    next_lead_attempt = time.monotonic() + self.leader_retry
+
+                ready, _, _ = select.select([self._conn], [], [], 1.0)
+                if not ready:
+                    continue
+                notifies = self._drain()
+                # Kumpulkan notifikasi susulan (misal: indexing commit per orang) sebelum diproses
+                deadline = time.monotonic() + self.debounce
+                while (remaining := deadline - time.monotonic()) > 0:
+                    if select.select([self._conn], [], [], remaining)[0]:
+                        notifies.extend(self._drain())
+                self._dispatch(notifies)
+            except (psycopg2.Error, OSError) as e:
+                if self._stopping.is_set():
+                    break
+                self.stats["reconnects"] += 1
+                print(f"⚠️ [Cluster] Koneksi LISTEN terputus ({e}). Menyambung ulang dalam {backoff:.0f}s.")
+                self._close()
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+            except Exception as e:
+                print(f"❌ [Cluster] Error tak terduga di listener: {e}")
+                self._stopping.wait(1.0)
+        self._close()
+
+
+def encode_attendance_event(record: dict, origin: str) -> str:
+    """Payload NOTIFY attendance_logged dari record write-behind (tanpa gambar; absent_at ISO naive WIB)."""
+    return json.dumps({
+        "origin": origin, "name": record["intern_name"], "instansi": record["instansi"],
+        "kategori": record["kategori"], "type": record["type"], "absent_at": record["absent_at"],
+        "image_url": record["image_url"],
+    })
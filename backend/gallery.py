@@ -0,0 +1,324 @@
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+# --- FUNGSI NORMALISASI ---
+
+def l2_normalize(vectors) -> np.ndarray:
+    """
+    Normalisasi L2 untuk satu vektor (1D) atau matriks vektor (2D) dalam float32.
+    Vektor dengan norma mendekati nol dibiarkan apa adanya (hindari pembagian nol).
+    """
+    arr = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(arr, axis=-1, keepdims=True)
+    norms[norms < 1e-6] = 1.0
+    return arr / norms
+
+
+# --- PROTOTIPE PER INTERN (SPHERICAL K-MEANS) ---
+
+def compute_prototypes(embeddings, k: int, iterations: int = 10) -> np.ndarray:
+    """
+    Meringkas embedding satu intern menjadi maksimal k prototipe (spherical k-means).
+    Berguna jika foto enrollment sangat bervariasi (kacamata, pencahayaan),
+    di mana satu centroid rata-rata berada jauh dari semua foto aslinya.
+    Inisialisasi farthest-point sehingga hasilnya deterministik.
+    """
+    data = l2_normalize(embeddings)
+    if len(data) <= k:
+        return data
+
+    centers = [data[0]]
+    for _ in range(1, k):
+        sims = np.max(data @ np.stack(centers).T, axis=1)
+        centers.append(data[int(np.argmin(sims))])
+    centers = np.stack(centers)
+
+    for _ in range(iterations):
+        assignment = np.argmax(data @ centers.T, axis=1)
+        new_centers = centers.copy()
+        for c in range(k):
+            members = data[assignment == c]
+            if len(members):
+                new_centers[c] = members.sum(axis=0)
+        new_centers = l2_normalize(new_centers)
+        if np.allclose(new_centers, centers, atol=1e-6):
+            break
+        centers = new_centers
+    return centers
+
+def build_prototype_rows(rows: Iterable[tuple], k: int,
+                         threshold_fn: Optional[Callable[[np.ndarray], Optional[float]]] = None
+                         ) -> Tuple[List[tuple], Dict[int, float]]:
+    """
+    Mengelompokkan baris embedding (intern_id, name, instansi, kategori, embedding)
+    per intern lalu mengganti tiap kelompok dengan baris prototipenya.
+    Jika threshold_fn diberikan, ambang per intern dihitung dari jarak tiap
+    embedding ke prototipe terdekatnya. Mengembalikan (baris prototipe, {intern_id: ambang}).
+    """
+    grouped = {}
+    for intern_id, name, instansi, kategori, embedding in rows:
+        grouped.setdefault(intern_id, ((intern_id, name, instansi, kategori), []))[1].append(embedding)
+
+    prototype_rows, thresholds = [], {}
+    for meta, embeddings in grouped.values():
+        embeddings = np.stack(embeddings)
+        prototypes = compute_prototypes(embeddings, k)
+        for prototype in prototypes:
+            prototype_rows.append((*meta, prototype))
+        if threshold_fn is not None:
+            threshold = threshold_fn(spread_distances(embeddings, prototypes))
+            if threshold is not None:
+                thresholds[meta[0]] = threshold
+    return prototype_rows, thresholds
+
+
+# --- AMBANG ADAPTIF PER INTERN ---
+
+def spread_distances(embeddings, centers) -> np.ndarray:
+    """Cosine distance tiap embedding ke pusat terdekatnya (centroid atau prototipe)."""
+    data = l2_normalize(embeddings)
+    return 1.0 - np.max(data @ l2_normalize(np.atleast_2d(centers)).T, axis=1)
+
+def adaptive_threshold(distances, ceiling: float, floor: float, slack: float,
+                       percentile: float = 95, min_samples: int = 3) -> Optional[float]:
+    """
+    Ambang jarak untuk satu intern dari sebaran foto enrollment-nya: persentil
+    jarak + slack, dibatasi [floor, ceiling]. Intern dengan foto seragam mendapat
+    ambang ketat (wajah mirip orang lain lebih sulit lolos), intern dengan foto
+    bervariasi tetap memakai ambang mendekati global. None jika sampel terlalu sedikit.
+    """
+    distances = np.asarray(distances, dtype=np.float64)
+    if len(distances) < min_samples:
+        return None
+    value = float(np.percentile(distances, percentile)) + slack
+    return min(ceiling, max(floor, value))
+
+
+# --- INDEKS CENTROID IN-MEMORY ---
+
+class CentroidIndex:
+    """
+    Galeri centroid di memori proses API.
+
+    Semua centroid disimpan sebagai satu matriks float32 (N x dim) yang sudah
+    dinormalisasi L2, sehingga pencarian terdekat cukup satu perkalian
+    matriks-vektor: cosine distance = 1 - (M @ q). Hasilnya identik dengan
+    operator pgvector `<=>` tanpa perlu round-trip ke PostgreSQL.
+
+    Satu intern boleh memiliki lebih dari satu baris (mode prototipe); hasil
+    pencarian selalu baris terdekat.
+
+    Matriks dan metadata diganti sekaligus (swap referensi) saat reload,
+    sehingga pencarian yang sedang berjalan tidak pernah melihat state setengah jadi.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self._lock = threading.Lock()
+        # (matriks, metadata, baris maks per intern, ambang per intern) disimpan sebagai satu tuple agar swap-nya atomik
+        self._state: Tuple[np.ndarray, List[Tuple[int, str, str, str]], int, Dict[int, float]] = (
+            np.zeros((0, dim), dtype=np.float32), [], 1, {}
+        )
+        self.loaded_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._state[1])
+
+    @property
+    def intern_count(self) -> int:
+        """Jumlah intern unik di galeri (bisa lebih kecil dari len() pada mode prototipe)."""
+        return len({meta[0] for meta in self._state[1]})
+
+    def load(self, rows: Iterable[tuple], thresholds: Optional[Dict[int, float]] = None) -> int:
+        """
+        Memuat ulang galeri dari baris (intern_id, name, instansi, kategori, embedding)
+        beserta ambang jarak per intern (opsional). Mengembalikan jumlah centroid yang dimuat.
+        """
+        meta = []
+        vectors = []
+        for intern_id, name, instansi, kategori, embedding in rows:
+            if embedding is None or len(embedding) != self.dim:
+                print(f"   ⚠️ Centroid {name} dilewati (dimensi tidak valid).")
+                continue
+            meta.append((intern_id, name, instansi, kategori))
+            vectors.append(embedding)
+
+        if vectors:
+            matrix = l2_normalize(np.stack(vectors))
+        else:
+            matrix = np.zeros((0, self.dim), dtype=np.float32)
+        rows_per_intern = max(Counter(m[0] for m in meta).values(), default=1)
+
+        with self._lock:
+            self._state = (np.ascontiguousarray(matrix), meta, rows_per_intern, dict(thresholds or {}))
+            self.loaded_at = time.time()
+        return len(meta)
+
+    def load_matrix(self, matrix: np.ndarray, meta: List[tuple], thresholds: Optional[Dict[int, float]] = None) -> int:
+        """
+        Memuat galeri dari matriks yang sudah ter-normalisasi L2 (misal np.memmap snapshot)
+        tanpa menyalinnya. `meta` berisi (intern_id, name, instansi, kategori) per baris matriks.
+        """
+        if matrix.ndim != 2 or matrix.shape[1] != self.dim or len(matrix) != len(meta):
+            raise ValueError(f"Matriks galeri {matrix.shape} tidak cocok dengan {len(meta)} baris metadata / dim {self.dim}.")
+        meta = [tuple(m) for m in meta]
+        rows_per_intern = max(Counter(m[0] for m in meta).values(), default=1)
+        with self._lock:
+            self._state = (matrix, meta, rows_per_intern, dict(thresholds or {}))
+            self.loaded_at = time.time()
+        return len(meta)
+
+    def update_intern(self, intern_id: int, rows: Iterable[tuple], threshold: Optional[float] = None) -> int:
+        """
+        Mengganti baris satu intern saja (enrollment / hapus) tanpa memuat ulang seluruh galeri.
+        `rows` berformat sama dengan load(); kosong berarti intern dihapus dari galeri.
+        Mengembalikan jumlah baris intern tersebut setelah pembaruan.
+        """
+        new_meta, new_vectors = [], []
+        for row_intern_id, name, instansi, kategori, embedding in rows:
+            if embedding is None or len(embedding) != self.dim:
+                print(f"   ⚠️ Centroid {name} dilewati (dimensi tidak valid).")
+                continue
+            new_meta.append((row_intern_id, name, instansi, kategori))
+            new_vectors.append(embedding)
+
+        with self._lock:
+            matrix, meta, _, thresholds = self._state
+            keep = [i for i, m in enumerate(meta) if m[0] != intern_id]
+            meta = [meta[i] for i in keep] + new_meta
+            parts = [matrix[keep]]
+            if new_vectors:
+                parts.append(l2_normalize(np.stack(new_vectors)))
+            thresholds = dict(thresholds)
+            thresholds.pop(intern_id, None)
+            if threshold is not None and new_meta:
+                thresholds[intern_id] = threshold
+            rows_per_intern = max(Counter(m[0] for m in meta).values(), default=1)
+            self._state = (np.ascontiguousarray(np.concatenate(parts, axis=0)), meta, rows_per_intern, thresholds)
+        return len(new_meta)
+
+    def search_topk(self, embedding, k: int) -> List[Tuple[int, str, str, str, float]]:
+        """
+        k intern terdekat (unik per intern) untuk satu embedding, urut jarak naik:
+        [(intern_id, name, instansi, kategori, distance), ...].
+        """
+        matrix, meta, rows_per_intern, _ = self._state
+        if not meta:
+            return []
+
+        similarities = matrix @ l2_normalize(embedding)
+        # Kandidat cukup k * baris-per-intern teratas agar k intern unik pasti tercakup
+        candidates = min(len(meta), k * rows_per_intern)
+        top = np.argpartition(-similarities, candidates - 1)[:candidates]
+        top = top[np.argsort(-similarities[top])]
+
+        results, seen = [], set()
+        for row in top:
+            intern_id, name, instansi, kategori = meta[row]
+            if intern_id in seen:
+                continue
+            seen.add(intern_id)
+            results.append((intern_id, name, instansi, kategori, float(1.0 - similarities[row])))
+            if len(results) == k:
+                break
+        return results
+
+    def threshold_for(self, intern_id: int, default: float) -> float:
+        """Ambang jarak intern (tidak pernah lebih longgar dari ambang global `default`)."""
+        return min(default, self._state[3].get(intern_id, default))
+
+    @property
+    def adaptive_count(self) -> int:
+        """Jumlah intern yang memiliki ambang adaptif."""
+        return len(self._state[3])
+
+    def search(self, embedding) -> Optional[Tuple[str, str, str, float]]:
+        """
+        Mencari centroid terdekat untuk satu embedding.
+        Mengembalikan (name, instansi, kategori, distance) atau None jika galeri kosong.
+        """
+        best = self.search_topk(embedding, 1)
+        if not best:
+            return None
+        _, name, instansi, kategori, distance = best[0]
+        return name, instansi, kategori, distance
+
+
+# --- FUSI MULTI-FRAME ---
+
+def match_margin(topk: Sequence[tuple]) -> Optional[float]:
+    """Selisih jarak runner-up dan kandidat terbaik (None jika hanya ada satu kandidat)."""
+    if len(topk) < 2:
+        return None
+    return topk[1][-1] - topk[0][-1]
+
+def reject_reason(topk: Sequence[tuple], threshold: float, margin: float) -> Optional[str]:
+    """
+    Keputusan open-set untuk kandidat terbaik. None jika diterima, atau alasan penolakan:
+    "empty" (galeri kosong), "distance" (melewati ambang), "ambiguous" (terlalu dekat dengan runner-up).
+    """
+    if not topk:
+        return "empty"
+    if topk[0][-1] > threshold:
+        return "distance"
+    gap = match_margin(topk)
+    if gap is not None and gap < margin:
+        return "ambiguous"
+    return None
+
+def is_confident(topk: Sequence[tuple], threshold: float, margin: float) -> bool:
+    """Kandidat terbaik lolos ambang jarak DAN cukup jauh dari runner-up."""
+    return reject_reason(topk, threshold, margin) is None
+
+def vote_topk(per_frame: List[List[tuple]]) -> List[tuple]:
+    """
+    Fusi berbasis voting: urutkan intern menurut jumlah frame yang memilihnya
+    sebagai kandidat terbaik, lalu rata-rata jarak di semua frame (jarak 1.0 jika
+    intern tidak muncul di top-k frame tersebut).
+    """
+    frames = [frame for frame in per_frame if frame]
+    if not frames:
+        return []
+    votes = Counter(frame[0][0] for frame in frames)
+    distances, meta = defaultdict(list), {}
+    for frame in frames:
+        for entry in frame:
+            distances[entry[0]].append(entry[-1])
+            meta[entry[0]] = entry[:-1]
+
+    def mean_distance(intern_id):
+        found = distances[intern_id]
+        return (sum(found) + (len(frames) - len(found)) * 1.0) / len(frames)
+
+    ranked = sorted(meta, key=lambda intern_id: (-votes.get(intern_id, 0), mean_distance(intern_id)))
+    return [(*meta[intern_id], mean_distance(intern_id)) for intern_id in ranked]
+
+def fuse_matches(search: Callable[[np.ndarray, int], List[tuple]], embeddings: Sequence, k: int,
+                 confident: Callable[[List[tuple]], bool], method: str = "mean") -> Tuple[List[tuple], int]:
+    """
+    Menggabungkan embedding beberapa frame (urut waktu) terhadap galeri.
+    Setelah setiap frame tambahan, hasil fusi dievaluasi; berhenti lebih awal begitu
+    confident(top-k) bernilai True. Mengembalikan (top-k hasil fusi, frame terpakai).
+
+    method "mean": rata-rata embedding ter-normalisasi -> satu pencarian.
+    method "vote": pencarian per frame -> voting (lihat vote_topk).
+    """
+    if len(embeddings) == 0:
+        return [], 0
+    normalized = l2_normalize(np.stack([np.asarray(e, dtype=np.float32) for e in embeddings]))
+    per_frame = []
+    topk: List[tuple] = []
+    for used in range(1, len(normalized) + 1):
+        if method == "vote":
+            per_frame.append(search(normalized[used - 1], k))
+            topk = vote_topk(per_frame)[:k]
+        else:
+            topk = search(l2_normalize(normalized[:used].mean(axis=0)), k)
+        if confident(topk):
+            return topk, used
+    return topk, len(normalized)
@@ -0,0 +1,232 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import psycopg2
+
+from backend.cluster_events import CHANNEL_GALLERY_SNAPSHOT, LOCK_SNAPSHOT_EXPORT, advisory_unlock, notify
+from backend.gallery import l2_normalize
+from backend.vector_codec import decode_vector_matrix, vector_send_sql
+
+# --- SNAPSHOT GALERI DI DISK (np.memmap) ---
+#
+# Setiap proses API dulu harus menarik semua vektor dari PostgreSQL saat startup.
+# Setelah indexing, galeri ditulis ke folder snapshot sebagai file berversi:
+#   gallery_<versi>_centroids.npy   matriks float32 ter-normalisasi L2 (N x dim)
+#   gallery_<versi>_embeddings.npy  matriks float32 ter-normalisasi L2 (M x dim)
+#   gallery_<versi>.json            tabel id/nama per baris + ambang adaptif + sidik DB
+#   CURRENT.json                    penunjuk versi aktif (diganti via rename atomik)
+#
+# API membuka matriks dengan np.memmap (mmap_mode="r"): beberapa worker uvicorn
+# berbagi page cache yang sama, startup hampir instan, dan galeri tetap tersedia
+# saat DB sebentar tidak bisa diakses. File versi lama tidak pernah ditimpa.
+# Versi baru diumumkan ke semua worker lewat NOTIFY gallery_snapshot <versi>.
+#
+# Ekspor dari semua worker API dan CLI (index_data, bulk_copy) diserialkan dengan
+# advisory lock SNAPSHOT_EXPORT. Penunjuk CURRENT tidak pernah dimundurkan ke
+# snapshot yang datanya dibaca lebih awal dari snapshot aktif.
+
+GALLERY_SNAPSHOT_DIR = Path(os.getenv("GALLERY_SNAPSHOT_DIR", str(Path(__file__).resolve().parent / "snapshots")))
+SNAPSHOT_POINTER = "CURRENT.json"
+SNAPSHOT_KEEP_VERSIONS = int(os.getenv("GALLERY_SNAPSHOT_KEEP", "3")) # Versi lama yang disimpan (rollback manual)
+
+
+class GallerySnapshot:
+    """Satu versi snapshot yang sudah dibuka (matriks berupa memmap read-only)."""
+
+    def __init__(self, version: str, fingerprint: Optional[str],
+                 centroids: np.ndarray, centroid_meta: List[tuple], thresholds: Dict[int, float],
+                 embeddings: np.ndarray, embedding_meta: List[tuple]):
+        self.version = version
+        self.fingerprint = fingerprint
+        self.centroids = centroids
+        self.centroid_meta = centroid_meta
+        self.thresholds = thresholds
+        self.embeddings = embeddings
+        self.embedding_meta = embedding_meta
+
+
+def gallery_fingerprint(cursor) -> str:
+    """
+    Sidik murah isi galeri di DB: setiap perubahan centroid (indexing, enrollment,
+    hapus wajah) mengubah jumlah baris atau updated_at di intern_centroid_sums.
+    """
+    cursor.execute("SELECT COUNT(*), COALESCE(SUM(embedding_count), 0), MAX(updated_at) FROM intern_centroid_sums")
+    interns, embeddings, updated_at = cursor.fetchone()
+    return f"{interns}:{embeddings}:{updated_at.isoformat() if updated_at else '-'}"
+
+
+def _atomic_write_json(path: Path, payload: dict):
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, path)
+
+
+def _atomic_save_npy(path: Path, matrix: np.ndarray):
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.ascontiguousarray(matrix, dtype=np.float32))
+    os.replace(tmp_path, path)
+
+
+def _fetch_matrix(cursor, query: str, dim: int) -> Tuple[np.ndarray, List[tuple]]:
+    cursor.execute(query)
+    rows = cursor.fetchall()
+    if not rows:
+        return np.zeros((0, dim), dtype=np.float32), []
+    return l2_normalize(decode_vector_matrix([row[-1] for row in rows])), [tuple(row[:-1]) for row in rows]
+
+
+def export_snapshot(conn, dim: int, directory: Path = GALLERY_SNAPSHOT_DIR, keep: int = SNAPSHOT_KEEP_VERSIONS,
+                    force: bool = True) -> str:
+    """
+    Menulis snapshot baru (centroid + embedding) dari DB lalu menjadikannya versi aktif.
+    Memegang advisory lock SNAPSHOT_EXPORT (menunggu ekspor proses lain selesai).
+    force=False: jika sidik snapshot aktif sudah sama dengan DB, versi aktif dipakai ulang.
+    Mengembalikan versi snapshot yang aktif setelah ekspor.
+    """
+    directory = Path(directory)
+    os.makedirs(directory, exist_ok=True)
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(%s)", (LOCK_SNAPSHOT_EXPORT,))
+    conn.commit()
+    try:
+        return _export_locked(conn, dim, directory, keep, force)
+    finally:
+        try:
+            conn.rollback()
+            with conn.cursor() as cursor:
+                advisory_unlock(cursor, LOCK_SNAPSHOT_EXPORT)
+            conn.commit()
+        except psycopg2.Error:
+            pass  # Koneksi putus: lock sesi ikut lepas
+
+
+def _export_locked(conn, dim: int, directory: Path, keep: int, force: bool) -> str:
+    """
+    Isi export_snapshot (lock sudah dipegang). Sidik dibaca lebih dulu: jika galeri berubah
+    selama ekspor, sidik snapshot tertinggal dan perbandingan berikutnya memicu ekspor ulang.
+    """
+    current, current_meta = _current_meta(directory)
+    with conn.cursor() as cursor:
+        # Waktu baca DB (bukan nama versi) menentukan snapshot mana yang lebih baru
+        cursor.execute("SELECT EXTRACT(EPOCH FROM clock_timestamp())")
+        read_at = float(cursor.fetchone()[0])
+        fingerprint = gallery_fingerprint(cursor)
+        if not force and current_meta is not None and current_meta.get("fingerprint") == fingerprint:
+            conn.commit()
+            return current
+        centroids, centroid_rows = _fetch_matrix(cursor, f"""
+            SELECT intern_id, name, instansi, kategori, match_threshold, {vector_send_sql()}
+            FROM intern_centroids ORDER BY intern_id
+        """, dim)
+        embeddings, embedding_meta = _fetch_matrix(cursor, f"""
+            SELECT e.intern_id, i.name, i.instansi, i.kategori, {vector_send_sql('e.embedding')}
+            FROM intern_embeddings e
+            JOIN interns i ON i.id = e.intern_id
+            ORDER BY e.intern_id, e.id
+        """, dim)
+    conn.commit()
+
+    # Versi urut waktu (mikrodetik) + PID: unik meski beberapa proses mengekspor bersamaan
+    now = time.time()
+    version = time.strftime("%Y%m%d%H%M%S", time.localtime(now)) + f"{int(now * 1e6) % 1000000:06d}-{os.getpid()}"
+    _atomic_save_npy(directory / f"gallery_{version}_centroids.npy", centroids)
+    _atomic_save_npy(directory / f"gallery_{version}_embeddings.npy", embeddings)
+    _atomic_write_json(directory / f"gallery_{version}.json", {
+        "version": version,
+        "created_at": time.time(),
+        "read_at": read_at,
+        "fingerprint": fingerprint,
+        "dim": dim,
+        "centroids": [list(row[:4]) for row in centroid_rows],
+        "thresholds": {str(row[0]): float(row[4]) for row in centroid_rows if row[4] is not None},
+        "embeddings": [list(row) for row in embedding_meta],
+    })
+    # Jangan mundur: snapshot aktif membaca DB lebih baru (misal: ditulis proses tanpa lock)
+    if current_meta is not None and current_meta.get("read_at", 0) > read_at:
+        print(f"⚠️ Snapshot {version} lebih lama dari versi aktif {current}; penunjuk tidak diubah.")
+        _remove_version(directory, version)
+        return current
+    # Rename atomik penunjuk: pembaca selalu melihat versi lama utuh atau versi baru utuh
+    _atomic_write_json(directory / SNAPSHOT_POINTER, {"version": version})
+    _remove_old_versions(directory, keep)
+    with conn.cursor() as cursor:
+        notify(cursor, CHANNEL_GALLERY_SNAPSHOT, version)
+    conn.commit()
+    return version
+
+
+def _remove_version(directory: Path, version: str):
+    for suffix in (".json", "_centroids.npy", "_embeddings.npy"):
+        try:
+            os.remove(directory / f"gallery_{version}{suffix}")
+        except OSError:
+            pass
+
+
+def _remove_old_versions(directory: Path, keep: int):
+    """
+    Menghapus versi lama selain `keep` terbaru; versi yang ditunjuk CURRENT tidak pernah dihapus
+    (proses yang masih me-memmap file lama tetap aman: inode baru dilepas setelah unmap).
+    """
+    current = current_version(directory)
+    versions = sorted(path.stem[len("gallery_"):] for path in directory.glob("gallery_*.json"))
+    for version in versions[:-keep] if keep > 0 else []:
+        if version != current:
+            _remove_version(directory, version)
+
+
+def current_version(directory: Path = GALLERY_SNAPSHOT_DIR) -> Optional[str]:
+    """Versi aktif menurut penunjuk CURRENT.json (None jika belum ada snapshot)."""
+    try:
+        with open(Path(directory) / SNAPSHOT_POINTER, encoding="utf-8") as f:
+            return json.load(f)["version"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _current_meta(directory: Path) -> Tuple[Optional[str], Optional[dict]]:
+    """(versi, metadata JSON) snapshot aktif; (None, None) jika belum ada / rusak."""
+    version = current_version(directory)
+    if version is None:
+        return None, None
+    try:
+        with open(Path(directory) / f"gallery_{version}.json", encoding="utf-8") as f:
+            return version, json.load(f)
+    except (OSError, ValueError):
+        return None, None
+
+
+def current_fingerprint(directory: Path = GALLERY_SNAPSHOT_DIR) -> Tuple[Optional[str], Optional[str]]:
+    """(versi, sidik DB) snapshot aktif tanpa membuka matriksnya; (None, None) jika belum ada."""
+    version, meta = _current_meta(directory)
+    return version, meta.get("fingerprint") if meta is not None else None
+
+
+def load_snapshot(dim: int, directory: Path = GALLERY_SNAPSHOT_DIR) -> Optional[GallerySnapshot]:
+    """Membuka snapshot aktif dengan memmap. None jika tidak ada / tidak cocok dengan dim."""
+    directory = Path(directory)
+    version = current_version(directory)
+    if version is None:
+        return None
+    with open(directory / f"gallery_{version}.json", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta["dim"] != dim:
+        print(f"⚠️ Snapshot galeri {version} berdimensi {meta['dim']}, bukan {dim}. Diabaikan.")
+        return None
+    centroids = np.load(directory / f"gallery_{version}_centroids.npy", mmap_mode="r")
+    embeddings = np.load(directory / f"gallery_{version}_embeddings.npy", mmap_mode="r")
+    return GallerySnapshot(
+        version=version,
+        fingerprint=meta.get("fingerprint"),
+        centroids=centroids,
+        centroid_meta=[tuple(row) for row in meta["centroids"]],
+        thresholds={int(intern_id): threshold for intern_id, threshold in meta["thresholds"].items()},
+        embeddings=embeddings,
+        embedding_meta=[tuple(row) for row in meta["embeddings"]],
+    )
@@ -0,0 +1,22 @@
+import multiprocessing
+import os
+
+# --- KONFIGURASI GUNICORN (MULTI-WORKER) ---
+#
+#   gunicorn -c backend/gunicorn_conf.py backend.main:app
+#
+# Setiap worker adalah proses uvicorn terpisah dengan model, galeri (snapshot memmap,
+# page cache dibagi antar worker) dan executor inferensi sendiri. Koordinasi antar
+# worker lewat PostgreSQL LISTEN/NOTIFY (backend/cluster_events.py).
+# Total thread inferensi = WEB_CONCURRENCY x INFERENCE_WORKERS; sesuaikan dengan jumlah core.
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(max(1, multiprocessing.cpu_count() // 2))))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Startup worker (retry DB, sinkron galeri, muat model) bisa lebih lama dari default 30 detik
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+# Tanpa preload: model TensorFlow/ONNX tidak aman di-fork setelah dimuat
+preload_app = False
+accesslog = "-"
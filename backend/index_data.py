@@ -1,17 +1,21 @@
 import os
 import csv
 import sys
+import time
+import hashlib
+import argparse
+import multiprocessing
 from pathlib import Path
-from deepface import DeepFace
 import numpy as np
 import psycopg2
-import psycopg2.extensions
 from dotenv import load_dotenv # <-- TAMBAHAN
 
 # --- Muat environment variables dari .env file ---
 # Ini harus dipanggil sebelum mengakses os.getenv()
 # Sesuai dengan 'python-dotenv' di requirements.txt
-load_dotenv() 
+# Hanya saat dijalankan sebagai CLI: API (main.py) sengaja tidak memuat .env
+if __name__ == "__main__":
+    load_dotenv()
 # --------------------------------------------------
 
 # --- KONFIGURASI DAN IMPORT DENGAN KOREKSI PATH ---
@@ -23,9 +27,20 @@ try:
     sys.path.insert(0, str(PROJECT_ROOT))
 
     # 3. Sekarang import absolut 'backend.utils' akan berhasil
-    from backend.utils import MODEL_NAME, EMBEDDING_DIM
+    from backend.utils import MODEL_NAME, EMBEDDING_DIM, PREPROCESS_PIPELINE_VERSION, get_target_size, preprocess_face_file, embed_face_batch
+    from backend.utils import ADAPTIVE_THRESHOLD_MIN_SAMPLES
+    from backend.indexing_jobs import IndexingBusyError, IndexingCancelled, IndexingProgress
+    from backend.cluster_events import LOCK_INDEXING, try_advisory_lock
+    from backend.bulk_copy import EMBEDDING_COPY_COLUMNS, copy_binary
+    from backend.gallery_snapshot import export_snapshot
+    # Centroid incremental + sidik file: modul bersama dengan enrollment di API
+    from backend.centroid_store import (DB_TABLE_INTERNS, DB_TABLE_EMBEDDINGS, DB_TABLE_CENTROIDS, DB_TABLE_CENTROID_SUMS,
+                                        get_existing_files, delete_embeddings, rebuild_centroid,
+                                        update_centroid_incremental, refresh_intern_thresholds)
 
 except ImportError as e:
+    if __name__ != "__main__":
+        raise  # Diimpor API / CLI lain: jangan diam-diam memakai model fallback
     print(f"❌ FATAL ERROR: Gagal mengimpor utilitas atau menentukan root: {e}")
     MODEL_NAME = "VGG-Face"
     EMBEDDING_DIM = 512 # Pastikan ini sesuai dengan model Anda
@@ -52,15 +67,12 @@ DB_USER = os.getenv("DB_USER", "macbookpro")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "deepfacepass")
 # --------------------------------------------------------
 
-DB_TABLE_INTERNS = "interns"
-DB_TABLE_EMBEDDINGS = "intern_embeddings"
-DB_TABLE_CENTROIDS = "intern_centroids"
 
 
 # --- FUNGSI UTILITY DATABASE ---
 
 def connect_db():
-    """Membuat koneksi ke Database dan mendaftarkan tipe data vector untuk NumPy."""
+    """Membuat koneksi ke Database (kolom vector dibaca via vector_send, ditulis via COPY binary)."""
     try:
         conn = psycopg2.connect(
             host=DB_HOST,
@@ -69,26 +81,6 @@ def connect_db():
             password=DB_PASSWORD,
             port=DB_PORT
         )
-        try:
-            # Daftarkan pgvector extension untuk psycopg2
-            with conn.cursor() as cur:
-                cur.execute("SELECT oid FROM pg_type WHERE typname = 'vector'")
-                vector_oid = cur.fetchone()[0]
-
-            def cast_vector(data, cur):
-                if data is None: return None
-                # Bersihkan kurung [] atau {} yang mungkin ada
-                cleaned_data = data.strip('{}[]')
-                return np.array([float(x.strip()) for x in cleaned_data.split(',')])
-
-            psycopg2.extensions.register_type(
-                psycopg2.extensions.new_type((vector_oid,), 'vector', cast_vector),
-                conn
-            )
-        except Exception as e:
-            print(f"     ⚠️ PERINGATAN: Gagal mendaftarkan tipe vector. Error: {e}")
-            print("     -> Pastikan ekstensi 'vector' sudah di-CREATE di database.")
-
         return conn
     except psycopg2.Error as e:
         print(f"❌ ERROR: Gagal koneksi ke Database: {e}")
@@ -111,6 +103,11 @@ def upsert_intern_and_get_id(conn, name: str, instansi: str, kategori: str) -> i
             (name, instansi, kategori)
         )
         intern_id = cur.fetchone()[0]
+        # Centroid tidak lagi dihitung ulang setiap run, jadi metadatanya disinkronkan di sini
+        cur.execute(
+            f"UPDATE {DB_TABLE_CENTROIDS} SET instansi = %s, kategori = %s WHERE intern_id = %s",
+            (instansi, kategori, intern_id)
+        )
         conn.commit() # Commit setelah UPSERT berhasil
         return intern_id
     except Exception as e:
@@ -142,38 +139,160 @@ def load_master_data():
         print(f"❌ ERROR: Gagal memproses CSV: {e}")
         sys.exit(1)
 
-def get_existing_file_paths(conn, intern_id: int) -> set:
-    """Mengambil semua path file yang sudah di-index untuk intern tertentu."""
+def ensure_index_schema(conn):
+    """
+    Migrasi ringan untuk indexing incremental:
+    - kolom sidik file (hash konten, mtime, ukuran) + versi pipeline di intern_embeddings
+    - tabel intern_centroid_sums (jumlah berjalan + count per intern)
+    - kolom match_threshold (ambang jarak adaptif) di intern_centroids
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute(f"""
+            ALTER TABLE {DB_TABLE_EMBEDDINGS}
+                ADD COLUMN IF NOT EXISTS content_hash TEXT,
+                ADD COLUMN IF NOT EXISTS file_mtime DOUBLE PRECISION,
+                ADD COLUMN IF NOT EXISTS file_size BIGINT,
+                ADD COLUMN IF NOT EXISTS pipeline_version SMALLINT;
+        """)
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {DB_TABLE_CENTROID_SUMS} (
+                intern_id INTEGER PRIMARY KEY REFERENCES {DB_TABLE_INTERNS}(id) ON DELETE CASCADE,
+                embedding_sum BYTEA NOT NULL,
+                embedding_count INTEGER NOT NULL,
+                updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+            );
+        """)
+        cur.execute(f"ALTER TABLE {DB_TABLE_CENTROIDS} ADD COLUMN IF NOT EXISTS match_threshold REAL;")
+        conn.commit()
+    finally:
+        cur.close()
+
+def hash_file(path) -> str:
+    """SHA-256 isi file (dibaca per blok)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def get_interns_missing_centroid(conn) -> set:
+    """Intern yang punya embedding tapi belum punya centroid (misal: run sebelumnya terhenti)."""
     cur = conn.cursor()
     try:
-        cur.execute(f"SELECT file_path FROM {DB_TABLE_EMBEDDINGS} WHERE intern_id = %s", (intern_id,))
+        cur.execute(f"""
+            SELECT DISTINCT e.intern_id FROM {DB_TABLE_EMBEDDINGS} e
+            LEFT JOIN {DB_TABLE_CENTROIDS} c ON c.intern_id = e.intern_id
+            WHERE c.intern_id IS NULL
+        """)
         return {row[0] for row in cur.fetchall()}
     finally:
         cur.close()
 
+def get_interns_missing_threshold(conn) -> set:
+    """Intern dengan centroid tanpa ambang adaptif dan foto yang cukup (data sebelum migrasi)."""
+    cur = conn.cursor()
+    try:
+        cur.execute(f"""
+            SELECT c.intern_id FROM {DB_TABLE_CENTROIDS} c
+            JOIN {DB_TABLE_CENTROID_SUMS} s ON s.intern_id = c.intern_id
+            WHERE c.match_threshold IS NULL AND s.embedding_count >= %s
+        """, (ADAPTIVE_THRESHOLD_MIN_SAMPLES,))
+        return {row[0] for row in cur.fetchall()}
+    finally:
+        cur.close()
+
+def publish_gallery_snapshot(conn):
+    """Menulis snapshot galeri berversi (centroid + embedding) untuk di-memmap API. Gagal = hanya peringatan."""
+    try:
+        start = time.perf_counter()
+        version = export_snapshot(conn, EMBEDDING_DIM)
+        print(f"📦 Snapshot galeri {version} ditulis ({time.perf_counter() - start:.2f}s).")
+    except Exception as e:
+        conn.rollback()
+        print(f"⚠️ Gagal menulis snapshot galeri (API akan memuat dari DB): {e}")
+
+def remove_orphan_embeddings(conn, skip_intern_ids: set) -> set:
+    """
+    Menghapus embedding milik intern yang foldernya tidak dipindai lagi
+    (folder dihapus) dan file-nya sudah tidak ada di disk.
+    Mengembalikan set intern_id yang terdampak.
+    """
+    cur = conn.cursor()
+    affected = set()
+    try:
+        cur.execute(f"SELECT id, intern_id, file_path FROM {DB_TABLE_EMBEDDINGS}")
+        missing = [(row_id, intern_id) for row_id, intern_id, file_path in cur.fetchall()
+                   if intern_id not in skip_intern_ids and not (PROJECT_ROOT / file_path).exists()]
+        if missing:
+            removed_by_intern = {}
+            for intern_id, vector in delete_embeddings(conn, [row_id for row_id, _ in missing]):
+                removed_by_intern.setdefault(intern_id, []).append(vector)
+            for intern_id, vectors in removed_by_intern.items():
+                update_centroid_incremental(conn, intern_id, removed=vectors)
+            conn.commit()
+            affected = set(removed_by_intern)
+            print(f"     🗑️ {len(missing)} embedding yatim (file hilang) dihapus dari {len(affected)} intern.")
+        return affected
+    except Exception as e:
+        conn.rollback()
+        print(f"     ❌ ERROR: Gagal membersihkan embedding yatim: {e}")
+        return affected
+    finally:
+        cur.close()
+
 
 # --- FUNGSI UTAMA (INCREMENTAL INDEXING) ---
 
-def index_data_incremental():
+def detect_faces(tasks: list, workers: int):
+    """
+    Deteksi + alignment wajah untuk setiap task (key, path, target_size).
+    Dengan workers > 1 dijalankan di process pool (spawn, aman untuk TensorFlow);
+    hasil dikembalikan BERURUTAN sesuai tasks agar pengelompokan per orang tetap utuh.
+    """
+    if workers <= 1:
+        yield from map(preprocess_face_file, tasks)
+        return
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(processes=workers) as pool:
+        yield from pool.imap(preprocess_face_file, tasks, chunksize=4)
+
+def index_data_incremental(workers: int = 1, batch_size: int = 16, progress: "IndexingProgress" = None):
+    """
+    Indexing incremental seluruh dataset. `progress` (opsional, dari job manager API)
+    menerima progres per gambar + error per orang, dan bisa membatalkan job di antara
+    gambar; orang yang sudah ter-commit tetap tersimpan sehingga run berikutnya melanjutkan.
+    """
+    progress = progress or IndexingProgress()
     conn = connect_db()
     cur = conn.cursor()
+    # Satu indexing di seluruh worker API + CLI (lock sesi, lepas saat conn ditutup)
+    if not try_advisory_lock(cur, LOCK_INDEXING):
+        conn.close()
+        raise IndexingBusyError("Indexing lain sedang berjalan (worker API lain atau CLI index_data.py).")
 
     try:
         master_data = load_master_data()
     except SystemExit:
         conn.close()
-        return
+        raise
 
 
     print("==================================================")
     print(f"🧠 SCRIPT INDEXING INCREMENTAL (DeepFace/{MODEL_NAME} - {EMBEDDING_DIM}D)")
     print(f"     Dataset Path: {DATASET_PATH}")
+    print(f"     Workers deteksi: {workers} | Batch embedding: {batch_size}")
     print("==================================================")
 
-    intern_ids_to_recalculate = set()
+    # Bangun model sekali di awal, lalu dipakai ulang untuk setiap batch
+    target_size = get_target_size()
+    ensure_index_schema(conn)
+
+    intern_ids_to_recalculate = set() # Intern yang centroid-nya berubah (untuk laporan)
+    scanned_intern_ids = set()
     total_new_embeddings = 0
 
-    # 1. ITERASI DATASET DAN BUAT EMBEDDING BARU
+    # 1. ITERASI DATASET: DAFTARKAN INTERN & KUMPULKAN FILE BARU
     print("✅ Memastikan data interns.csv terdaftar dan memproses embeddings baru...")
 
     if not DATASET_PATH.exists() or not DATASET_PATH.is_dir():
@@ -181,9 +300,16 @@ def index_data_incremental():
         conn.close()
         sys.exit(1)
 
+    persons = [] # Satu entri per intern yang punya file baru (urut sesuai tasks)
+    tasks = []
     processed_folders = 0
     skipped_folders = 0
     for folder_name in os.listdir(DATASET_PATH):
+        try:
+            progress.check_cancelled()
+        except IndexingCancelled:
+            conn.close()
+            raise
         person_dir = DATASET_PATH / folder_name
 
         if not os.path.isdir(person_dir) or folder_name.startswith('.'):
@@ -200,177 +326,298 @@ def index_data_incremental():
         instansi_value = metadata['instansi']
         kategori_value = metadata['kategori']
 
-        intern_id = None
-        embeddings_to_insert = []
-        person_new_count = 0
-
         try:
             # A. UPSERT INTERN
             intern_id = upsert_intern_and_get_id(conn, person_name, instansi_value, kategori_value)
-            intern_ids_to_recalculate.add(intern_id) # Tandai untuk hitung ulang centroid
+            scanned_intern_ids.add(intern_id)
 
-            # B. Ambil list file yang sudah ada di DB
-            existing_paths = get_existing_file_paths(conn, intern_id)
-            print(f"\n     -> Memproses {person_name} (ID: {intern_id})... {len(existing_paths)} file sudah ada.")
+            # B. Ambil file yang sudah ada di DB beserta sidiknya (hash, mtime, ukuran)
+            existing_files = get_existing_files(conn, intern_id)
+            print(f"\n     -> Memproses {person_name} (ID: {intern_id})... {len(existing_files)} file sudah ada.")
 
-            # C. Proses gambar baru saja
+            # C. Bandingkan isi folder dengan DB
             image_files = [f for f in sorted(os.listdir(person_dir)) if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
             print(f"        Ditemukan {len(image_files)} file gambar.")
 
+            new_files = [] # (relative_filepath, content_hash, mtime, size)
+            stale_ids = [] # Vektor yang harus dibuang: file diganti atau dihapus
+            fingerprint_updates = [] # File disentuh (mtime berubah) tapi isinya sama
             for filename in image_files:
                 # Gunakan path relatif dari PROJECT_ROOT untuk konsistensi
                 relative_filepath = f"data/dataset/{folder_name}/{filename}"
-                absolute_filepath = str(PROJECT_ROOT / relative_filepath) # Path absolut untuk DeepFace
-
-                # Cek jika path RELATIF sudah ada
-                if relative_filepath in existing_paths:
-                    # print(f"       [SKIP] {filename} sudah di database.")
+                stat = (PROJECT_ROOT / relative_filepath).stat()
+                known = existing_files.get(relative_filepath)
+
+                if known and known[4] != PREPROCESS_PIPELINE_VERSION:
+                    # Di-embed dengan pipeline preprocessing lama: vektornya tidak sebanding, embed ulang
+                    print(f"        [PIPELINE] {filename} di-embed ulang (versi {known[4]} -> {PREPROCESS_PIPELINE_VERSION}).")
+                    stale_ids.append(known[0])
+                    new_files.append((relative_filepath, hash_file(PROJECT_ROOT / relative_filepath), stat.st_mtime, stat.st_size))
                     continue
 
-                try:
-                    # print(f"       [PROSES] {filename}")
-                    representations = DeepFace.represent(
-                        img_path=absolute_filepath,
-                        model_name=MODEL_NAME,
-                        enforce_detection=True,
-                        detector_backend='opencv' 
-                    )
-                    
-                    # --- PERBAIKAN BUG 'float' object is not iterable ---
-                    # (Penting untuk deepface==0.0.75)
-                    embedding_vector = None
-                    if isinstance(representations, list) and len(representations) > 0:
-                        if isinstance(representations[0], dict):
-                            # Kasus Normal (beberapa wajah, atau 1 wajah sbg dict): [ {'embedding': [...]}, ... ]
-                            embedding_vector = representations[0]["embedding"] # Ambil wajah pertama saja
-                        elif isinstance(representations[0], (float, np.float32)):
-                            # Kasus Bug (1 wajah): [0.1, 0.2, 0.3, ...]
-                            embedding_vector = representations # Ini sudah flat list
-                        else:
-                            print(f"        [SKIP] Format output DeepFace tidak dikenal untuk {filename}.")
-                    # --- AKHIR PERBAIKAN ---
-
-                    if embedding_vector is not None:
-                        # Pastikan dimensinya benar
-                        if len(embedding_vector) != EMBEDDING_DIM:
-                            print(f"        [ERROR] Dimensi embedding salah ({len(embedding_vector)}D, seharusnya {EMBEDDING_DIM}D) untuk {filename}.")
-                            continue
-
-                        vector_string = "[" + ",".join(map(str, embedding_vector)) + "]"
-                        # Simpan path RELATIF ke DB
-                        embeddings_to_insert.append((intern_id, person_name, instansi_value, kategori_value, relative_filepath, vector_string))
-                        person_new_count += 1
-                    else:
-                        print(f"        [SKIP] Tidak ada embedding dihasilkan untuk {filename}.")
-
-                except ValueError as ve:
-                    if 'Face could not be detected' in str(ve):
-                        print(f"        [SKIP] Wajah tidak terdeteksi di {filename}.")
-                    else:
-                        print(f"        [ERROR] Gagal memproses {filename}. Detail: {ve}")
-                except Exception as e:
-                    # Ini akan menangkap error 'float' is not iterable jika logika di atas gagal
-                    print(f"        [ERROR] Gagal memproses {filename}. Detail: {e}")
+                # Cek cepat: mtime + ukuran sama -> file tidak berubah, tidak perlu di-hash
+                if known and known[1] is not None and known[2] == stat.st_mtime and known[3] == stat.st_size:
+                    continue
 
+                content_hash = hash_file(PROJECT_ROOT / relative_filepath)
+                if known is None:
+                    new_files.append((relative_filepath, content_hash, stat.st_mtime, stat.st_size))
+                elif known[1] is None or known[1] == content_hash:
+                    # Baris lama tanpa hash (sebelum migrasi) atau isi identik: cukup perbarui sidiknya
+                    fingerprint_updates.append((content_hash, stat.st_mtime, stat.st_size, known[0]))
+                else:
+                    print(f"        [UBAH] {filename} diganti, akan di-embed ulang.")
+                    stale_ids.append(known[0])
+                    new_files.append((relative_filepath, content_hash, stat.st_mtime, stat.st_size))
+
+            on_disk = {f"data/dataset/{folder_name}/{f}" for f in image_files}
+            for relative_filepath, known in existing_files.items():
+                if relative_filepath not in on_disk:
+                    print(f"        [HAPUS] {os.path.basename(relative_filepath)} sudah tidak ada di disk.")
+                    stale_ids.append(known[0])
+
+            if fingerprint_updates:
+                cur.executemany(
+                    f"UPDATE {DB_TABLE_EMBEDDINGS} SET content_hash = %s, file_mtime = %s, file_size = %s WHERE id = %s",
+                    fingerprint_updates
+                )
+                conn.commit()
         except Exception as e:
             conn.rollback()
             print(f"❌ FATAL ERROR: Gagal memproses intern {person_name}. Detail: {e}")
+            progress.person_error(person_name, None, str(e))
             continue # Lanjut ke folder berikutnya
 
-        # D. INSERT BATCH EMBEDDING BARU
-        if embeddings_to_insert:
-            insert_query = f"INSERT INTO {DB_TABLE_EMBEDDINGS} (intern_id, name, instansi, kategori, file_path, embedding) VALUES (%s, %s, %s, %s, %s, %s::vector)"
+        if not new_files:
+            if stale_ids:
+                # Hanya ada penghapusan: buang vektor lama sekarang
+                try:
+                    removed = [vector for _, vector in delete_embeddings(conn, stale_ids)]
+                    update_centroid_incremental(conn, intern_id, removed=removed)
+                    conn.commit()
+                    intern_ids_to_recalculate.add(intern_id)
+                    print(f"     ✅ Selesai: {len(removed)} embedding lama dihapus untuk {person_name}.")
+                except Exception as db_e:
+                    conn.rollback()
+                    print(f"❌ FATAL ERROR DB: Gagal menghapus embeddings lama untuk {person_name}. Detail: {db_e}")
+                    progress.person_error(person_name, None, str(db_e))
+            elif image_files: # Hanya cetak jika ada gambar tapi tidak ada yang baru
+                print(f"        [INFO] Tidak ada perubahan file untuk {person_name}.")
+            else:
+                print(f"        [INFO] Tidak ada file gambar ditemukan untuk {person_name}.")
+            continue
+
+        person_idx = len(persons)
+        persons.append({
+            "intern_id": intern_id, "name": person_name, "instansi": instansi_value,
+            "kategori": kategori_value, "pending": len(new_files), "rows": [], "vectors": [], "stale_ids": stale_ids
+        })
+        for relative_filepath, content_hash, mtime, size in new_files:
+            absolute_filepath = str(PROJECT_ROOT / relative_filepath) # Path absolut untuk DeepFace
+            tasks.append(((person_idx, relative_filepath, content_hash, mtime, size), absolute_filepath, target_size))
+
+    # Folder yang hilang seluruhnya: buang vektor yang file-nya sudah tidak ada
+    intern_ids_to_recalculate |= remove_orphan_embeddings(conn, scanned_intern_ids)
+
+    print(f"\n✅ Selesai memindai {processed_folders} folder. {skipped_folders} folder diabaikan (tidak ada di CSV).")
+
+    # 2. DETEKSI PARALEL + EMBEDDING BATCH + COMMIT PER ORANG
+    next_commit = 0 # Index orang berikutnya yang menunggu commit
+    batch_keys, batch_faces = [], []
+
+    def commit_finished_persons():
+        # D. INSERT BATCH EMBEDDING BARU (per orang, setelah semua filenya selesai)
+        nonlocal next_commit, total_new_embeddings
+        while next_commit < len(persons) and persons[next_commit]["pending"] == 0:
+            person = persons[next_commit]
+            next_commit += 1
+            if not person["rows"] and not person["stale_ids"]:
+                print(f"        [INFO] Tidak ada embeddings baru yang diproses untuk {person['name']}.")
+                continue
             try:
-                cur.executemany(insert_query, embeddings_to_insert)
+                # Vektor lama (file diganti/dihapus) dibuang dan centroid diperbarui dalam transaksi yang sama
+                removed = [vector for _, vector in delete_embeddings(conn, person["stale_ids"])]
+                if person["rows"]:
+                    # COPY binary: vektor dikirim dalam format vector_recv, tanpa literal teks per angka
+                    copy_binary(cur, DB_TABLE_EMBEDDINGS, EMBEDDING_COPY_COLUMNS, person["rows"])
+                update_centroid_incremental(conn, person["intern_id"], added=person["vectors"], removed=removed)
                 conn.commit()
-                total_new_embeddings += person_new_count
-                print(f"     ✅ Selesai: {person_new_count} embeddings BARU disimpan untuk {person_name}.")
+                intern_ids_to_recalculate.add(person["intern_id"])
+                total_new_embeddings += len(person["rows"])
+                print(f"     ✅ Selesai: {len(person['rows'])} embeddings BARU disimpan, {len(removed)} lama dihapus untuk {person['name']}.")
             except Exception as db_e:
                 conn.rollback()
-                print(f"❌ FATAL ERROR DB: Gagal menyimpan embeddings untuk {person_name}. Detail: {db_e}")
-        else:
-            if image_files: # Hanya cetak jika ada gambar tapi tidak ada yang baru
-                print(f"        [INFO] Tidak ada embeddings baru yang diproses untuk {person_name}.")
-            else:
-                print(f"        [INFO] Tidak ada file gambar ditemukan untuk {person_name}.")
+                print(f"❌ FATAL ERROR DB: Gagal menyimpan embeddings untuk {person['name']}. Detail: {db_e}")
+                progress.person_error(person["name"], None, str(db_e))
+            person["rows"], person["vectors"] = [], []
 
-
-    print(f"\n✅ Selesai memproses {processed_folders} folder. {skipped_folders} folder diabaikan (tidak ada di CSV).")
-
-    # 2. HITUNG ULANG CENTROID UNTUK SEMUA YANG TERDAMPAK
-    if not intern_ids_to_recalculate:
-        print("\n⚠️ Tidak ada data baru yang diproses atau intern yang terpengaruh. Perhitungan Centroid dilewati.")
-    else:
+    def flush_batch():
+        if not batch_keys:
+            return
+        try:
+            embeddings = embed_face_batch(batch_faces)
+        except Exception as e:
+            print(f"        [ERROR] Gagal embedding batch ({len(batch_faces)} wajah). Detail: {e}")
+            for person_idx, relative_filepath, *_ in batch_keys:
+                progress.person_error(persons[person_idx]["name"], os.path.basename(relative_filepath), f"Gagal embedding: {e}")
+            embeddings = [None] * len(batch_keys)
+        for (person_idx, relative_filepath, content_hash, mtime, size), embedding_vector in zip(batch_keys, embeddings):
+            person = persons[person_idx]
+            person["pending"] -= 1
+            if embedding_vector is None:
+                progress.image_done(person["name"], ok=False)
+                continue
+            # Pastikan dimensinya benar
+            if len(embedding_vector) != EMBEDDING_DIM:
+                print(f"        [ERROR] Dimensi embedding salah ({len(embedding_vector)}D, seharusnya {EMBEDDING_DIM}D) untuk {relative_filepath}.")
+                progress.person_error(person["name"], os.path.basename(relative_filepath), f"Dimensi embedding salah ({len(embedding_vector)}D).")
+                progress.image_done(person["name"], ok=False)
+                continue
+            progress.image_done(person["name"])
+            # Simpan path RELATIF ke DB
+            person["rows"].append((person["intern_id"], person["name"], person["instansi"], person["kategori"],
+                                   relative_filepath, content_hash, mtime, size, PREPROCESS_PIPELINE_VERSION, embedding_vector))
+            person["vectors"].append(embedding_vector)
+        batch_keys.clear()
+        batch_faces.clear()
+
+    start_time = time.perf_counter()
+    progress.set_total(len(tasks))
+    try:
+        for key, face, error in detect_faces(tasks, workers):
+            progress.check_cancelled()
+            person_idx, relative_filepath = key[0], key[1]
+            filename = os.path.basename(relative_filepath)
+            if face is None:
+                persons[person_idx]["pending"] -= 1
+                if 'Face could not be detected' in (error or ''):
+                    print(f"        [SKIP] Wajah tidak terdeteksi di {filename}.")
+                    progress.person_error(persons[person_idx]["name"], filename, "Wajah tidak terdeteksi.")
+                else:
+                    print(f"        [ERROR] Gagal memproses {filename}. Detail: {error}")
+                    progress.person_error(persons[person_idx]["name"], filename, error or "Gagal memproses gambar.")
+                progress.image_done(persons[person_idx]["name"], ok=False)
+            else:
+                batch_keys.append(key)
+                batch_faces.append(face)
+                if len(batch_faces) >= batch_size:
+                    flush_batch()
+            commit_finished_persons()
+        flush_batch()
+        commit_finished_persons()
+    except IndexingCancelled:
+        # Orang yang belum lengkap tidak di-commit; run berikutnya memprosesnya ulang
+        conn.rollback()
+        try:
+            # Ambang adaptif orang yang sudah ter-commit tetap diperbarui
+            refresh_intern_thresholds(conn, intern_ids_to_recalculate)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"     ❌ ERROR: Gagal menghitung ambang adaptif: {e}")
+        conn.close()
+        print(f"\n🛑 Indexing dibatalkan setelah {progress.done}/{len(tasks)} gambar.")
+        raise
+
+    elapsed = time.perf_counter() - start_time
+    if tasks:
+        print(f"\n⚡ Throughput: {len(tasks)} gambar dalam {elapsed:.1f}s ({len(tasks) / max(elapsed, 1e-6):.2f} gambar/s).")
+
+    # 3. CENTROID SUDAH DIPERBARUI INCREMENTAL SAAT COMMIT PER ORANG.
+    #    Hitung penuh hanya untuk intern yang punya embedding tapi belum punya centroid.
+    progress.set_phase("centroids")
+    missing_centroids = get_interns_missing_centroid(conn)
+    if missing_centroids:
         print("\n==================================================")
-        print(f"🧠 MEMULAI PERHITUNGAN CENTROID ({len(intern_ids_to_recalculate)} intern)")
+        print(f"🧠 MEMBANGUN CENTROID YANG BELUM ADA ({len(missing_centroids)} intern)")
         print("==================================================")
+    for intern_id in missing_centroids:
+        try:
+            count, _ = rebuild_centroid(conn, intern_id)
+            conn.commit()
+            intern_ids_to_recalculate.add(intern_id)
+            print(f"     ✅ Centroid Intern ID {intern_id} dibangun dari {count} embeddings.")
+        except Exception as e:
+            conn.rollback()
+            print(f"     ❌ ERROR: Gagal membangun centroid untuk Intern ID {intern_id}: {e}")
 
-        recalculated_count = 0
-        for intern_id in intern_ids_to_recalculate:
-            cur.execute(f"""
-                SELECT name, instansi, kategori, embedding
-                FROM {DB_TABLE_EMBEDDINGS}
-                WHERE intern_id = %s
-            """, (intern_id,))
-
-            results = cur.fetchall()
-
-            if not results:
-                print(f"     ⚠️ Tidak ada embedding ditemukan untuk Intern ID {intern_id}. Centroid dilewati.")
-                continue
+    # 4. AMBANG ADAPTIF sekali per intern yang berubah di run ini (+ centroid lama yang belum punya)
+    threshold_ids = (intern_ids_to_recalculate - set(missing_centroids)) | get_interns_missing_threshold(conn)
+    if threshold_ids:
+        print(f"\n🎯 Menghitung ambang adaptif untuk {len(threshold_ids)} intern...")
+        try:
+            refresh_intern_thresholds(conn, threshold_ids)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"     ❌ ERROR: Gagal menghitung ambang adaptif: {e}")
 
-            name, instansi, kategori = results[0][0], results[0][1], results[0][2]
+    # 5. SNAPSHOT GALERI untuk API (np.memmap, versi baru dipasang via rename atomik)
+    progress.set_phase("snapshot")
+    publish_gallery_snapshot(conn)
+    conn.close()
 
-            try:
-                # results[i][3] sudah berupa numpy array karena registrasi tipe
-                embeddings_array = np.stack([res[3] for res in results])
-                if embeddings_array.ndim == 1: # Jika hanya 1 embedding
-                    embeddings_array = embeddings_array.reshape(1, -1)
-            except Exception as e:
-                print(f"     ❌ ERROR: Gagal stack embeddings untuk {name}. Error: {e}")
-                continue
+    print("\n" + "="*50)
+    print(f"🎉 ALUR KERJA LENGKAP!")
+    print(f"     Total {total_new_embeddings} embedding baru ditambahkan.")
+    print(f"     Total {len(intern_ids_to_recalculate)} centroid diperbarui.")
+    print("="*50)
 
+def rebuild_all_centroids():
+    """
+    Hitung ulang penuh SEMUA centroid dari intern_embeddings dan bandingkan dengan
+    running sum yang tersimpan (verifikasi konsistensi). Hasil penuh menggantikan nilai lama.
+    """
+    conn = connect_db()
+    cur = conn.cursor()
+    ensure_index_schema(conn)
 
-            centroid_vector = np.mean(embeddings_array, axis=0)
+    print("==================================================")
+    print("🧮 REBUILD PENUH CENTROID + VERIFIKASI RUNNING SUM")
+    print("==================================================")
 
-            # Normalisasi Centroid (penting untuk cosine distance)
-            norm = np.linalg.norm(centroid_vector)
-            if norm > 1e-6: # Hindari pembagian dengan nol
-                centroid_vector = centroid_vector / norm
-            else:
-                print(f"     ⚠️ Peringatan: Centroid untuk {name} mendekati nol. Normalisasi dilewati.")
+    cur.execute(f"SELECT intern_id, embedding_sum, embedding_count FROM {DB_TABLE_CENTROID_SUMS}")
+    stored = {intern_id: (np.frombuffer(raw, dtype=np.float64), count) for intern_id, raw, count in cur.fetchall()}
+    cur.execute(f"SELECT DISTINCT intern_id FROM {DB_TABLE_EMBEDDINGS}")
+    intern_ids = {row[0] for row in cur.fetchall()} | set(stored)
 
-            centroid_str = "[" + ",".join(map(str, centroid_vector)) + "]"
+    mismatched = 0
+    for intern_id in sorted(intern_ids):
+        try:
+            count, embedding_sum = rebuild_centroid(conn, intern_id)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"     ❌ ERROR: Gagal rebuild centroid Intern ID {intern_id}: {e}")
+            continue
 
-            # UPSERT Centroid ke Tabel intern_centroids
-            try:
-                cur.execute(
-                    f"""
-                    INSERT INTO {DB_TABLE_CENTROIDS} (intern_id, name, instansi, kategori, embedding)
-                    VALUES (%s, %s, %s, %s, %s::vector)
-                    ON CONFLICT (intern_id) DO UPDATE SET
-                        embedding = EXCLUDED.embedding,
-                        name = EXCLUDED.name,
-                        instansi = EXCLUDED.instansi,
-                        kategori = EXCLUDED.kategori;
-                    """,
-                    (intern_id, name, instansi, kategori, centroid_str)
-                )
-                conn.commit()
-                print(f"     ✅ Centroid {name} berhasil diperbarui dari {len(results)} embeddings.")
-                recalculated_count += 1
-            except Exception as e:
-                conn.rollback()
-                print(f"     ❌ ERROR: Gagal menyimpan centroid untuk {name}: {e}")
+        if intern_id not in stored:
+            print(f"     [BARU] Intern ID {intern_id}: running sum belum ada, dibuat dari {count} embeddings.")
+            continue
+        stored_sum, stored_count = stored[intern_id]
+        drift = float(np.max(np.abs(stored_sum - embedding_sum))) if count else 0.0
+        if stored_count != count or drift > 1e-4:
+            mismatched += 1
+            print(f"     [TIDAK KONSISTEN] Intern ID {intern_id}: count {stored_count} -> {count}, drift maks {drift:.2e}.")
 
+    publish_gallery_snapshot(conn)
     conn.close()
-
-    print("\n" + "="*50)
-    print(f"🎉 ALUR KERJA LENGKAP!")
-    print(f"     Total {total_new_embeddings} embedding baru ditambahkan.")
-    if intern_ids_to_recalculate:
-        print(f"     Total {recalculated_count} centroid dihitung ulang/diperbarui.")
-    print("="*50)
+    print(f"\n🎉 Rebuild selesai: {len(intern_ids)} intern diperiksa, {mismatched} tidak konsisten (sudah diperbaiki).")
 
 if __name__ == "__main__":
-    index_data_incremental()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Indexing incremental dataset wajah ke pgvector.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Jumlah proses untuk decode + deteksi wajah paralel (default: 1, tanpa pool).")
+    parser.add_argument("--batch-size", type=int, default=16,
+                        help="Jumlah wajah per forward pass embedding (default: 16).")
+    parser.add_argument("--rebuild-centroids", action="store_true",
+                        help="Hitung ulang penuh semua centroid dan verifikasi running sum (tanpa indexing).")
+    args = parser.parse_args()
+    if args.rebuild_centroids:
+        rebuild_all_centroids()
+    else:
+        try:
+            index_data_incremental(workers=max(1, args.workers), batch_size=max(1, args.batch_size))
+        except IndexingBusyError as e:
+            print(f"❌ ERROR: {e}")
+            sys.exit(1)
\ No newline at end of file
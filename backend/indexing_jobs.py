@@ -0,0 +1,218 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+# --- JOB INDEXING IN-PROCESS (SINGLE-FLIGHT) ---
+#
+# /run_indexing dulu menjalankan subprocess index_data.py: model dimuat ulang,
+# output baru terlihat setelah proses selesai, dan dua klik memicu dua proses
+# yang saling berebut CPU. Sekarang logika index_data_incremental dijalankan di
+# satu thread worker milik API (model sudah dimuat), dengan kunci single-flight,
+# progres real-time (gambar/detik, ETA, error per orang) dan pembatalan.
+#
+# Multi-worker: status job ditulis berkala ke file bersama (status_path) sehingga
+# /indexing/status di worker mana pun melaporkan job yang sedang berjalan.
+
+MAX_REPORTED_ERRORS = 200
+STATUS_PUBLISH_SECONDS = 1.0
+STATUS_STALE_SECONDS = 15.0  # Status "running" tanpa pembaruan selama ini -> worker-nya mati
+
+
+class IndexingCancelled(Exception):
+    """Dilempar dari dalam loop indexing saat job dibatalkan."""
+
+
+class IndexingBusyError(Exception):
+    """Dilempar saat job indexing lain (worker API lain atau CLI) sedang berjalan."""
+
+
+class IndexingProgress:
+    """
+    Progres satu job indexing. Dipanggil dari thread indexing, dibaca dari endpoint status.
+    Tanpa job manager (CLI) objek ini tetap aman dipakai: tidak pernah dibatalkan.
+    """
+
+    def __init__(self, cancel_event: Optional[threading.Event] = None):
+        self._lock = threading.Lock()
+        self._cancel_event = cancel_event or threading.Event()
+        self.phase = "scan"
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.current_person: Optional[str] = None
+        self.errors = deque(maxlen=MAX_REPORTED_ERRORS)
+        self.started_at = time.time()
+        self._embed_started: Optional[float] = None
+
+    def set_phase(self, phase: str):
+        self.phase = phase
+
+    def set_total(self, total: int):
+        """Jumlah gambar yang akan diproses (setelah pemindaian folder)."""
+        with self._lock:
+            self.total = total
+            self.phase = "embedding"
+            self._embed_started = time.perf_counter()
+
+    def image_done(self, person: str, ok: bool = True):
+        with self._lock:
+            self.done += 1
+            self.current_person = person
+            if not ok:
+                self.failed += 1
+
+    def person_error(self, person: str, filename: Optional[str], message: str):
+        with self._lock:
+            self.errors.append({"person": person, "file": filename, "error": message, "at": time.time()})
+
+    def check_cancelled(self):
+        if self._cancel_event.is_set():
+            raise IndexingCancelled("Indexing dibatalkan.")
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            elapsed = time.perf_counter() - self._embed_started if self._embed_started else 0.0
+            rate = self.done / elapsed if elapsed > 0 else 0.0
+            remaining = max(self.total - self.done, 0)
+            return {
+                "phase": self.phase,
+                "total_images": self.total,
+                "images_done": self.done,
+                "images_failed": self.failed,
+                "images_per_second": round(rate, 2),
+                "eta_seconds": round(remaining / rate, 1) if rate > 0 else None,
+                "current_person": self.current_person,
+                "errors": list(self.errors),
+            }
+
+
+class IndexingJobManager:
+    """
+    Menjalankan maksimal satu job indexing sekaligus di thread latar belakang.
+
+    `run(progress)` berisi logika indexing; `on_success()` dipanggil setelah job
+    selesai tanpa error (misal: reload galeri + pre-generate audio).
+    """
+
+    def __init__(self, run: Callable[[IndexingProgress], None], on_success: Optional[Callable[[], None]] = None,
+                 status_path: Optional[Path] = None):
+        self.run = run
+        self.on_success = on_success
+        self.status_path = Path(status_path) if status_path else None
+        self._flight = threading.Lock()
+        self._cancel_event = threading.Event()
+        self._job: Optional[Dict[str, object]] = None
+        self._progress: Optional[IndexingProgress] = None
+
+    @property
+    def running(self) -> bool:
+        return self._flight.locked()
+
+    def start(self) -> bool:
+        """Memulai job baru. False jika sudah ada job yang berjalan (single-flight)."""
+        if not self._flight.acquire(blocking=False):
+            return False
+        self._cancel_event = threading.Event()
+        self._progress = IndexingProgress(self._cancel_event)
+        self._job = {"job_id": uuid.uuid4().hex[:12], "state": "running", "started_at": time.time(),
+                     "finished_at": None, "error": None}
+        try:
+            threading.Thread(target=self._execute, args=(self._job, self._progress), name="indexing-job", daemon=True).start()
+        except Exception:
+            self._job.update(state="failed", finished_at=time.time(), error="Gagal membuat thread indexing.")
+            self._flight.release()
+            raise
+        return True
+
+    def cancel(self) -> bool:
+        """Meminta job berhenti di titik aman berikutnya. False jika tidak ada job berjalan."""
+        if not self.running or self._job is None:
+            return False
+        self._cancel_event.set()
+        if self._job["state"] == "running":
+            self._job["state"] = "cancelling"
+        return True
+
+    def _publish_loop(self, job: Dict[str, object]):
+        while job["finished_at"] is None:
+            self._publish()
+            time.sleep(STATUS_PUBLISH_SECONDS)
+
+    def _publish(self):
+        """Menulis status job ke file bersama (rename atomik) untuk worker lain."""
+        if self.status_path is None:
+            return
+        try:
+            payload = dict(self._local_status(), updated_at=time.time(), pid=os.getpid())
+            tmp_path = self.status_path.with_name(f".{self.status_path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, self.status_path)
+        except OSError as e:
+            print(f"⚠️ [Indexing] Gagal menulis status bersama: {e}")
+
+    def _shared_status(self) -> Optional[Dict[str, object]]:
+        """Status job terakhir dari file bersama (bisa milik worker lain)."""
+        if self.status_path is None:
+            return None
+        try:
+            with open(self.status_path, encoding="utf-8") as f:
+                shared = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if shared.get("state") in ("running", "cancelling") and time.time() - shared.get("updated_at", 0) > STATUS_STALE_SECONDS:
+            shared.update(state="failed", error="Worker yang menjalankan indexing berhenti sebelum selesai.")
+        return shared
+
+    def running_elsewhere(self) -> bool:
+        """True jika job indexing sedang berjalan di worker lain (menurut file status bersama)."""
+        if self.running:
+            return False
+        shared = self._shared_status()
+        return bool(shared) and shared.get("pid") != os.getpid() and shared["state"] in ("running", "cancelling")
+
+    def _execute(self, job: Dict[str, object], progress: IndexingProgress):
+        threading.Thread(target=self._publish_loop, args=(job,), name="indexing-status", daemon=True).start()
+        try:
+            self.run(progress)
+            progress.set_phase("reload")
+            if self.on_success is not None:
+                self.on_success()
+            job["state"] = "succeeded"
+        except IndexingCancelled:
+            job["state"] = "cancelled"
+            print("🛑 [Indexing] Job dibatalkan. Orang yang sudah selesai tetap tersimpan.")
+        except BaseException as e:  # termasuk SystemExit dari index_data (CSV/dataset tidak ditemukan)
+            job["state"] = "failed"
+            if isinstance(e, SystemExit):
+                job["error"] = f"index_data berhenti (exit {e.code}); lihat log API."
+            else:
+                job["error"] = str(e) or e.__class__.__name__
+            print(f"❌ [Indexing] Job gagal: {job['error']}")
+        finally:
+            progress.set_phase("done")
+            job["finished_at"] = time.time()
+            self._publish()
+            self._flight.release()
+
+    def status(self) -> Dict[str, object]:
+        """Status job lokal, atau job yang lebih baru dari worker lain (file status bersama)."""
+        if not self.running:
+            shared = self._shared_status()
+            if shared and (self._job is None or shared["started_at"] > self._job["started_at"]):
+                return shared
+        return self._local_status()
+
+    def _local_status(self) -> Dict[str, object]:
+        if self._job is None:
+            return {"state": "idle"}
+        job = dict(self._job)
+        finished_at = job["finished_at"] or time.time()
+        job["elapsed_seconds"] = round(finished_at - job["started_at"], 1)
+        job.update(self._progress.snapshot())
+        return job
@@ -1,14 +1,20 @@
 import time
 import sys
-import subprocess
-from fastapi import BackgroundTasks
 import os
 # from dotenv import load_dotenv # <-- DIHAPUS/KOMENTARI
 import psycopg2
 import psycopg2.extensions
+import psycopg2.pool
+import psycopg2.extras
+import threading
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import shutil
 import uuid
+import base64
+import hashlib
 
 # load_dotenv() # <-- DIHAPUS/KOMENTARI
 
@@ -46,12 +52,13 @@ except ImportError:
         return MockTTS(text, lang)
 
 # Import library FastAPI
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.requests import Request
+from starlette.concurrency import run_in_threadpool
 from starlette.staticfiles import StaticFiles
 from starlette.status import HTTP_302_FOUND
-from starlette.responses import RedirectResponse, JSONResponse
+from starlette.responses import RedirectResponse, JSONResponse, PlainTextResponse
 
 # Import DeepFace (pastikan sudah terinstal: pip install deepface)
 try:
@@ -68,17 +75,65 @@ sys.path.insert(0, str(PROJECT_ROOT))
 # Impor fungsi dan konfigurasi dari file lain (asumsi ada di backend/utils.py)
 try:
     # Coba import absolut dulu (umumnya lebih baik)
-    from backend.utils import extract_face_features, DISTANCE_THRESHOLD, EMBEDDING_DIM
+    from backend.utils import (extract_face_features, extract_face_features_burst, extract_enrollment_embedding, warm_up_models, EmbeddingBatcher,
+                               detect_face_input, valid_embedding, DISTANCE_THRESHOLD, EMBEDDING_DIM,
+                               MATCHING_MODE, PROTOTYPES_PER_INTERN, PROTOTYPE_DISTANCE_THRESHOLD, MATCH_MARGIN,
+                               ADAPTIVE_THRESHOLD_PERCENTILE, ADAPTIVE_THRESHOLD_SLACK, ADAPTIVE_THRESHOLD_FLOOR,
+                               ADAPTIVE_THRESHOLD_MIN_SAMPLES, PREPROCESS_PIPELINE_VERSION, VECTOR_INDEXED_TABLES, vector_index_ddl,
+                               vector_search_settings_sql)
 except ImportError:
     try:
          # Fallback ke import relatif jika dijalankan sebagai modul
-        from .utils import extract_face_features, DISTANCE_THRESHOLD, EMBEDDING_DIM
+        from .utils import (extract_face_features, extract_face_features_burst, extract_enrollment_embedding, warm_up_models, EmbeddingBatcher,
+                            detect_face_input, valid_embedding, DISTANCE_THRESHOLD, EMBEDDING_DIM,
+                            MATCHING_MODE, PROTOTYPES_PER_INTERN, PROTOTYPE_DISTANCE_THRESHOLD, MATCH_MARGIN,
+                            ADAPTIVE_THRESHOLD_PERCENTILE, ADAPTIVE_THRESHOLD_SLACK, ADAPTIVE_THRESHOLD_FLOOR,
+                            ADAPTIVE_THRESHOLD_MIN_SAMPLES, PREPROCESS_PIPELINE_VERSION, VECTOR_INDEXED_TABLES, vector_index_ddl,
+                            vector_search_settings_sql)
     except ImportError:
          # Fallback terakhir jika utils.py tidak ditemukan
         print("⚠️ Peringatan: Gagal mengimpor utilitas (utils.py). Pastikan file ini ada di backend/utils.py.")
-        def extract_face_features(image_bytes): return []
+        def extract_face_features(image_bytes, batcher=None, timings=None, thumbnails=None): return []
+        def extract_face_features_burst(frames, timings=None, thumbnails=None): return []
+        def extract_enrollment_embedding(image_bytes): raise ValueError("Model wajah tidak tersedia.")
+        EmbeddingBatcher = None
+        def detect_face_input(image_bytes, timings=None, thumbnails=None): return None
+        def valid_embedding(embedding): return []
+        def warm_up_models(): return 0.0
         DISTANCE_THRESHOLD = 0.5
         EMBEDDING_DIM = 512
+        MATCHING_MODE = "centroid"
+        PROTOTYPES_PER_INTERN = 3
+        PROTOTYPE_DISTANCE_THRESHOLD = 0.5
+        MATCH_MARGIN = 0.05
+        ADAPTIVE_THRESHOLD_PERCENTILE = 95
+        ADAPTIVE_THRESHOLD_SLACK = 0.05
+        ADAPTIVE_THRESHOLD_FLOOR = 0.25
+        ADAPTIVE_THRESHOLD_MIN_SAMPLES = 3
+        PREPROCESS_PIPELINE_VERSION = None
+        VECTOR_INDEXED_TABLES = ()
+        def vector_index_ddl(table): return None
+        def vector_search_settings_sql(): return []
+
+# Galeri centroid in-memory (pencarian wajah tanpa round-trip ke PostgreSQL)
+from backend.gallery import (CentroidIndex, adaptive_threshold, build_prototype_rows, fuse_matches,
+                             match_margin, reject_reason)
+from backend.metrics import MetricsRegistry, StageTimer
+from backend.audio_catalog import AudioCatalog
+from backend.write_behind import WriteBehindQueue, caused_by, claim_spool_slot
+from backend.attendance_state import TodayAttendance
+from backend.attendance_schema import ATTENDANCE_TABLE, ensure_attendance_schema, ensure_monthly_partitions, is_partitioned
+from backend.vector_codec import vector_send_sql, decode_vector_binary, encode_vector_text
+from backend.bulk_copy import EMBEDDING_COPY_COLUMNS, copy_binary
+# Enrollment in-process: fungsi centroid incremental yang sama dengan index_data.py (modul bersama)
+from backend.centroid_store import delete_embeddings, get_existing_files, update_centroid_incremental
+from backend.indexing_jobs import IndexingJobManager
+from backend.gallery_snapshot import current_version, export_snapshot, gallery_fingerprint, load_snapshot
+# Koordinasi multi-worker: LISTEN/NOTIFY + advisory lock PostgreSQL
+from backend.cluster_events import (ClusterListener, CHANNEL_GALLERY_CHANGED, CHANNEL_GALLERY_SNAPSHOT,
+                                    CHANNEL_ATTENDANCE_LOGGED, CHANNEL_ATTENDANCE_RESET, CHANNEL_INDEXING_CANCEL,
+                                    LOCK_SCHEMA, LOCK_INDEXING, advisory_lock_held,
+                                    advisory_unlock, encode_attendance_event, ensure_gallery_notify_trigger, notify)
 
 # --- KONFIGURASI DB (DIBACA DARI ENV YANG DISUNTIK DOCKER) ---
 DB_HOST = os.getenv("DB_HOST", "localhost") # Akan menjadi 'postgres' di Docker
@@ -87,15 +142,129 @@ DB_NAME = os.getenv("DB_NAME", "intern_attendance_db")
 DB_USER = os.getenv("DB_USER", "macbookpro")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "deepfacepass")
 
+# --- KONFIGURASI POOL KONEKSI DB ---
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5")) # Detik menunggu koneksi kosong sebelum gagal
+DB_POOL_HEALTHCHECK_IDLE = float(os.getenv("DB_POOL_HEALTHCHECK_IDLE", "30")) # Ping 'SELECT 1' jika koneksi idle lebih lama dari ini (detik)
+
+# --- KONFIGURASI WORKER INFERENSI (DeepFace di luar event loop) ---
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2")) # Jumlah thread inferensi paralel
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "8")) # Maks. permintaan menunggu; lebih dari ini -> respon 'busy'
+# Micro-batching forward pass: wajah yang tiba dalam jendela EMBED_BATCH_WAIT_MS digabung (maks. EMBED_BATCH_MAX_SIZE).
+# Worker inferensi hanya mendeteksi; forward pass menunggu di batcher tanpa menahan thread worker, jadi batch
+# dibatasi slot inferensi (INFERENCE_WORKERS + INFERENCE_QUEUE_SIZE), bukan jumlah worker. Set 1 untuk menonaktifkan.
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "8"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "15"))
+
+# --- KONFIGURASI INDEXING (diteruskan ke backend.index_data) ---
+INDEXING_WORKERS = int(os.getenv("INDEXING_WORKERS", "1")) # Proses paralel untuk decode + deteksi
+INDEXING_BATCH_SIZE = int(os.getenv("INDEXING_BATCH_SIZE", "16")) # Wajah per forward pass embedding
+
 # FOLDER UNTUK GAMBAR
 CAPTURED_IMAGES_DIR = PROJECT_ROOT / "backend" / "captured_images"
 FACES_DIR = PROJECT_ROOT / "data" / "dataset" # KRITIS: Path Dataset
 FRONTEND_STATIC_DIR = PROJECT_ROOT / "frontend"
 AUDIO_FILES_DIR = PROJECT_ROOT / "backend" / "generated_audio"
+AUDIO_CACHE_MAX_FILES = int(os.getenv("AUDIO_CACHE_MAX_FILES", "2000")) # Batas LRU file tts_*.mp3
+
+# --- KONFIGURASI WRITE-BEHIND (gambar + log absensi) ---
+SPOOL_DIR = PROJECT_ROOT / "backend" / "spool"
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "50"))
+WRITE_BEHIND_FLUSH_MS = float(os.getenv("WRITE_BEHIND_FLUSH_MS", "200"))
+WRITE_BEHIND_FSYNC = os.getenv("WRITE_BEHIND_FSYNC", "0") == "1" # fsync tiap append (tahan mati listrik)
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv("WRITE_BEHIND_MAX_ATTEMPTS", "5")) # Gagal berulang -> dead-letter per record
+
+# --- MULTI-WORKER (gunicorn -w N, lihat backend/gunicorn_conf.py) ---
+WORKER_ID = str(os.getpid())
+# Notifikasi gallery_changed untuk lebih dari ini intern sekaligus -> sinkron penuh, bukan per intern
+GALLERY_NOTIFY_MAX_INTERNS = int(os.getenv("GALLERY_NOTIFY_MAX_INTERNS", "50"))
+INDEXING_STATUS_PATH = SPOOL_DIR / "indexing_status.json" # Status job indexing bersama antar worker
 
 # --- KONFIGURASI ZONA WAKTU ---
 local_tz = pytz.timezone('Asia/Jakarta') # <<< TAMBAH: Global Timezone (WIB)
 
+# --- GALERI CENTROID IN-MEMORY ---
+# Dimuat saat startup, di-refresh setelah indexing selesai dan setelah /delete_face.
+# Pada MATCHING_MODE "prototype", galeri berisi beberapa prototipe per intern.
+centroid_index = CentroidIndex(EMBEDDING_DIM)
+MATCH_DISTANCE_THRESHOLD = PROTOTYPE_DISTANCE_THRESHOLD if MATCHING_MODE == "prototype" else DISTANCE_THRESHOLD
+# Jumlah kandidat teratas yang dikembalikan pencarian galeri (>= 2 agar margin bisa dihitung)
+MATCH_TOP_K = max(2, int(os.getenv("MATCH_TOP_K", "3")))
+# Keputusan open-set: jarak <= ambang intern (adaptif, maks. MATCH_DISTANCE_THRESHOLD)
+# DAN selisih ke runner-up >= MATCH_MARGIN (MATCH_MARGIN dari backend/utils.py)
+
+# --- SNAPSHOT GALERI DI DISK (np.memmap, lihat backend/gallery_snapshot.py) ---
+# Galeri dimuat dari snapshot berversi (tanpa menarik semua vektor dari DB); versi baru
+# yang dipasang indexing/enrollment diumumkan lewat NOTIFY gallery_snapshot.
+GALLERY_SNAPSHOT = os.getenv("GALLERY_SNAPSHOT", "1") == "1"
+snapshot_state = {"version": None, "fingerprint": None}
+snapshot_export_lock = threading.Lock()
+snapshot_export_pending = threading.Event()
+
+# --- FUSI MULTI-FRAME (POST /recognize_burst, mode fusion WebSocket) ---
+FUSION_METHOD = os.getenv("FUSION_METHOD", "mean") # "mean" (rata-rata embedding) atau "vote"
+FUSION_MAX_FRAMES = int(os.getenv("FUSION_MAX_FRAMES", "5"))
+# Berhenti lebih awal jika jarak terbaik lolos ambang dan selisih ke runner-up >= FUSION_MARGIN
+FUSION_MARGIN = float(os.getenv("FUSION_MARGIN", "0.08"))
+
+# --- STATE ABSENSI HARI INI ---
+# Log terakhir per intern hari ini (WIB); dipakai cek duplikat dan /attendance/today.
+today_attendance = TodayAttendance()
+
+# --- EXECUTOR INFERENSI ---
+# Deteksi + forward pass ArcFace berjalan di thread pool terpisah agar event loop
+# tetap bisa melayani endpoint lain. Slot = worker + antrean; jika habis, tolak cepat.
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+inference_slots = threading.BoundedSemaphore(INFERENCE_WORKERS + INFERENCE_QUEUE_SIZE)
+# Slot yang sedang dipakai (dilaporkan /metrics); dihitung sendiri karena nilai semaphore bersifat privat
+inference_state = {"in_flight": 0}
+_inference_state_lock = threading.Lock()
+
+embedding_batcher = (
+    # Request yang bisa menunggu embedding bersamaan = slot inferensi; batch lebih besar tidak akan pernah penuh
+    EmbeddingBatcher(min(EMBED_BATCH_MAX_SIZE, INFERENCE_WORKERS + INFERENCE_QUEUE_SIZE), EMBED_BATCH_WAIT_MS)
+    if EmbeddingBatcher is not None and EMBED_BATCH_MAX_SIZE > 1 else None
+)
+
+# Status warm-up model (dipakai endpoint /ready)
+model_state = {"ready": False, "warmup_seconds": None, "error": None}
+
+class InferenceBusyError(Exception):
+    """Dilempar saat antrean inferensi penuh."""
+
+def acquire_inference_slot():
+    """Mengambil satu slot inferensi tanpa menunggu. Melempar InferenceBusyError jika semua slot terpakai."""
+    if not inference_slots.acquire(blocking=False):
+        raise InferenceBusyError(f"Antrean inferensi penuh ({INFERENCE_WORKERS} worker + {INFERENCE_QUEUE_SIZE} antrean).")
+    with _inference_state_lock:
+        inference_state["in_flight"] += 1
+
+def release_inference_slot():
+    with _inference_state_lock:
+        inference_state["in_flight"] -= 1
+    inference_slots.release()
+
+# --- METRIK LATENSI (/metrics) ---
+metrics = MetricsRegistry("absensi")
+metrics.describe("recognize_stage_seconds", "histogram", "Durasi tiap tahap /recognize (detik).")
+metrics.describe("recognize_latency_seconds", "histogram", "Latensi total /recognize (detik).")
+metrics.describe("recognize_requests_total", "counter", "Jumlah request /recognize per status hasil.")
+metrics.gauge("inference_in_flight", "Request inferensi yang sedang memegang slot (worker + antrean).",
+              lambda: inference_state["in_flight"])
+metrics.gauge("gallery_vectors", "Jumlah vektor di galeri in-memory.", lambda: len(centroid_index))
+metrics.gauge("tts_queue_depth", "Pesan TTS yang menunggu disintesis.", lambda: audio_catalog.queue_depth)
+metrics.gauge("write_behind_queue_depth", "Log absensi + gambar yang belum ditulis ke DB/disk.",
+              lambda: attendance_writer.depth)
+metrics.gauge("write_behind_dead_lettered", "Log absensi yang gagal terus dan dipindah ke file dead-letter.",
+              lambda: attendance_writer.stats["dead_lettered"])
+metrics.gauge("write_behind_failed_batches", "Percobaan tulis batch write-behind yang gagal.",
+              lambda: attendance_writer.stats["failed_batches"])
+
+# Jumlah sesi WebSocket kiosk yang aktif
+ws_state = {"sessions": 0}
+metrics.gauge("ws_sessions", "Sesi WebSocket /ws/recognize yang aktif.", lambda: ws_state["sessions"])
+
 # --- KONFIGURASI SCHEDULER ---
 scheduler = None
 DAILY_RESET_HOUR = 9 # Pukul 00:00
@@ -157,20 +326,52 @@ def format_time_to_hms(time_obj) -> str:
         except AttributeError:
              return str(time_obj)
 
-def generate_audio_file(filename: str, text: str):
-    """Menghasilkan dan menyimpan file audio MP3 menggunakan gTTS jika belum ada."""
-    audio_path = AUDIO_FILES_DIR / filename
-    os.makedirs(AUDIO_FILES_DIR, exist_ok=True)
+def synthesize_tts(text: str, path: str):
+    """Menyintesis teks ke file MP3 menggunakan gTTS (dipanggil dari thread katalog audio)."""
+    tts = gTTS(text=text, lang='id')
+    tts.save(path)
+
+# --- KATALOG AUDIO TTS ---
+# Audio sistem bernama tetap; audio personal per intern diberi nama dari hash teksnya.
+# Request tidak pernah menunggu gTTS: jika audio personal belum siap, dipakai fallback generik.
+SYSTEM_AUDIO = {
+    "S002.mp3": "Wajah tidak terdeteksi.",
+    "S003.mp3": "Wajah Anda belum terdaftar.",
+    "S004.mp3": "Kesalahan server terjadi.",
+    "S005.mp3": "Kesalahan tipe absensi.",
+    "S006.mp3": "Server sedang sibuk, silakan coba lagi.",
+    "S007.mp3": "Absensi masuk berhasil.",
+    "S008.mp3": "Absensi pulang berhasil.",
+    "S009.mp3": "Absensi masuk Anda terlambat.",
+    "S010.mp3": "Anda pulang cepat.",
+    "S011.mp3": "Anda sudah melakukan absensi.",
+    "S012.mp3": "Wajah kurang jelas, silakan coba lagi.",
+}
 
-    if audio_path.exists():
-        return
+audio_catalog = AudioCatalog(AUDIO_FILES_DIR, synthesize_tts, max_files=AUDIO_CACHE_MAX_FILES)
 
-    try:
-        print(f"   -> 🔊 Generating TTS file: {filename} for text: '{text}'...")
-        tts = gTTS(text=text, lang='id')
-        tts.save(str(audio_path))
-    except Exception as e:
-        print(f"❌ ERROR: Gagal generate file audio {filename}. Pastikan Anda memiliki koneksi internet: {e}")
+def attendance_message(name: str, type_absensi: str, attendance_status: str):
+    """Teks TTS personal + audio fallback generik untuk absensi yang berhasil dicatat."""
+    if type_absensi == 'IN':
+        if attendance_status == "Terlambat":
+            return f"Maaf, {name}. Absensi masuk Anda terlambat.", "S009.mp3"
+        return f"Selamat datang, {name}.", "S007.mp3"
+    if attendance_status == "Pulang Cepat":
+        return f"Peringatan, {name}. Anda Pulang Cepat.", "S010.mp3"
+    return f"Terima kasih, {name}.", "S008.mp3"
+
+def duplicate_message(name: str, type_absensi: str) -> str:
+    """Teks TTS untuk absensi duplikat."""
+    return f"{name}, Anda sudah Absen Masuk hari ini." if type_absensi == 'IN' else f"Absensi Pulang {name} sudah dicatat."
+
+def intern_audio_messages(name: str) -> List[str]:
+    """Semua varian pesan personal satu intern (untuk pre-generate)."""
+    messages = []
+    for type_absensi, statuses in (('IN', ("Tepat Waktu", "Terlambat")), ('OUT', ("Tepat Waktu", "Pulang Cepat"))):
+        for attendance_status in statuses:
+            messages.append(attendance_message(name, type_absensi, attendance_status)[0])
+        messages.append(duplicate_message(name, type_absensi))
+    return messages
 
 # --- LOGIKA VALIDASI ABSENSI KRITIS (Waktu WIB) ---
 
@@ -198,35 +399,153 @@ def check_attendance_status(kategori: str, type_absensi: str, log_time: datetime
 
 # --- FUNGSI DATABASE HELPERS (POSTGRESQL) ---
 
-def connect_db():
-    """Membuat koneksi ke Database Vektor/Log (PostgreSQL) dan mendaftarkan tipe vector."""
-    conn = None
-    try:
-        conn = psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASSWORD, port=DB_PORT)
+_vector_extension_ready = False # Ekstensi pgvector sudah dicek (sekali per proses)
+
+def prepare_connection(conn):
+    """
+    Menyiapkan satu koneksi baru dari pool: memastikan ekstensi pgvector aktif
+    dan menerapkan parameter query indeks ANN. Tidak ada typecaster teks 'vector':
+    kolom vector dibaca lewat vector_send() (bytea) dan ditulis lewat COPY binary.
+    """
+    global _vector_extension_ready
+    if not _vector_extension_ready:
         with conn.cursor() as cur:
-            cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
-            conn.commit()
-            cur.execute("SELECT oid FROM pg_type WHERE typname = 'vector'")
+            cur.execute("SELECT 1 FROM pg_type WHERE typname = 'vector'")
             row = cur.fetchone()
+            if not row:
+                cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
+                cur.execute("SELECT 1 FROM pg_type WHERE typname = 'vector'")
+                row = cur.fetchone()
             if not row:
                 raise Exception("❌ Ekstensi pgvector belum aktif di database.")
-            vector_oid = row[0]
+        conn.commit()
+        _vector_extension_ready = True
 
-        def cast_vector(data, cur):
-            if data is None: return None
-            cleaned_data = data.strip('{}[]')
-            return np.array([float(x.strip()) for x in cleaned_data.split(',')])
+    # Parameter query indeks ANN (hnsw.ef_search / ivfflat.probes) berlaku untuk seluruh sesi koneksi
+    settings = vector_search_settings_sql()
+    if settings:
+        with conn.cursor() as cur:
+            for statement in settings:
+                cur.execute(statement)
+        conn.commit()
 
-        psycopg2.extensions.register_type(
-            psycopg2.extensions.new_type((vector_oid,), 'vector', cast_vector),
-            conn
-        )
+class VectorConnectionPool(psycopg2.pool.ThreadedConnectionPool):
+    """
+    Pool koneksi PostgreSQL thread-safe untuk API.
+    - Ekstensi pgvector + parameter indeks ANN disiapkan sekali per koneksi (saat koneksi fisik dibuat).
+    - acquire() menunggu hingga DB_POOL_TIMEOUT jika semua koneksi sedang dipakai.
+    - Koneksi yang putus/idle terlalu lama dicek (health check) sebelum dipinjamkan.
+    """
+
+    def __init__(self, minconn, maxconn, timeout, healthcheck_idle, *args, **kwargs):
+        self.timeout = timeout
+        self.healthcheck_idle = healthcheck_idle
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._stats_lock = threading.Lock()
+        self._last_used = {} # id(conn) -> waktu terakhir dikembalikan ke pool
+        self.stats = {"created": 0, "checkouts": 0, "timeouts": 0, "discarded": 0, "wait_seconds_total": 0.0}
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def _connect(self, key=None):
+        conn = super()._connect(key)
+        self._last_used[id(conn)] = time.time()
+        try:
+            prepare_connection(conn)
+        except Exception as e:
+            print(f"   ⚠️ PERINGATAN: Gagal menyiapkan koneksi baru (pgvector / indeks ANN): {e}")
+        self._count("created")
         return conn
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        idle_for = time.time() - self._last_used.get(id(conn), 0)
+        if idle_for < self.healthcheck_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def acquire(self):
+        """Meminjam satu koneksi sehat dari pool (blocking hingga timeout)."""
+        wait_start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            self._count("timeouts")
+            raise psycopg2.pool.PoolError(f"Pool koneksi DB penuh ({self.maxconn} koneksi), timeout {self.timeout}s.")
+        self._count("wait_seconds_total", time.perf_counter() - wait_start)
+        try:
+            conn = self.getconn()
+            if not self._is_healthy(conn):
+                self._count("discarded")
+                self._last_used.pop(id(conn), None)
+                self.putconn(conn, close=True)
+                conn = self.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        self._count("checkouts")
+        return conn
+
+    def release(self, conn):
+        """Mengembalikan koneksi ke pool (transaksi terbuka di-rollback oleh pool)."""
+        try:
+            if conn.closed:
+                self._last_used.pop(id(conn), None)
+            else:
+                self._last_used[id(conn)] = time.time()
+            self.putconn(conn, close=bool(conn.closed))
+        finally:
+            self._slots.release()
+
+    def snapshot(self) -> Dict[str, object]:
+        """Statistik pool untuk endpoint monitoring."""
+        with self._lock:
+            in_use, idle = len(self._used), len(self._pool)
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["wait_seconds_total"] = round(stats["wait_seconds_total"], 4)
+        return {"min": self.minconn, "max": self.maxconn, "in_use": in_use, "idle": idle, **stats}
+
+db_pool: Optional[VectorConnectionPool] = None
+_db_pool_lock = threading.Lock()
+
+def get_db_pool() -> VectorConnectionPool:
+    """Membuat pool koneksi secara lazy (pertama kali dibutuhkan)."""
+    global db_pool
+    if db_pool is None:
+        with _db_pool_lock:
+            if db_pool is None:
+                db_pool = VectorConnectionPool(
+                    DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT, DB_POOL_HEALTHCHECK_IDLE,
+                    host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASSWORD, port=DB_PORT
+                )
+                print(f"✅ Pool koneksi DB dibuat (min={DB_POOL_MIN}, max={DB_POOL_MAX}).")
+    return db_pool
+
+def connect_db():
+    """Meminjam koneksi dari pool Database Vektor/Log (PostgreSQL). Kembalikan dengan release_db()."""
+    try:
+        return get_db_pool().acquire()
     except psycopg2.Error as e:
         print(f"❌ Gagal koneksi ke Database PostgreSQL: {e}")
-        print(f"   -> Mencoba terhubung ke {DB_HOST}:{DB_PORT}")
-        if conn: conn.close()
-        raise Exception("Database PostgreSQL tidak terhubung/konfigurasi salah.")
+        print(f"   -> Mencoba terhubung ke {DB_HOST}:{DB_PORT}")
+        # Error asli dirantai (__cause__) agar pemanggil tetap bisa membedakan DB mati dari error lain
+        raise Exception("Database PostgreSQL tidak terhubung/konfigurasi salah.") from e
+
+def release_db(conn):
+    """Mengembalikan koneksi yang dipinjam connect_db() ke pool."""
+    if db_pool is not None:
+        db_pool.release(conn)
+    else:
+        conn.close()
 
 def initialize_db():
     """Memastikan tabel ada saat startup (SKEMA BENAR)."""
@@ -234,6 +553,8 @@ def initialize_db():
     try:
         conn = connect_db()
         cursor = conn.cursor()
+        # Worker gunicorn start bersamaan: DDL di bawah dijalankan bergiliran
+        cursor.execute("SELECT pg_advisory_lock(%s)", (LOCK_SCHEMA,))
         cursor.execute("CREATE EXTENSION IF NOT EXISTS vector;")
 
         cursor.execute("""
@@ -244,18 +565,8 @@ def initialize_db():
                 kategori TEXT
             );
         """)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS attendance_logs (
-                log_id SERIAL PRIMARY KEY,
-                intern_id INTEGER REFERENCES interns(id),
-                intern_name TEXT NOT NULL,
-                instansi TEXT,
-                kategori TEXT,
-                image_url TEXT,
-                absent_at TIMESTAMP WITHOUT TIME ZONE,
-                type TEXT NOT NULL DEFAULT 'IN'
-            );
-        """)
+        # attendance_logs: kolom absent_date + indeks komposit (+ partisi bulanan jika diaktifkan)
+        ensure_attendance_schema(cursor, get_current_wib_datetime().date())
         cursor.execute(f"""
             CREATE TABLE IF NOT EXISTS intern_embeddings (
                 id SERIAL PRIMARY KEY,
@@ -267,6 +578,22 @@ def initialize_db():
                 file_path TEXT NOT NULL
             );
         """)
+        # Migrasi: sidik file untuk indexing incremental berbasis hash konten + versi pipeline preprocessing
+        cursor.execute("""
+            ALTER TABLE intern_embeddings
+                ADD COLUMN IF NOT EXISTS content_hash TEXT,
+                ADD COLUMN IF NOT EXISTS file_mtime DOUBLE PRECISION,
+                ADD COLUMN IF NOT EXISTS file_size BIGINT,
+                ADD COLUMN IF NOT EXISTS pipeline_version SMALLINT;
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS intern_centroid_sums (
+                intern_id INTEGER PRIMARY KEY REFERENCES interns(id) ON DELETE CASCADE,
+                embedding_sum BYTEA NOT NULL,
+                embedding_count INTEGER NOT NULL,
+                updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+            );
+        """)
         cursor.execute(f"""
             CREATE TABLE IF NOT EXISTS intern_centroids (
                 id SERIAL PRIMARY KEY,
@@ -277,6 +604,10 @@ def initialize_db():
                 embedding VECTOR({EMBEDDING_DIM}) NOT NULL
             );
         """)
+        # Migrasi: ambang jarak adaptif per intern (diisi oleh index_data.py)
+        cursor.execute("ALTER TABLE intern_centroids ADD COLUMN IF NOT EXISTS match_threshold REAL;")
+        # NOTIFY gallery_changed per intern saat centroid berubah (invalidasi galeri antar worker)
+        ensure_gallery_notify_trigger(cursor)
 
         # Memasukkan data awal interns (jika belum ada)
         initial_interns = [
@@ -300,6 +631,18 @@ def initialize_db():
         conn.commit()
         print(f"✅ PostgreSQL Database berhasil diinisialisasi.")
 
+        # Indeks ANN (HNSW/IVFFlat, cosine) untuk kolom embedding; gagal -> tetap jalan dengan sequential scan
+        for table in VECTOR_INDEXED_TABLES:
+            ddl = vector_index_ddl(table)
+            if ddl is None:
+                continue
+            try:
+                cursor.execute(ddl)
+                conn.commit()
+            except psycopg2.Error as e:
+                conn.rollback()
+                print(f"⚠️ Gagal membuat indeks ANN untuk '{table}' (versi pgvector?): {e}")
+
         os.makedirs(CAPTURED_IMAGES_DIR, exist_ok=True)
         os.makedirs(FACES_DIR, exist_ok=True)
         os.makedirs(AUDIO_FILES_DIR, exist_ok=True)
@@ -310,7 +653,31 @@ def initialize_db():
         if conn: conn.rollback()
         raise Exception(f"Gagal inisialisasi database PostgreSQL: {e}")
     finally:
-        if conn: conn.close()
+        if conn:
+            try:
+                advisory_unlock(cursor, LOCK_SCHEMA)
+                conn.commit()
+            except psycopg2.Error:
+                pass  # Koneksi putus: lock sesi ikut lepas
+            release_db(conn)
+
+def pregenerate_intern_audio():
+    """Mengantrekan sintesis audio personal untuk semua intern terdaftar (tidak menunggu)."""
+    conn = None
+    try:
+        conn = connect_db()
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT name FROM interns ORDER BY name")
+            names = [row[0] for row in cursor.fetchall()]
+        conn.commit()
+    except Exception as e:
+        print(f"⚠️ Gagal membaca daftar intern untuk pre-generate audio: {e}")
+        return
+    finally:
+        if conn: release_db(conn)
+
+    queued = audio_catalog.prefetch(message for name in names for message in intern_audio_messages(name))
+    print(f"🔊 Katalog audio: {queued} file diantrekan untuk {len(names)} intern.")
 
 def get_or_create_intern(name: str, instansi: str = "Intern", kategori: str = "Unknown"):
     """Mendapatkan ID intern yang sudah ada atau membuat entri baru di PostgreSQL."""
@@ -333,119 +700,634 @@ def get_or_create_intern(name: str, instansi: str = "Intern", kategori: str = "U
     except Exception as e:
         print(f"❌ Gagal mendapatkan/membuat entri intern di PostgreSQL: {e}")
         if conn: conn.rollback()
-        raise Exception(f"Gagal mengelola data intern: {e}")
+        raise Exception(f"Gagal mengelola data intern: {e}") from e
     finally:
-        if conn: conn.close()
+        if conn: release_db(conn)
 
-def get_latest_attendance(intern_name: str) -> Optional[Dict[str, str]]:
-    """Mendapatkan log absensi terakhir untuk intern hari ini (IN/OUT)."""
+def load_today_attendance() -> int:
+    """Memuat state absensi hari ini dari DB + log yang masih di antrean write-behind."""
+    today = get_current_wib_datetime().date()
     conn = None
     try:
         conn = connect_db()
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT intern_name, type, absent_at
-            FROM attendance_logs
-            WHERE intern_name = %s AND absent_at::date = CURRENT_DATE
-            ORDER BY absent_at DESC
-            LIMIT 1
-            """,
-            (intern_name,)
-        )
-        result = cursor.fetchone()
-        if result:
-            return {"name": result[0], "type": result[1], "absent_at": result[2].isoformat()}
-        return None
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT DISTINCT ON (intern_name) intern_name, instansi, kategori, type, absent_at, image_url
+                FROM attendance_logs
+                WHERE absent_date = %s
+                ORDER BY intern_name, absent_at DESC
+            """, (today,))
+            rows = cursor.fetchall()
+        conn.commit()
+    finally:
+        if conn: release_db(conn)
+
+    entries = [
+        {"name": name, "instansi": instansi, "kategori": kategori, "type": log_type, "absent_at": absent_at, "image_url": image_url}
+        for name, instansi, kategori, log_type, absent_at, image_url in rows
+    ]
+    entries.extend(
+        {"name": r["intern_name"], "instansi": r["instansi"], "kategori": r["kategori"], "type": r["type"],
+         "absent_at": datetime.fromisoformat(r["absent_at"]), "image_url": r["image_url"]}
+        for r in attendance_writer.pending_records()
+    )
+    today_attendance.load(today, entries)
+    print(f"✅ State absensi hari ini dimuat: {len(today_attendance.entries(today))} intern.")
+    return len(rows)
+
+def ensure_today_attendance() -> bool:
+    """Memastikan state hari ini sudah dimuat (misal: DB sempat gagal saat startup)."""
+    if today_attendance.loaded:
+        return True
+    try:
+        load_today_attendance()
+        return True
     except Exception as e:
-        print(f"❌ Gagal memeriksa log absensi terakhir: {e}")
+        print(f"❌ Gagal memuat state absensi hari ini: {e}")
+        return False
+
+def get_latest_attendance(intern_name: str) -> Optional[Dict[str, str]]:
+    """Mendapatkan log absensi terakhir untuk intern hari ini (IN/OUT) dari state in-memory."""
+    if not ensure_today_attendance():
         return None
+    entry = today_attendance.latest(intern_name, get_current_wib_datetime().date())
+    if entry:
+        return {"name": entry["name"], "type": entry["type"], "absent_at": entry["absent_at"].isoformat()}
+    return None
+
+
+def log_attendance(intern_name: str, instansi: str, kategori: str, image_url: str, type_absensi: str,
+                   absent_at: Optional[datetime] = None, image_bytes: Optional[bytes] = None,
+                   image_filename: Optional[str] = None) -> dict:
+    """
+    Mengantrekan log absensi ke write-behind (insert per batch oleh flush_attendance_batch).
+    Gambar (thumbnail kecil) ditulis langsung agar image_url di respons sudah bisa dibuka;
+    hanya jika gagal, gambar ikut di spool dan ditulis ulang saat flush.
+    """
+    wib_time = (absent_at or get_current_wib_datetime()).replace(tzinfo=None)
+    record = {
+        "intern_name": intern_name, "instansi": instansi, "kategori": kategori,
+        "image_url": image_url, "type": type_absensi, "absent_at": wib_time.isoformat(),
+    }
+    if image_bytes is not None and image_filename:
+        try:
+            with open(CAPTURED_IMAGES_DIR / image_filename, "wb") as f:
+                f.write(image_bytes)
+        except OSError as file_error:
+            print(f"⚠️ Gambar {image_filename} gagal ditulis langsung ({file_error}), ditunda ke write-behind.")
+            record["image_filename"] = image_filename
+            record["image_b64"] = base64.b64encode(image_bytes).decode("ascii")
+    record["id"] = attendance_writer.enqueue(record)
+    today_attendance.record({
+        "name": intern_name, "instansi": instansi, "kategori": kategori,
+        "type": type_absensi, "absent_at": wib_time, "image_url": image_url,
+    })
+    return record
+
+def flush_attendance_batch(records: List[dict]):
+    """
+    Handler write-behind: simpan gambar lalu insert semua log dalam satu transaksi.
+    Idempoten: gambar ditimpa, log bentrok spool_id diabaikan (aman untuk replay).
+    """
+    for record in records:
+        if record.get("image_b64"):
+            try:
+                with open(CAPTURED_IMAGES_DIR / record["image_filename"], "wb") as f:
+                    f.write(base64.b64decode(record["image_b64"]))
+            except Exception as file_error:
+                print(f"❌ GAGAL SIMPAN GAMBAR: {record['intern_name']}. Error: {file_error}")
+
+    intern_ids = {}
+    for record in records:
+        name = record["intern_name"]
+        if name not in intern_ids:
+            intern_ids[name], _, _ = get_or_create_intern(name, record["instansi"], record["kategori"])
+
+    conn = connect_db()
+    try:
+        with conn.cursor() as cursor:
+            psycopg2.extras.execute_values(
+                cursor,
+                """
+                INSERT INTO attendance_logs (intern_id, intern_name, instansi, kategori, image_url, absent_at, type, spool_id)
+                VALUES %s
+                ON CONFLICT (spool_id, absent_at) DO NOTHING
+                """,
+                [
+                    (intern_ids[r["intern_name"]], r["intern_name"], r["instansi"], r["kategori"],
+                     r["image_url"], r["absent_at"], r["type"], r["id"])
+                    for r in records
+                ],
+            )
+            # Worker lain memperbarui state absensi hari ini (cek duplikat) saat transaksi ini commit
+            for record in records:
+                notify(cursor, CHANNEL_ATTENDANCE_LOGGED, encode_attendance_event(record, WORKER_ID))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
     finally:
-        if conn: conn.close()
+        release_db(conn)
+
+# Spool per worker (slot dikunci flock); spool worker yang sudah mati diadopsi di sini
+_spool_path, _orphan_spools, _release_orphan_spools = claim_spool_slot(SPOOL_DIR, "attendance")
+attendance_writer = WriteBehindQueue(
+    _spool_path, flush_attendance_batch,
+    batch_size=WRITE_BEHIND_BATCH_SIZE, flush_interval_ms=WRITE_BEHIND_FLUSH_MS, fsync=WRITE_BEHIND_FSYNC,
+    adopt_paths=_orphan_spools, max_attempts=WRITE_BEHIND_MAX_ATTEMPTS,
+    # DB tidak terjangkau / pool penuh bukan kesalahan record: coba ulang tanpa dead-letter.
+    # connect_db membungkus error psycopg2, jadi rantai penyebabnya ikut diperiksa.
+    is_transient=lambda e: caused_by(e, (psycopg2.OperationalError, psycopg2.InterfaceError, psycopg2.pool.PoolError)),
+)
+_release_orphan_spools()
 
+def purge_attendance_until(day: date, cutoff: datetime) -> tuple:
+    """
+    Menghapus log tanggal `day` sampai `cutoff` (naive WIB) dari DB DAN dari antrean
+    write-behind worker ini. Penulisan ditahan selama purge: batch yang sedang ditulis
+    diselesaikan dulu, sehingga tidak ada log lama yang masuk ke DB setelah DELETE.
+    Mengembalikan (log dihapus dari DB, record dibuang dari antrean).
+    """
+    with attendance_writer.paused():
+        discarded = attendance_writer.discard(
+            lambda r: (absent_at := datetime.fromisoformat(r["absent_at"])).date() == day and absent_at <= cutoff
+        )
+        conn = connect_db()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM attendance_logs WHERE absent_date = %s AND absent_at <= %s", (day, cutoff))
+                deleted_count = cursor.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            release_db(conn)
+        today_attendance.clear(day)
+    return deleted_count, discarded
 
-def log_attendance(intern_name: str, instansi: str, kategori: str, image_url: str, type_absensi: str):
-    """Mencatat log absensi ke database PostgreSQL (dengan jenis 'IN' atau 'OUT')."""
+def reset_attendance_logs():
+    """Menghapus SEMUA log absensi HARI INI dari tabel attendance_logs dan antrean write-behind."""
+    cutoff = get_current_wib_datetime().replace(tzinfo=None)
+    try:
+        deleted_count, discarded = purge_attendance_until(cutoff.date(), cutoff)
+        # Worker lain membuang antrean mereka sendiri (dan log yang ter-commit setelah DELETE ini)
+        conn = connect_db()
+        try:
+            with conn.cursor() as cursor:
+                notify(cursor, CHANNEL_ATTENDANCE_RESET, json.dumps({"origin": WORKER_ID, "cutoff": cutoff.isoformat()}))
+            conn.commit()
+        finally:
+            release_db(conn)
+        print(f"✅ [SCHEDULER] RESET ABSENSI BERHASIL: {deleted_count} log hari ini dihapus, {discarded} log di antrean dibuang.")
+        return deleted_count + discarded
+    except Exception as e:
+        print(f"❌ Gagal mereset log absensi PostgreSQL: {e}")
+        raise
+
+def maintain_attendance_partitions():
+    """Job harian: siapkan partisi bulanan attendance_logs ke depan (jika tabel dipartisi)."""
     conn = None
     try:
-        intern_id, _, _ = get_or_create_intern(intern_name, instansi, kategori)
         conn = connect_db()
-        cursor = conn.cursor()
-        wib_time = get_current_wib_datetime().replace(tzinfo=None)
-        cursor.execute(
-            "INSERT INTO attendance_logs (intern_id, intern_name, instansi, kategori, image_url, absent_at, type) VALUES (%s, %s, %s, %s, %s, %s, %s)",
-            (intern_id, intern_name, instansi, kategori, image_url, wib_time, type_absensi)
-        )
+        with conn.cursor() as cursor:
+            if not is_partitioned(cursor, ATTENDANCE_TABLE):
+                conn.commit()
+                return
+            created = ensure_monthly_partitions(cursor, get_current_wib_datetime().date())
         conn.commit()
-        return intern_id
+        if created:
+            print(f"✅ [SCHEDULER] {created} partisi bulanan attendance_logs dibuat.")
     except Exception as e:
-        print(f"❌ Gagal mencatat log absensi: {e}")
+        print(f"❌ Gagal menyiapkan partisi attendance_logs: {e}")
         if conn: conn.rollback()
-        return None
     finally:
-        if conn: conn.close()
+        if conn: release_db(conn)
 
-def reset_attendance_logs():
-    """Menghapus SEMUA log absensi HARI INI dari tabel attendance_logs."""
+def prototype_threshold(distances):
+    """Ambang adaptif mode prototipe: sebaran embedding terhadap prototipe terdekatnya."""
+    return adaptive_threshold(distances, ceiling=MATCH_DISTANCE_THRESHOLD, floor=ADAPTIVE_THRESHOLD_FLOOR,
+                              slack=ADAPTIVE_THRESHOLD_SLACK, percentile=ADAPTIVE_THRESHOLD_PERCENTILE,
+                              min_samples=ADAPTIVE_THRESHOLD_MIN_SAMPLES)
+
+def load_gallery_rows(cursor, intern_id: Optional[int] = None) -> tuple:
+    """
+    Baris galeri (intern_id, name, instansi, kategori, vektor) sesuai MATCHING_MODE,
+    beserta ambang adaptif {intern_id: ambang}. intern_id membatasi ke satu intern.
+    """
+    # Vektor dibaca dalam format biner (bytea) -> np.frombuffer, tanpa parsing teks
+    if MATCHING_MODE == "prototype":
+        where = "WHERE e.intern_id = %s" if intern_id is not None else ""
+        cursor.execute(f"""
+            SELECT e.intern_id, i.name, i.instansi, i.kategori, {vector_send_sql('e.embedding')}
+            FROM intern_embeddings e
+            JOIN interns i ON i.id = e.intern_id
+            {where}
+        """, (intern_id,) if intern_id is not None else None)
+        return build_prototype_rows(
+            ((intern_id, name, instansi, kategori, decode_vector_binary(raw))
+             for intern_id, name, instansi, kategori, raw in cursor.fetchall()),
+            PROTOTYPES_PER_INTERN, threshold_fn=prototype_threshold
+        )
+
+    where = "WHERE intern_id = %s" if intern_id is not None else ""
+    cursor.execute(f"SELECT intern_id, name, instansi, kategori, {vector_send_sql()}, match_threshold FROM intern_centroids {where}",
+                   (intern_id,) if intern_id is not None else None)
+    rows, thresholds = [], {}
+    for intern_id, name, instansi, kategori, raw, threshold in cursor.fetchall():
+        rows.append((intern_id, name, instansi, kategori, decode_vector_binary(raw)))
+        if threshold is not None:
+            thresholds[intern_id] = float(threshold)
+    return rows, thresholds
+
+def search_nearest_db(embedding, k: int = 1) -> list:
+    """
+    Pencarian k intern terdekat langsung di PostgreSQL (memakai indeks ANN + ef_search/probes sesi).
+    Cadangan jika galeri in-memory belum pernah berhasil dimuat.
+    Mengembalikan [(intern_id, name, instansi, kategori, distance), ...].
+    """
     conn = None
     try:
         conn = connect_db()
         cursor = conn.cursor()
-        cursor.execute("DELETE FROM attendance_logs WHERE absent_at::date = CURRENT_DATE")
-        deleted_count = cursor.rowcount
-        conn.commit()
-        print(f"✅ [SCHEDULER] RESET ABSENSI BERHASIL: {deleted_count} log hari ini dihapus.")
-        return deleted_count
+        table = "intern_embeddings" if MATCHING_MODE == "prototype" else "intern_centroids"
+        rows_per_intern = PROTOTYPES_PER_INTERN if MATCHING_MODE == "prototype" else 1
+        # psycopg2 hanya mengirim parameter teks (COPY binary tidak berlaku untuk query),
+        # jadi vektor kueri tetap literal teks tetapi di-parse sekali lewat CTE
+        cursor.execute(f"""
+            WITH query AS (SELECT %s::vector AS embedding)
+            SELECT t.intern_id, t.name, t.instansi, t.kategori, t.embedding <=> query.embedding AS distance
+            FROM {table} t, query
+            ORDER BY t.embedding <=> query.embedding
+            LIMIT %s
+        """, (encode_vector_text(embedding), k * rows_per_intern))
+        results, seen = [], set()
+        for row in cursor.fetchall():
+            if row[0] not in seen:
+                seen.add(row[0])
+                results.append(tuple(row))
+        return results[:k]
+    finally:
+        if conn: release_db(conn)
+
+def search_gallery(embedding, k: int) -> list:
+    """k intern terdekat dari galeri in-memory (atau PostgreSQL jika galeri belum dimuat)."""
+    if centroid_index.loaded_at is not None:
+        return centroid_index.search_topk(embedding, k)
+    return search_nearest_db(embedding, k)
+
+def match_threshold_for(intern_id: int) -> float:
+    """Ambang jarak intern: adaptif dari galeri in-memory, atau ambang global."""
+    return centroid_index.threshold_for(intern_id, MATCH_DISTANCE_THRESHOLD)
+
+def match_decision(topk: list, margin: float = MATCH_MARGIN) -> Optional[str]:
+    """None jika kandidat terbaik diterima, atau alasan penolakan ("empty", "distance", "ambiguous")."""
+    if not topk:
+        return "empty"
+    return reject_reason(topk, match_threshold_for(topk[0][0]), margin)
+
+def is_fusion_confident(topk: list) -> bool:
+    """Syarat berhenti lebih awal pada fusi multi-frame (margin lebih ketat: FUSION_MARGIN)."""
+    return match_decision(topk, max(MATCH_MARGIN, FUSION_MARGIN)) is None
+
+def match_embeddings(emb_list: list):
+    """
+    Top-k kandidat untuk satu atau beberapa embedding (fusi multi-frame, berhenti lebih awal
+    begitu yakin). Mengembalikan (top-k, jumlah frame terpakai).
+    """
+    return fuse_matches(search_gallery, emb_list, MATCH_TOP_K, is_fusion_confident, method=FUSION_METHOD)
+
+def refresh_centroid_index() -> int:
+    """
+    Memuat ulang galeri in-memory (centroid atau prototipe) dari database. Mengembalikan jumlah intern.
+    Error DB diteruskan ke pemanggil (galeri lama tetap dipakai); hanya startup yang menelannya.
+    """
+    conn = None
+    try:
+        conn = connect_db()
+        cursor = conn.cursor()
+        rows, thresholds = load_gallery_rows(cursor)
+        total_vectors = centroid_index.load(rows, thresholds)
+        print(f"✅ Galeri in-memory ({MATCHING_MODE}) dimuat: {centroid_index.intern_count} wajah, {total_vectors} vektor, "
+              f"{centroid_index.adaptive_count} ambang adaptif.")
+        return centroid_index.intern_count
     except Exception as e:
-        print(f"❌ Gagal mereset log absensi PostgreSQL: {e}")
+        print(f"❌ Gagal memuat galeri in-memory: {e}")
+        raise
     finally:
-        if conn: conn.close()
+        if conn: release_db(conn)
 
-# --- FUNGSI SUBPROCESS YANG DIPERBAIKI (SANGAT KRITIS) ---
+def refresh_intern_gallery(intern_id: int) -> int:
+    """
+    Memperbarui galeri in-memory untuk satu intern saja (setelah enrollment).
+    Jika galeri belum pernah dimuat, dimuat penuh. Mengembalikan jumlah vektor intern tersebut.
+    """
+    if centroid_index.loaded_at is None:
+        refresh_centroid_index()
+        return 0
+    conn = None
+    try:
+        conn = connect_db()
+        with conn.cursor() as cursor:
+            rows, thresholds = load_gallery_rows(cursor, intern_id)
+        return centroid_index.update_intern(intern_id, rows, thresholds.get(intern_id))
+    finally:
+        if conn: release_db(conn)
 
-def run_indexing_subprocess():
-    """
-    Fungsi wrapper yang akan dijalankan oleh Background Task.
-    Meneruskan env var yang benar ke subprocess.
-    """
-    print("🚀 [Background Task] Memulai subprocess index_data.py...")
-    try:
-        command = [sys.executable, "-u", "-m", "backend.index_data"]
-
-        # --- PERUBAHAN KRITIS: Teruskan Environment Variables ---
-        current_env = os.environ.copy()
-        current_env["DB_HOST"] = DB_HOST
-        current_env["DB_PORT"] = DB_PORT
-        current_env["DB_NAME"] = DB_NAME
-        current_env["DB_USER"] = DB_USER
-        current_env["DB_PASSWORD"] = DB_PASSWORD
-        # Juga teruskan PYTHONPATH jika ada, penting untuk import
-        if 'PYTHONPATH' in os.environ:
-             current_env['PYTHONPATH'] = os.environ['PYTHONPATH']
-        # ----------------------------------------------------
-
-        process = subprocess.run(
-            command,
-            cwd=str(PROJECT_ROOT),
-            capture_output=True,
-            text=True,
-            check=True,
-            env=current_env  # <<< Menggunakan env yang dimodifikasi
+def apply_gallery_snapshot(snapshot) -> int:
+    """
+    Memasang snapshot ke galeri in-memory. Mode centroid memakai matriks memmap apa adanya;
+    mode prototipe membangun prototipe dari matriks embedding snapshot (tanpa query DB).
+    """
+    if MATCHING_MODE == "prototype":
+        rows, thresholds = build_prototype_rows(
+            ((*meta, vector) for meta, vector in zip(snapshot.embedding_meta, snapshot.embeddings)),
+            PROTOTYPES_PER_INTERN, threshold_fn=prototype_threshold
         )
+        total_vectors = centroid_index.load(rows, thresholds)
+    else:
+        total_vectors = centroid_index.load_matrix(snapshot.centroids, snapshot.centroid_meta, snapshot.thresholds)
+    snapshot_state.update(version=snapshot.version, fingerprint=snapshot.fingerprint)
+    return total_vectors
 
-        print("✅ [Background Task] Indexing Selesai.")
-        print(process.stdout)
+def refresh_from_snapshot() -> bool:
+    """Memuat snapshot galeri aktif dari disk. False jika belum ada snapshot atau gagal dibuka."""
+    try:
+        snapshot = load_snapshot(EMBEDDING_DIM)
+        if snapshot is None:
+            return False
+        total_vectors = apply_gallery_snapshot(snapshot)
+    except Exception as e:
+        print(f"⚠️ Gagal memuat snapshot galeri: {e}")
+        return False
+    print(f"✅ Galeri in-memory ({MATCHING_MODE}) dimuat dari snapshot {snapshot.version}: "
+          f"{centroid_index.intern_count} wajah, {total_vectors} vektor, {centroid_index.adaptive_count} ambang adaptif.")
+    return True
 
-    except subprocess.CalledProcessError as e:
-        print(f"❌ [Background Task] Indexing Gagal (Error Subprocess):")
-        print("================== STANDARD ERROR (stderr) ==================")
-        print(e.stderr)
-        print("================== STANDARD OUTPUT (stdout) ==================")
-        print(e.stdout)
-        print("===========================================================")
+def _export_snapshot_once(force: bool) -> Optional[str]:
+    """
+    Satu ekspor snapshot. export_snapshot menyerialkan ekspor antar worker/proses lewat
+    advisory lock; worker yang datang belakangan memakai snapshot worker sebelumnya jika
+    sidiknya sudah sama dengan DB.
+    """
+    conn = None
+    try:
+        conn = connect_db()
+        return export_snapshot(conn, EMBEDDING_DIM, force=force)
+    except Exception as e:
+        if conn: conn.rollback()
+        print(f"❌ Gagal menulis snapshot galeri: {e}")
+        return None
+    finally:
+        if conn: release_db(conn)
 
+def export_gallery_snapshot(force: bool = False) -> Optional[str]:
+    """
+    Menulis snapshot baru dari DB. Single-flight: permintaan yang datang saat ekspor
+    berjalan digabung menjadi satu ekspor susulan. Mengembalikan versi (None jika gagal/digabung).
+    """
+    snapshot_export_pending.set()
+    version = None
+    while snapshot_export_pending.is_set() and snapshot_export_lock.acquire(blocking=False):
+        try:
+            while snapshot_export_pending.is_set():
+                snapshot_export_pending.clear()
+                version = _export_snapshot_once(force)
+        finally:
+            snapshot_export_lock.release()
+    return version
+
+def schedule_snapshot_export():
+    """Ekspor snapshot di thread latar belakang (setelah enrollment / hapus wajah)."""
+    if GALLERY_SNAPSHOT:
+        threading.Thread(target=export_gallery_snapshot, name="gallery-snapshot", daemon=True).start()
+
+def read_gallery_fingerprint() -> str:
+    conn = None
+    try:
+        conn = connect_db()
+        with conn.cursor() as cursor:
+            return gallery_fingerprint(cursor)
+    finally:
+        if conn: release_db(conn)
+
+def sync_gallery(force_export: bool = False) -> int:
+    """
+    Menyelaraskan galeri in-memory dengan DB. Mode snapshot: snapshot aktif dipakai jika
+    sidiknya sama dengan DB, selain itu snapshot diekspor ulang lalu di-memmap. Jika snapshot
+    tidak tersedia (atau GALLERY_SNAPSHOT=0) galeri dimuat langsung dari DB. Mengembalikan jumlah intern.
+    """
+    if not GALLERY_SNAPSHOT:
+        return refresh_centroid_index()
+    if snapshot_state["version"] != current_version():
+        refresh_from_snapshot()
+    try:
+        stale = force_export or read_gallery_fingerprint() != snapshot_state["fingerprint"]
+    except Exception as e:
+        # DB tidak terjangkau: snapshot terakhir tetap melayani pencarian
+        print(f"⚠️ Gagal membaca sidik galeri dari DB: {e}")
+        stale = snapshot_state["version"] is None
+    if stale and not (export_gallery_snapshot(force=force_export) and refresh_from_snapshot()):
+        return refresh_centroid_index()
+    return centroid_index.intern_count
+
+# --- HANDLER NOTIFY ANTAR WORKER (dipanggil dari thread ClusterListener) ---
+
+def on_gallery_snapshot(versions: List[str]):
+    """Versi snapshot baru dipasang worker/proses lain -> memmap versi terbaru."""
+    if GALLERY_SNAPSHOT and versions[-1] != snapshot_state["version"]:
+        refresh_from_snapshot()
+
+def on_gallery_changed(payloads: List[str]):
+    """Centroid intern berubah (trigger DB): perbarui intern tersebut, atau sinkron penuh jika banyak."""
+    intern_ids = {int(payload) for payload in payloads}
+    if len(intern_ids) > GALLERY_NOTIFY_MAX_INTERNS:
+        print(f"🔄 [Cluster] {len(intern_ids)} intern berubah, sinkronisasi galeri penuh.")
+        sync_gallery()
+        return
+    for intern_id in intern_ids:
+        refresh_intern_gallery(intern_id)
+
+def on_attendance_logged(payloads: List[str]):
+    """Log absensi dari worker lain -> state hari ini (cek duplikat lintas worker)."""
+    for payload in payloads:
+        event = json.loads(payload)
+        if event.pop("origin") == WORKER_ID:
+            continue
+        event["absent_at"] = datetime.fromisoformat(event["absent_at"])
+        today_attendance.record(event)
+
+def on_attendance_reset(payloads: List[str]):
+    """Reset dari worker lain: buang antrean sendiri + log yang ter-commit setelah DELETE worker itu."""
+    for payload in payloads:
+        event = json.loads(payload)
+        if event["origin"] == WORKER_ID:
+            continue
+        cutoff = datetime.fromisoformat(event["cutoff"])
+        deleted_count, discarded = purge_attendance_until(cutoff.date(), cutoff)
+        if deleted_count or discarded:
+            print(f"🔄 [Cluster] Reset absensi: {deleted_count} log susulan dihapus, {discarded} log di antrean dibuang.")
+
+def on_indexing_cancel(payloads: List[str]):
+    indexing_jobs.cancel()
+
+def on_cluster_connect():
+    """Koneksi LISTEN tersambung ulang: notifikasi selama terputus hilang -> sinkron ulang."""
+    if not cluster_state["resync_on_connect"]:
+        cluster_state["resync_on_connect"] = True  # Sambungan pertama: startup sudah sinkron
+        return
+    try:
+        sync_gallery()
     except Exception as e:
-        print(f"❌ [Background Task] Gagal menjalankan subprocess: {e}")
+        print(f"❌ Gagal menyinkronkan ulang galeri: {e}")
+    try:
+        load_today_attendance()
+    except Exception as e:
+        print(f"❌ Gagal memuat ulang state absensi hari ini: {e}")
+
+def on_cluster_leader(is_leader: bool):
+    """Dipanggil dari thread listener; job scheduler diatur di event loop."""
+    if cluster_state["loop"] is not None:
+        cluster_state["loop"].call_soon_threadsafe(apply_scheduler_leadership, is_leader)
+
+def connect_listener_db():
+    """Koneksi khusus LISTEN + lock leader (di luar pool, hidup selama worker berjalan)."""
+    return psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASSWORD, port=DB_PORT)
+
+cluster_state = {"loop": None, "resync_on_connect": False}
+# Urutan handler penting: snapshot dipasang dulu, baru perubahan per intern (dibaca dari DB)
+cluster_listener = ClusterListener(
+    connect_listener_db,
+    {
+        CHANNEL_GALLERY_SNAPSHOT: on_gallery_snapshot,
+        CHANNEL_GALLERY_CHANGED: on_gallery_changed,
+        CHANNEL_ATTENDANCE_LOGGED: on_attendance_logged,
+        CHANNEL_ATTENDANCE_RESET: on_attendance_reset,
+        CHANNEL_INDEXING_CANCEL: on_indexing_cancel,
+    },
+    on_connect=on_cluster_connect, on_leader=on_cluster_leader,
+)
+metrics.gauge("cluster_leader", "1 jika worker ini menjalankan job terjadwal (leader).",
+              lambda: int(cluster_listener.is_leader))
+
+async def run_inference(task, *args):
+    """
+    Menjalankan task inferensi (extract_face_features / extract_face_features_burst) di executor inferensi.
+    Melempar InferenceBusyError tanpa menunggu jika semua slot (worker + antrean) terpakai.
+    """
+    acquire_inference_slot()
+    try:
+        future = inference_executor.submit(task, *args)
+    except Exception:
+        release_inference_slot()
+        raise
+    future.add_done_callback(lambda _: release_inference_slot())
+    return await asyncio.wrap_future(future)
+
+async def embed_with_batcher(image_bytes: bytes, timings: dict, thumbnails: list) -> list:
+    """
+    Satu frame lewat micro-batching: deteksi di executor inferensi, lalu forward pass menunggu
+    di embedding_batcher tanpa menahan thread worker (worker langsung mendeteksi frame request lain).
+    Slot inferensi tetap dipegang sampai embedding selesai agar antrean tetap terbatas.
+    Melempar InferenceBusyError jika semua slot terpakai.
+    """
+    acquire_inference_slot()
+    try:
+        face = await asyncio.wrap_future(inference_executor.submit(detect_face_input, image_bytes, timings, thumbnails))
+        if face is None:
+            return []
+        stage_start = time.perf_counter()
+        try:
+            embedding = await asyncio.wrap_future(embedding_batcher.submit(face))
+        except Exception as e:
+            print(f"❌ ERROR Ekstraksi Fitur: {e}")
+            return []
+        timings["embedding"] = time.perf_counter() - stage_start
+        return valid_embedding(embedding)
+    finally:
+        release_inference_slot()
+
+def warm_up_inference():
+    """Warm-up model + detektor (dijalankan di executor inferensi saat startup)."""
+    try:
+        print("🔥 [Startup] Warm-up model & detektor wajah...")
+        elapsed = warm_up_models()
+        model_state.update(ready=True, warmup_seconds=round(elapsed, 2), error=None)
+        print(f"✅ [Startup] Warm-up model selesai dalam {elapsed:.2f}s.")
+    except Exception as e:
+        model_state.update(ready=False, error=str(e))
+        print(f"❌ [Startup] Warm-up model gagal: {e}")
+
+# --- FUNGSI SUBPROCESS YANG DIPERBAIKI (SANGAT KRITIS) ---
+
+def run_indexing_job(progress):
+    """Logika index_data.py dijalankan in-process (model sudah dimuat, tanpa subprocess)."""
+    # Diimpor saat dipakai: modul CLI indexing (konfigurasi dataset/CSV) tidak dimuat di setiap worker
+    from backend.index_data import index_data_incremental
+    print("🚀 [Indexing] Memulai indexing incremental in-process...")
+    index_data_incremental(workers=INDEXING_WORKERS, batch_size=INDEXING_BATCH_SIZE, progress=progress)
+
+def finish_indexing_job():
+    """Setelah indexing sukses: muat ulang galeri + antrekan audio personal intern baru."""
+    print("✅ [Indexing] Selesai.")
+    sync_gallery()
+    pregenerate_intern_audio()
+
+# Maksimal satu job indexing sekaligus (klik ganda /run_indexing tidak memicu run kedua)
+indexing_jobs = IndexingJobManager(run_indexing_job, on_success=finish_indexing_job, status_path=INDEXING_STATUS_PATH)
+metrics.gauge("indexing_running", "1 jika job indexing sedang berjalan.", lambda: int(indexing_jobs.running))
+
+def indexing_running_elsewhere() -> bool:
+    """Job indexing berjalan di worker lain (status bersama) atau di CLI index_data.py (advisory lock)."""
+    if indexing_jobs.running_elsewhere():
+        return True
+    conn = None
+    try:
+        conn = connect_db()
+        with conn.cursor() as cursor:
+            held = advisory_lock_held(cursor, LOCK_INDEXING)
+        conn.commit()
+        return held
+    finally:
+        if conn: release_db(conn)
+
+def broadcast_indexing_cancel():
+    conn = None
+    try:
+        conn = connect_db()
+        with conn.cursor() as cursor:
+            notify(cursor, CHANNEL_INDEXING_CANCEL)
+        conn.commit()
+    finally:
+        if conn: release_db(conn)
+
+def apply_scheduler_leadership(is_leader: bool):
+    """
+    Job terjadwal (reset harian, partisi) dan pre-generate audio intern hanya berjalan di satu
+    worker: pemegang lock leader. Folder audio dipakai bersama, jadi worker lain cukup membacanya.
+    """
+    if scheduler is None:
+        return
+    if not is_leader:
+        scheduler.remove_all_jobs()
+        return
+    scheduler.add_job(
+        reset_attendance_logs,
+        CronTrigger(hour=DAILY_RESET_HOUR, minute=DAILY_RESET_MINUTE, timezone=str(local_tz)),
+        id='daily_attendance_reset',
+        name='Daily Absensi Log Reset',
+        replace_existing=True
+    )
+    scheduler.add_job(
+        maintain_attendance_partitions,
+        CronTrigger(hour=0, minute=5, timezone=str(local_tz)),
+        id='attendance_partition_maintenance',
+        name='Attendance Log Partition Maintenance',
+        replace_existing=True
+    )
+    print(f"✅ Penjadwalan reset absensi harian ({DAILY_RESET_HOUR}:{DAILY_RESET_MINUTE} WIB) aktif di worker {WORKER_ID} (leader).")
+    # Baca daftar intern (DB) di threadpool agar event loop tidak tertahan
+    asyncio.get_running_loop().run_in_executor(None, pregenerate_intern_audio)
 
 # --- STARTUP EVENT (VERSI DEPLOY) ---
 
@@ -478,27 +1360,108 @@ async def startup_event():
                 raise e # Biarkan FastAPI menangani error startup
 
     # --- LOGIKA PENJADWALAN ---
-    # Kode ini hanya akan berjalan jika 'initialize_db()' berhasil
+    # Scheduler ada di setiap worker, tetapi job-nya hanya ditambahkan di worker leader
     global scheduler
     scheduler = AsyncIOScheduler()
-    scheduler.add_job(
-        reset_attendance_logs,
-        CronTrigger(hour=DAILY_RESET_HOUR, minute=DAILY_RESET_MINUTE, timezone=str(local_tz)),
-        id='daily_attendance_reset',
-        name='Daily Absensi Log Reset'
-    )
     scheduler.start()
-    print(f"✅ Penjadwalan reset absensi harian ({DAILY_RESET_HOUR}:{DAILY_RESET_MINUTE} WIB) aktif.")
-    print("✅ Startup event selesai. Server siap menerima koneksi.")
+
+    # --- KOORDINASI MULTI-WORKER (LISTEN/NOTIFY + pemilihan leader) ---
+    # Dimulai sebelum state dimuat agar perubahan dari worker lain selama startup tidak terlewat
+    cluster_state["loop"] = asyncio.get_running_loop()
+    cluster_listener.start()
+    if not cluster_listener.wait_connected(5):
+        print("⚠️ [Cluster] LISTEN belum tersambung; state disinkronkan ulang begitu tersambung.")
+        cluster_state["resync_on_connect"] = True
+
+    # --- WRITE-BEHIND: sisa spool (crash sebelumnya) ikut di-flush ---
+    attendance_writer.start()
+    ensure_today_attendance()
+
+    # --- WARM-UP MODEL (latar belakang; /ready melaporkan statusnya) ---
+    # Dijalankan di executor inferensi sehingga /recognize pertama mengantre di belakangnya.
+    inference_executor.submit(warm_up_inference)
+
+    # --- MUAT GALERI CENTROID KE MEMORI (snapshot memmap jika sidiknya cocok dengan DB) ---
+    # Gagal di sini tidak menghentikan startup: galeri kosong sampai /reload_db atau NOTIFY berikutnya
+    try:
+        sync_gallery()
+    except Exception as e:
+        print(f"❌ [Startup] Galeri belum dimuat: {e}")
+
+    # --- KATALOG AUDIO (sintesis di thread latar belakang) ---
+    # Audio personal intern di-pre-generate oleh worker leader saja (apply_scheduler_leadership)
+    for filename, text in SYSTEM_AUDIO.items():
+        audio_catalog.register_static(filename, text)
+    print(f"✅ Startup event selesai (worker {WORKER_ID}). Server siap menerima koneksi.")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Menghentikan executor inferensi dan menutup semua koneksi pool DB saat server berhenti."""
+    inference_executor.shutdown(wait=False)
+    indexing_jobs.cancel()
+    cluster_listener.stop()
+    if scheduler is not None:
+        scheduler.shutdown(wait=False)
+    attendance_writer.stop()
+    if db_pool is not None:
+        db_pool.closeall()
+        print("✅ [Shutdown] Pool koneksi DB ditutup.")
 
 # --- ENDPOINTS DATA COLLECTOR ---
 
+def enroll_embedding(intern_id: int, name: str, instansi: str, kategori: str, relative_path: str,
+                     image_bytes: bytes, embedding: List[float]) -> int:
+    """
+    Menyimpan embedding enrollment ke intern_embeddings dan memperbarui running sum
+    centroid + ambang adaptif intern (satu transaksi). File yang ditimpa (nama sama)
+    menggantikan vektor lamanya. Sidik file + versi pipeline ikut disimpan agar index_data.py tidak meng-embed ulang.
+    Mengembalikan jumlah embedding intern setelah enrollment.
+    """
+    stat = (PROJECT_ROOT / relative_path).stat()
+    conn = None
+    try:
+        conn = connect_db()
+        known = get_existing_files(conn, intern_id).get(relative_path)
+        removed = [vector for _, vector in delete_embeddings(conn, [known[0]])] if known else []
+        with conn.cursor() as cursor:
+            # COPY binary: vektor dikirim dalam format vector_recv, tanpa literal teks ~512 angka
+            copy_binary(cursor, "intern_embeddings", EMBEDDING_COPY_COLUMNS, [(
+                intern_id, name, instansi, kategori, relative_path, hashlib.sha256(image_bytes).hexdigest(),
+                stat.st_mtime, stat.st_size, PREPROCESS_PIPELINE_VERSION, embedding,
+            )])
+        # Enrollment satu foto per panggilan: ambang adaptif langsung dihitung ulang (murah)
+        count = update_centroid_incremental(conn, intern_id, added=[embedding], removed=removed, refresh_threshold=True)
+        conn.commit()
+        return count
+    except Exception:
+        if conn: conn.rollback()
+        raise
+    finally:
+        if conn: release_db(conn)
+
 @app.post("/upload_dataset")
 async def upload_dataset(name: str = Form(...), instansi: str = Form("Intern"), kategori: str = Form("Unknown"), file: UploadFile = File(...)):
-    """Menerima file gambar, menyimpan di folder dataset, dan mendaftarkan intern jika belum ada."""
+    """
+    Menerima foto enrollment: validasi wajah + embedding in-process (model yang sudah dimuat),
+    simpan file di folder dataset, lalu insert ke intern_embeddings dan perbarui centroid intern
+    secara incremental. Intern bisa langsung dikenali tanpa menjalankan /run_indexing.
+    """
     clean_name = name.strip()
     if not clean_name:
         raise HTTPException(status_code=400, detail="Nama tidak boleh kosong.")
+    filename = os.path.basename(file.filename or "")
+    if not filename.lower().endswith(('.jpg', '.jpeg', '.png')):
+        raise HTTPException(status_code=400, detail="File harus berupa gambar .jpg/.jpeg/.png.")
+    image_bytes = await file.read()
+
+    # 1. Validasi wajah + embedding lebih dulu: foto yang ditolak tidak ikut tersimpan di dataset
+    try:
+        embedding = await run_inference(extract_enrollment_embedding, image_bytes)
+    except InferenceBusyError:
+        raise HTTPException(status_code=503, detail="Server sedang sibuk, silakan coba lagi.")
+    except ValueError as ve:
+        raise HTTPException(status_code=422, detail=str(ve))
+
     try:
         intern_id, instansi_reg, kategori_reg = get_or_create_intern(clean_name, instansi, kategori)
     except Exception as e:
@@ -506,160 +1469,341 @@ async def upload_dataset(name: str = Form(...), instansi: str = Form("Intern"),
 
     face_folder = FACES_DIR / clean_name
     os.makedirs(face_folder, exist_ok=True)
-    file_path = face_folder / file.filename
+    file_path = face_folder / filename
     try:
-        image_bytes = await file.read()
         with open(file_path, "wb") as f:
             f.write(image_bytes)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Gagal menyimpan file gambar: {e}")
-    print(f"✅ FILE DATASET TERSIMPAN: {clean_name} - {file.filename}")
-    return {"status": "success", "message": f"Gambar tersimpan di folder {clean_name}."}
+    print(f"✅ FILE DATASET TERSIMPAN: {clean_name} - {filename}")
+
+    # 2. Simpan embedding + centroid incremental, lalu perbarui galeri in-memory intern ini saja
+    relative_path = f"data/dataset/{clean_name}/{filename}"
+    try:
+        embedding_count = await run_in_threadpool(enroll_embedding, intern_id, clean_name, instansi_reg, kategori_reg,
+                                                  relative_path, image_bytes, embedding)
+        await run_in_threadpool(refresh_intern_gallery, intern_id)
+        schedule_snapshot_export()
+    except Exception as e:
+        print(f"❌ ERROR ENROLLMENT {clean_name}: {e}")
+        return {"status": "success", "enrolled": False,
+                "message": f"Gambar tersimpan di folder {clean_name}, tetapi embedding gagal disimpan (jalankan indexing): {e}"}
+
+    audio_catalog.prefetch(intern_audio_messages(clean_name))
+    print(f"✅ ENROLLMENT: {clean_name} kini memiliki {embedding_count} embedding.")
+    return {"status": "success", "enrolled": True, "embedding_count": embedding_count,
+            "threshold": f"{match_threshold_for(intern_id):.4f}",
+            "message": f"Gambar tersimpan dan wajah {clean_name} terdaftar ({embedding_count} foto)."}
 
 
 # --- ENDPOINTS ABSENSI ---
 
+BUSY_RESULT = {"status": "busy", "message": "Server sedang sibuk, silakan coba lagi.", "track_id": "S006.mp3", "image_url": ""}
+
+async def infer_frames(frames: List[bytes], timer: StageTimer):
+    """
+    Embedding untuk satu frame atau satu burst frame (batch forward pass).
+    Mengembalikan (daftar embedding, bytes foto log). Melempar InferenceBusyError.
+    """
+    inference_timings = {}
+    inference_start = time.perf_counter()
+    thumbnails = []
+    if len(frames) == 1 and embedding_batcher is not None:
+        emb_list = await embed_with_batcher(frames[0], inference_timings, thumbnails)
+    elif len(frames) == 1:
+        emb_list = await run_inference(extract_face_features, frames[0], None, inference_timings, thumbnails)
+    else:
+        emb_list = await run_inference(extract_face_features_burst, frames, inference_timings, thumbnails)
+    # Sisa waktu di luar decode/deteksi/embedding = menunggu di antrean executor
+    waited = time.perf_counter() - inference_start - sum(inference_timings.values())
+    timer.record("inference_queue", max(0.0, waited))
+    timer.merge(inference_timings)
+    # Foto log = thumbnail crop wajah (jika ada), bukan frame penuh dari kiosk
+    log_image_bytes = thumbnails[0] if thumbnails and thumbnails[0] else frames[0]
+    return emb_list, log_image_bytes
+
+def record_recognition_metrics(result: dict, start_time: float, timer: StageTimer, channel: str):
+    timer.publish(metrics, "recognize_stage_seconds")
+    metrics.observe("recognize_latency_seconds", time.time() - start_time)
+    metrics.inc("recognize_requests_total", status=result.get("status", "unknown"), channel=channel)
+
+async def recognize_image(frames: List[bytes], type_absensi: str, start_time: float, timer: StageTimer, channel: str) -> dict:
+    """Inti pengenalan (POST /recognize, /recognize_burst, WebSocket /ws/recognize) + pencatatan metrik."""
+    try:
+        emb_list, log_image_bytes = await infer_frames(frames, timer)
+        # Sisa alur (DB, simpan gambar) bersifat blocking -> jalankan di threadpool
+        result = await run_in_threadpool(process_recognition, emb_list, log_image_bytes, type_absensi, start_time, timer)
+    except InferenceBusyError as e:
+        print(f"⚠️ SERVER SIBUK: {e}")
+        result = dict(BUSY_RESULT)
+    record_recognition_metrics(result, start_time, timer, channel)
+    return result
+
 @app.post("/recognize")
 async def recognize_face(file: UploadFile = File(...), type_absensi: str = Form(...)):
     """Endpoint utama untuk deteksi wajah dan pencocokan cepat."""
     start_time = time.time()
-    image_bytes = await file.read()
+    timer = StageTimer()
+    with timer.stage("upload_read"):
+        image_bytes = await file.read()
     type_absensi = type_absensi.upper()
-    image_url_for_db = ""
 
     if type_absensi not in ['IN', 'OUT']:
-        generate_audio_file("S005.mp3", "Kesalahan tipe absensi.")
         raise HTTPException(status_code=400, detail="Invalid type_absensi.")
 
-    emb_list = extract_face_features(image_bytes)
+    result = await recognize_image([image_bytes], type_absensi, start_time, timer, channel="http")
+    # Rincian per tahap lewat header Server-Timing
+    return JSONResponse(content=result, headers={"Server-Timing": timer.server_timing_header()})
+
+@app.post("/recognize_burst")
+async def recognize_burst(files: List[UploadFile] = File(...), type_absensi: str = Form(...)):
+    """
+    Pengenalan dari burst beberapa frame (maks. FUSION_MAX_FRAMES) dengan fusi multi-frame:
+    semua wajah di-embed dalam satu batch, lalu digabung (FUSION_METHOD) dan berhenti lebih awal
+    begitu selisih ke runner-up >= FUSION_MARGIN. Frame buram/tanpa wajah dilewati.
+    """
+    start_time = time.time()
+    timer = StageTimer()
+    type_absensi = type_absensi.upper()
+    if type_absensi not in ['IN', 'OUT']:
+        raise HTTPException(status_code=400, detail="Invalid type_absensi.")
+    if not files:
+        raise HTTPException(status_code=400, detail="Minimal satu frame.")
+    if len(files) > FUSION_MAX_FRAMES:
+        raise HTTPException(status_code=400, detail=f"Maksimal {FUSION_MAX_FRAMES} frame per burst (diterima {len(files)}).")
+
+    with timer.stage("upload_read"):
+        frames = [await upload.read() for upload in files]
+    result = await recognize_image(frames, type_absensi, start_time, timer, channel="burst")
+    result["frames_received"] = len(frames)
+    return JSONResponse(content=result, headers={"Server-Timing": timer.server_timing_header()})
+
+@app.websocket("/ws/recognize")
+async def recognize_ws(websocket: WebSocket):
+    """
+    Pengenalan streaming untuk kiosk (satu koneksi per kiosk).
+
+    Protokol:
+      - Pesan teks JSON {"type_absensi": "IN" | "OUT", "fusion_frames": n} mengatur state kiosk
+        (default dari query ?type_absensi=, atau IN). fusion_frames > 1 mengaktifkan fusi:
+        embedding frame berurutan digabung sampai yakin atau n frame, dengan event
+        {"event": "partial", ...} di antaranya.
+      - Pesan biner = satu frame JPEG. Hanya frame TERBARU yang diproses; frame yang
+        belum sempat diproses saat frame baru datang dibuang (server tidak tertinggal).
+      - Setiap frame yang diproses dibalas {"event": "result", "frame": n, "dropped": k, ...hasil}
+        dengan isi hasil sama seperti POST /recognize.
+    """
+    await websocket.accept()
+    type_absensi = (websocket.query_params.get("type_absensi") or "IN").upper()
+    session = {"type_absensi": type_absensi if type_absensi in ('IN', 'OUT') else 'IN', "frames": 0, "dropped": 0,
+               "fusion_frames": 1}
+    burst = {"embeddings": [], "frames": 0, "image": None, "started_at": None}
+    latest_frame = {"value": None}  # (nomor_frame, bytes, waktu_terima)
+    frame_ready = asyncio.Event()
+    send_lock = asyncio.Lock()
+    ws_state["sessions"] += 1
+
+    async def send(payload: dict):
+        async with send_lock:
+            await websocket.send_text(json.dumps(payload))
+
+    async def receive_loop():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes") is not None:
+                session["frames"] += 1
+                if latest_frame["value"] is not None:
+                    session["dropped"] += 1
+                    metrics.inc("ws_frames_dropped_total")
+                latest_frame["value"] = (session["frames"], message["bytes"], time.time())
+                frame_ready.set()
+            elif message.get("text"):
+                try:
+                    control = json.loads(message["text"])
+                    requested = str(control.get("type_absensi", session["type_absensi"])).upper()
+                    fusion_frames = int(control.get("fusion_frames", session["fusion_frames"]))
+                except (ValueError, TypeError, AttributeError):
+                    requested, fusion_frames = "", 1
+                if requested in ('IN', 'OUT'):
+                    if requested != session["type_absensi"] or fusion_frames != session["fusion_frames"]:
+                        burst.update(embeddings=[], frames=0, image=None, started_at=None)
+                    session["type_absensi"] = requested
+                    session["fusion_frames"] = max(1, min(fusion_frames, FUSION_MAX_FRAMES))
+                    await send({"event": "config", "type_absensi": requested, "fusion_frames": session["fusion_frames"]})
+                else:
+                    await send({"event": "error", "message": "Invalid type_absensi."})
+
+    async def process_loop():
+        while True:
+            await frame_ready.wait()
+            frame_ready.clear()
+            frame = latest_frame["value"]
+            latest_frame["value"] = None
+            if frame is None:
+                continue
+            frame_number, image_bytes, received_at = frame
+            timer = StageTimer()
+            if session["fusion_frames"] > 1:
+                result = await fuse_ws_frame(image_bytes, received_at, timer)
+                if result.get("event") == "partial":
+                    await send({"frame": frame_number, "dropped": session["dropped"], **result})
+                    continue
+            else:
+                result = await recognize_image([image_bytes], session["type_absensi"], received_at, timer, channel="ws")
+            await send({
+                "event": "result", "frame": frame_number, "dropped": session["dropped"],
+                "server_timing": timer.server_timing_header(), **result,
+            })
+
+    async def fuse_ws_frame(image_bytes: bytes, received_at: float, timer: StageTimer) -> dict:
+        """Menambah satu frame ke burst sesi; keputusan diambil saat yakin atau burst penuh."""
+        try:
+            emb_list, log_image_bytes = await infer_frames([image_bytes], timer)
+        except InferenceBusyError:
+            result = dict(BUSY_RESULT)
+            record_recognition_metrics(result, received_at, timer, "ws")
+            return result
+        if burst["started_at"] is None:
+            burst["started_at"] = received_at
+        burst["frames"] += 1
+        if emb_list:
+            burst["embeddings"].extend(emb_list)
+            burst["image"] = burst["image"] or log_image_bytes
+
+        match = None
+        if burst["frames"] < session["fusion_frames"]:
+            with timer.stage("vector_search"):
+                match = await run_in_threadpool(match_embeddings, burst["embeddings"])
+            topk = match[0]
+            if not is_fusion_confident(topk):
+                margin = match_margin(topk)
+                return {
+                    "event": "partial", "frames_used": len(burst["embeddings"]),
+                    "best": topk[0][1] if topk else None,
+                    "distance": f"{topk[0][-1]:.4f}" if topk else None,
+                    "margin": f"{margin:.4f}" if margin is not None else None,
+                }
+
+        embeddings, log_image, started_at = burst["embeddings"], burst["image"] or image_bytes, burst["started_at"]
+        burst.update(embeddings=[], frames=0, image=None, started_at=None)
+        # Hasil fusi parsial (jika ada) dipakai ulang: embedding burst tidak berubah sejak dicari
+        result = await run_in_threadpool(process_recognition, embeddings, log_image, session["type_absensi"], started_at, timer, match)
+        record_recognition_metrics(result, started_at, timer, "ws")
+        return result
+
+    receiver = asyncio.ensure_future(receive_loop())
+    processor = asyncio.ensure_future(process_loop())
+    try:
+        done, _ = await asyncio.wait({receiver, processor}, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if not task.cancelled() and task.exception() and not isinstance(task.exception(), WebSocketDisconnect):
+                print(f"❌ ERROR WebSocket /ws/recognize: {task.exception()}")
+    finally:
+        receiver.cancel()
+        processor.cancel()
+        ws_state["sessions"] -= 1
+
+def process_recognition(emb_list, image_bytes: bytes, type_absensi: str, start_time: float, timer: StageTimer,
+                        match: Optional[tuple] = None):
+    """
+    Pencocokan embedding ke galeri, cek duplikat, simpan gambar & log (sinkron).
+    `match` = (top-k, frame terpakai) dari match_embeddings(emb_list) yang sudah dihitung pemanggil.
+    """
+    image_url_for_db = ""
     if not emb_list:
-        generate_audio_file("S002.mp3", "Wajah tidak terdeteksi.")
         return {"status": "error", "message": "Wajah tidak terdeteksi.", "track_id": "S002.mp3", "image_url": image_url_for_db}
-    new_embedding = emb_list[0]
 
-    conn = None
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-        vector_string = "[" + ",".join(map(str, new_embedding)) + "]"
-        cursor.execute(f"""
-            SELECT name, instansi, kategori, embedding <=> '{vector_string}'::vector AS distance
-            FROM intern_centroids
-            ORDER BY distance ASC
-            LIMIT 1
-        """)
-        result = cursor.fetchone()
-
-        if result:
-            name, instansi, kategori, distance = result
+        # Top-k centroid terdekat di memori (satu perkalian matriks-vektor per frame / hasil fusi)
+        if match is None:
+            with timer.stage("vector_search"):
+                match = match_embeddings(emb_list)
+        topk, frames_used = match
+
+        if topk:
+            intern_id, name, instansi, kategori, distance = topk[0]
+            margin = match_margin(topk)
+            threshold = match_threshold_for(intern_id)
+            reason = match_decision(topk)
             elapsed_time = time.time() - start_time
+            # Informasi keyakinan: ambang intern, selisih ke runner-up + jumlah frame yang dipakai fusi
+            match_info = {"threshold": f"{threshold:.4f}", "margin": f"{margin:.4f}" if margin is not None else None,
+                          "frames_used": frames_used, "runner_up": topk[1][1] if len(topk) > 1 else None}
 
-            if distance <= DISTANCE_THRESHOLD:
-                latest_log = get_latest_attendance(name)
+            if reason is None:
+                with timer.stage("duplicate_check"):
+                    latest_log = get_latest_attendance(name)
                 if latest_log and latest_log['type'] == type_absensi:
                     print(f"✅ DUPLIKAT ABSENSI: {name} | Sudah Absen {type_absensi}.")
-                    audio_filename = f"duplicate_{type_absensi.lower()}_{name.replace(' ', '_')}.mp3"
-                    message_text = f"{name}, Anda sudah Absen Masuk hari ini." if type_absensi == 'IN' else f"Absensi Pulang {name} sudah dicatat."
-                    generate_audio_file(audio_filename, message_text)
+                    with timer.stage("audio_lookup"):
+                        audio_filename = audio_catalog.track_for(duplicate_message(name, type_absensi), fallback="S011.mp3")
                     log_time_display = format_time_to_hms(latest_log['absent_at'])
-                    return {"status": "duplicate", "name": name, "instansi": instansi, "kategori": kategori, "distance": f"{distance:.4f}", "latency": f"{elapsed_time:.2f}s", "track_id": audio_filename, "type": type_absensi, "log_time": log_time_display}
+                    return {"status": "duplicate", "name": name, "instansi": instansi, "kategori": kategori, "distance": f"{distance:.4f}", "latency": f"{elapsed_time:.2f}s", "track_id": audio_filename, "type": type_absensi, "log_time": log_time_display, **match_info}
 
-                timestamp = get_current_wib_datetime().strftime("%Y%m%d_%H%M%S") # Gunakan WIB
+                current_log_time = get_current_wib_datetime() # Gunakan WIB
+                timestamp = current_log_time.strftime("%Y%m%d_%H%M%S")
                 clean_name = name.strip().replace(' ', '_').replace('.', '').replace('/', '_').replace('\\', '_').lower()
                 image_filename = f"{timestamp}_{clean_name}_{type_absensi}.jpg"
-                image_path = CAPTURED_IMAGES_DIR / image_filename
-                temp_image_url = ""
-                try:
-                    with open(image_path, "wb") as f: f.write(image_bytes)
-                    temp_image_url = f"/images/{image_filename}"
-                except Exception as file_error:
-                    print(f"   ❌ GAGAL SIMPAN GAMBAR: {name}. Error: {file_error}")
-                image_url_for_db = temp_image_url
-
-                log_attendance(name, instansi, kategori, image_url_for_db, type_absensi)
-                current_log_time = get_current_wib_datetime()
+                image_url_for_db = f"/images/{image_filename}"
+
+                # Thumbnail ditulis langsung; log ditulis di latar belakang (spool tahan-crash)
+                with timer.stage("write_enqueue"):
+                    log_attendance(name, instansi, kategori, image_url_for_db, type_absensi,
+                                   absent_at=current_log_time, image_bytes=image_bytes, image_filename=image_filename)
                 log_time_display = format_time_to_hms(current_log_time)
                 attendance_status_result = check_attendance_status(kategori, type_absensi, current_log_time)
 
-                if type_absensi == 'IN':
-                    message_text = f"Selamat datang, {name}." if attendance_status_result != "Terlambat" else f"Maaf, {name}. Absensi masuk Anda terlambat."
-                else:
-                    message_text = f"Terima kasih, {name}." if attendance_status_result != "Pulang Cepat" else f"Peringatan, {name}. Anda Pulang Cepat."
+                message_text, fallback_track = attendance_message(name, type_absensi, attendance_status_result)
 
                 print(f"✅ DETEKSI BERHASIL: {name} ({type_absensi}) | Status: {attendance_status_result} | Jarak: {distance:.4f} | Latensi: {elapsed_time:.2f}s")
-                audio_filename = f"log_{clean_name}_{type_absensi.lower()}.mp3"
-                generate_audio_file(audio_filename, message_text)
-
-                return {"status": "success", "name": name, "instansi": instansi, "kategori": kategori, "distance": f"{distance:.4f}", "latency": f"{elapsed_time:.2f}s", "track_id": audio_filename, "type": type_absensi, "image_url": image_url_for_db, "log_time": log_time_display, "attendance_status": attendance_status_result}
+                with timer.stage("audio_lookup"):
+                    audio_filename = audio_catalog.track_for(message_text, fallback=fallback_track)
+
+                return {"status": "success", "name": name, "instansi": instansi, "kategori": kategori, "distance": f"{distance:.4f}", "latency": f"{elapsed_time:.2f}s", "track_id": audio_filename, "type": type_absensi, "image_url": image_url_for_db, "log_time": log_time_display, "attendance_status": attendance_status_result, **match_info}
+            elif reason == "ambiguous":
+                # Dua intern sama-sama dekat: lebih aman minta ulang daripada mencatat orang yang salah
+                print(f"❌ DETEKSI AMBIGU: {name} vs {match_info['runner_up']} | Selisih {margin:.4f} < {MATCH_MARGIN:.4f} | Latensi: {elapsed_time:.2f}s")
+                return {"status": "unrecognized", "reason": reason, "message": "Wajah kurang jelas, silakan coba lagi.", "track_id": "S012.mp3", "image_url": image_url_for_db, "distance": f"{distance:.4f}", **match_info}
             else:
-                print(f"❌ DETEKSI GAGAL: Jarak Terlalu Jauh ({distance:.4f}) | Latensi: {elapsed_time:.2f}s")
-                generate_audio_file("S003.mp3", "Wajah Anda belum terdaftar.")
-                return {"status": "unrecognized", "message": "Wajah Anda Belum Terdaftar", "track_id": "S003.mp3", "image_url": image_url_for_db}
+                print(f"❌ DETEKSI GAGAL: Jarak Terlalu Jauh ({distance:.4f} > {threshold:.4f}) | Latensi: {elapsed_time:.2f}s")
+                return {"status": "unrecognized", "reason": reason, "message": "Wajah Anda Belum Terdaftar", "track_id": "S003.mp3", "image_url": image_url_for_db, "distance": f"{distance:.4f}", **match_info}
         else:
-            generate_audio_file("S003.mp3", "Wajah Anda belum terdaftar.")
             return {"status": "error", "message": "Sistem kosong, lakukan indexing.", "track_id": "S003.mp3", "image_url": image_url_for_db}
     except Exception as e:
         print(f"❌ ERROR PENCARIAN/ABSENSI: {e}")
-        generate_audio_file("S004.mp3", "Kesalahan server terjadi.")
         return {"status": "error", "message": f"Kesalahan server: {str(e)}", "track_id": "S004.mp3", "image_url": image_url_for_db}
-    finally:
-        if conn: conn.close()
 
 # --- ENDPOINTS DATA (data.html) ---
 
 @app.get("/attendance/today")
-async def get_today_attendance():
-    """Mendapatkan daftar log absensi unik terakhir hari ini."""
-    conn = None
-    try:
-        conn = connect_db()
-        cursor = conn.cursor()
-        cursor.execute("""
-            WITH LatestAttendance AS (
-                SELECT
-                    log_id, intern_name, instansi, kategori, image_url, absent_at, type,
-                    ROW_NUMBER() OVER(PARTITION BY intern_name ORDER BY absent_at DESC) as rn
-                FROM attendance_logs
-                WHERE absent_at::date = CURRENT_DATE
-            )
-            SELECT intern_name, instansi, kategori, absent_at, image_url, type
-            FROM LatestAttendance
-            WHERE rn = 1
-            ORDER BY absent_at DESC;
-        """)
-        results = cursor.fetchall()
-        attendance_list = []
-        for name, instansi, kategori, time_obj, image_url, log_type in results:
-            log_datetime_wib = time_obj # Asumsi DB menyimpan UTC atau tanpa TZ
-            # time_obj adalah 'naive' datetime dari DB (misal: 08:34)
-            # Karena DB kita disetel ke WIB, kita anggap waktu 'naive' itu SUDAH WIB.
-            if time_obj.tzinfo is None or time_obj.tzinfo.utcoffset(time_obj) is None:
-                log_datetime_wib = local_tz.localize(time_obj)
-            else:
-                log_datetime_wib = time_obj.astimezone(local_tz)
-
-            status_kepatuhan = check_attendance_status(kategori, log_type, log_datetime_wib)
-            status_display = f"MASUK ({status_kepatuhan})" if log_type == 'IN' else f"PULANG ({status_kepatuhan})"
-            attendance_list.append({
-                "name": name,
-                "instansi": instansi,
-                "kategori": kategori,
-                "status": status_display,
-                "timestamp": format_time_to_hms(log_datetime_wib), # Gunakan WIB yang sudah dikonversi
-                "distance": 0.0000,
-                "image_path": image_url
-            })
-        return attendance_list
-    except Exception as e:
-        print(f"❌ Error mengambil daftar absensi hari ini: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn: conn.close()
+def get_today_attendance():
+    """Mendapatkan daftar log absensi unik terakhir hari ini (dari state in-memory)."""
+    if not ensure_today_attendance():
+        raise HTTPException(status_code=500, detail="Gagal memuat log absensi hari ini.")
+    attendance_list = []
+    for entry in today_attendance.entries(get_current_wib_datetime().date()):
+        # absent_at disimpan sebagai waktu 'naive' WIB
+        log_datetime_wib = local_tz.localize(entry["absent_at"])
+        log_type = entry["type"]
+        status_kepatuhan = check_attendance_status(entry["kategori"], log_type, log_datetime_wib)
+        status_display = f"MASUK ({status_kepatuhan})" if log_type == 'IN' else f"PULANG ({status_kepatuhan})"
+        attendance_list.append({
+            "name": entry["name"],
+            "instansi": entry["instansi"],
+            "kategori": entry["kategori"],
+            "status": status_display,
+            "timestamp": format_time_to_hms(log_datetime_wib),
+            "distance": 0.0000,
+            "image_path": entry["image_url"]
+        })
+    return attendance_list
 
 # --- ENDPOINTS PENGATURAN (settings.html) ---
 
 @app.post("/reset_absensi")
-async def reset_daily_attendance():
+def reset_daily_attendance():
     """Menghapus semua log absensi hari ini (Manual Trigger)."""
     try:
         deleted_count = reset_attendance_logs()
@@ -673,7 +1817,7 @@ async def reset_daily_attendance():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/delete_face/{name}")
-async def delete_face(name: str):
+def delete_face(name: str):
     """Menghapus data wajah dari database dan file dari disk."""
     conn = None
     try:
@@ -688,6 +1832,7 @@ async def delete_face(name: str):
 
         # Hapus dari tabel anak dulu
         cursor.execute("DELETE FROM intern_centroids WHERE intern_id = %s", (intern_id,))
+        cursor.execute("DELETE FROM intern_centroid_sums WHERE intern_id = %s", (intern_id,))
         cursor.execute("DELETE FROM intern_embeddings WHERE intern_id = %s", (intern_id,))
         deleted_vectors = cursor.rowcount
         # Hapus log absensi? (Opsional, mungkin ingin disimpan)
@@ -707,6 +1852,9 @@ async def delete_face(name: str):
             except Exception as e:
                 print(f"❌ Gagal menghapus folder file wajah {name}: {e}")
 
+        centroid_index.update_intern(intern_id, [])
+        schedule_snapshot_export()
+
         print(f"✅ Hapus Wajah Berhasil: {name}. Vektor dihapus: {deleted_vectors}. File dihapus: {file_deleted}")
         return {"status": "success", "message": f"Data wajah '{name}' berhasil dihapus."}
 
@@ -717,39 +1865,79 @@ async def delete_face(name: str):
         if conn: conn.rollback()
         raise HTTPException(status_code=500, detail=f"Gagal menghapus data wajah: {e}")
     finally:
-        if conn: conn.close()
+        if conn: release_db(conn)
 
 # --- ENDPOINTS LAINNYA ---
 @app.post("/run_indexing")
-async def run_indexing_endpoint(background_tasks: BackgroundTasks):
-    """Memicu proses indexing di background."""
-    try:
-        background_tasks.add_task(run_indexing_subprocess)
-        print("✅ [API] Proses indexing telah di-antrekan (queued)...")
-        return {"status": "queued", "message": "Proses indexing telah dimulai di background."}
-    except Exception as e:
-        print(f"❌ [API] Gagal memulai background task: {e}")
-        raise HTTPException(status_code=500, detail=f"Gagal memulai indexing task: {e}")
+async def run_indexing_endpoint():
+    """Memulai job indexing in-process. 409 jika job lain masih berjalan (di worker mana pun)."""
+    if not indexing_jobs.running and await run_in_threadpool(indexing_running_elsewhere):
+        return JSONResponse(status_code=409, content={
+            "detail": "Indexing sedang berjalan di worker/proses lain. Pantau progres di /indexing/status.",
+            **indexing_jobs.status()
+        })
+    if not indexing_jobs.start():
+        return JSONResponse(status_code=409, content={
+            "detail": "Indexing sedang berjalan. Pantau progres di /indexing/status.", **indexing_jobs.status()
+        })
+    print("✅ [API] Job indexing dimulai.")
+    return {"status": "started", "message": "Proses indexing telah dimulai di background.", **indexing_jobs.status()}
+
+@app.get("/indexing/status")
+async def indexing_status():
+    """Progres job indexing terakhir: gambar selesai, gambar/detik, ETA, error per orang."""
+    return indexing_jobs.status()
+
+@app.post("/indexing/cancel")
+async def cancel_indexing():
+    """Membatalkan job indexing yang berjalan (berhenti di antara gambar; orang yang sudah selesai tetap tersimpan)."""
+    if not indexing_jobs.cancel():
+        if not indexing_jobs.running_elsewhere():
+            raise HTTPException(status_code=409, detail="Tidak ada job indexing yang berjalan.")
+        # Job milik worker lain: diteruskan lewat NOTIFY indexing_cancel
+        await run_in_threadpool(broadcast_indexing_cancel)
+    return {"status": "cancelling", **indexing_jobs.status()}
 
 @app.post("/reload_db")
-async def reload_db():
-    """Simulasi muat ulang/sinkronisasi DB."""
-    conn = None
+def reload_db():
+    """Memuat ulang galeri centroid in-memory dari database (sinkronisasi + snapshot baru)."""
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(DISTINCT name) FROM intern_centroids")
-        total_unique_faces = cursor.fetchone()[0]
-        print(f"✅ RELOAD SIMULASI BERHASIL. Total {total_unique_faces} wajah unik terindeks.")
-        return {"status": "success", "message": "Sinkronisasi berhasil (Simulasi)", "total_faces": total_unique_faces}
+        total_unique_faces = sync_gallery(force_export=True)
+        print(f"✅ RELOAD BERHASIL. Total {total_unique_faces} wajah unik terindeks.")
+        return {"status": "success", "message": "Sinkronisasi berhasil", "total_faces": total_unique_faces}
     except Exception as e:
-        print(f"❌ Error saat simulasi reload database: {e}")
+        print(f"❌ Error saat reload database: {e}")
         raise HTTPException(status_code=500, detail=f"Gagal reload database: {e}")
-    finally:
-        if conn: conn.close()
+
+@app.get("/ready")
+async def readiness():
+    """Readiness probe: 200 hanya jika warm-up model sudah selesai."""
+    status_code = 200 if model_state["ready"] else 503
+    return JSONResponse(status_code=status_code, content={
+        "ready": model_state["ready"],
+        "warmup_seconds": model_state["warmup_seconds"],
+        "error": model_state["error"],
+        "gallery_size": centroid_index.intern_count,
+        "gallery_snapshot": snapshot_state["version"],
+        "worker": WORKER_ID,
+        "cluster_leader": cluster_listener.is_leader,
+        "matching_mode": MATCHING_MODE
+    })
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Metrik format teks Prometheus: histogram latensi per tahap, counter status, gauge."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/db/pool_stats")
+async def db_pool_stats():
+    """Statistik pool koneksi DB (koneksi dipakai/idle, checkout, timeout)."""
+    if db_pool is None:
+        return {"status": "not_initialized"}
+    return {"status": "success", "pool": db_pool.snapshot()}
 
 @app.get("/list_faces")
-async def list_registered_faces():
+def list_registered_faces():
     """Mengambil daftar nama dan jumlah gambar."""
     conn = None
     try:
@@ -768,7 +1956,7 @@ async def list_registered_faces():
         print(f"❌ Error mengambil daftar wajah terdaftar: {e}")
         raise HTTPException(status_code=500, detail=f"Gagal mengambil daftar wajah: {e}")
     finally:
-        if conn: conn.close()
+        if conn: release_db(conn)
 
 # --- APP.MOUNT INI HARUS DI POSISI TERAKHIR (FALLBACK) ---
 app.mount("/", StaticFiles(directory=str(FRONTEND_STATIC_DIR), html=True), name="frontend") # Tambahkan html=True
\ No newline at end of file
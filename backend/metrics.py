@@ -0,0 +1,132 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+# --- METRIK LATENSI (FORMAT TEKS PROMETHEUS) ---
+#
+# Registry kecil tanpa dependensi tambahan: histogram latensi per tahap,
+# counter berlabel, dan gauge berbasis callback. Dirender oleh endpoint /metrics.
+
+# Batas bucket histogram latensi (detik)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{key}="{value}"' for key, value in labels)
+    return "{" + inner + "}"
+
+
+class MetricsRegistry:
+    """Registry metrik thread-safe (histogram, counter, gauge)."""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}  # nama -> (tipe, deskripsi)
+        self._histograms: Dict[Tuple[str, tuple], list] = {}  # (nama, label) -> [bucket..., sum, count]
+        self._counters: Dict[Tuple[str, tuple], float] = {}
+        self._gauges: Dict[str, Callable[[], float]] = {}
+
+    def _name(self, name: str) -> str:
+        return f"{self.prefix}_{name}"
+
+    def describe(self, name: str, metric_type: str, description: str):
+        self._help[self._name(name)] = (metric_type, description)
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (self._name(name), tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [0] * len(LATENCY_BUCKETS) + [0.0, 0]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    series[i] += 1
+            series[-2] += seconds
+            series[-1] += 1
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (self._name(name), tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def gauge(self, name: str, description: str, callback: Callable[[], float]):
+        """Mendaftarkan gauge yang nilainya dibaca saat render (misal: kedalaman antrean)."""
+        self.describe(name, "gauge", description)
+        self._gauges[self._name(name)] = callback
+
+    def render(self) -> str:
+        lines = []
+        emitted_help = set()
+
+        def header(full_name: str, default_type: str):
+            if full_name in emitted_help:
+                return
+            emitted_help.add(full_name)
+            metric_type, description = self._help.get(full_name, (default_type, ""))
+            if description:
+                lines.append(f"# HELP {full_name} {description}")
+            lines.append(f"# TYPE {full_name} {metric_type}")
+
+        with self._lock:
+            histograms = {k: list(v) for k, v in self._histograms.items()}
+            counters = dict(self._counters)
+
+        for (full_name, labels), series in sorted(histograms.items()):
+            header(full_name, "histogram")
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                bucket_labels = labels + (("le", str(bound)),)
+                lines.append(f"{full_name}_bucket{_format_labels(bucket_labels)} {series[i]}")
+            lines.append(f"{full_name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {series[-1]}")
+            lines.append(f"{full_name}_sum{_format_labels(labels)} {series[-2]:.6f}")
+            lines.append(f"{full_name}_count{_format_labels(labels)} {series[-1]}")
+
+        for (full_name, labels), value in sorted(counters.items()):
+            header(full_name, "counter")
+            lines.append(f"{full_name}{_format_labels(labels)} {value:g}")
+
+        for full_name, callback in sorted(self._gauges.items()):
+            header(full_name, "gauge")
+            try:
+                value = float(callback())
+            except Exception:
+                continue
+            lines.append(f"{full_name} {value:g}")
+
+        return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    """
+    Pencatat durasi per tahap untuk SATU request.
+    Nilai dikumpulkan di `stages` (detik) lalu dikirim ke registry dan header Server-Timing.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def merge(self, stages: Optional[Dict[str, float]]):
+        for name, seconds in (stages or {}).items():
+            self.record(name, seconds)
+
+    def server_timing_header(self) -> str:
+        """Nilai header `Server-Timing` (durasi dalam milidetik)."""
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items())
+
+    def publish(self, registry: MetricsRegistry, metric_name: str):
+        for name, seconds in self.stages.items():
+            registry.observe(metric_name, seconds, stage=name)
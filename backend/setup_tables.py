@@ -1,7 +1,10 @@
 import psycopg2
 import sys
 import os
+import argparse
+import pytz
 from pathlib import Path
+from datetime import date, datetime
 from dotenv import load_dotenv
 
 # --- KONFIGURASI DAN IMPORT ---
@@ -16,7 +19,12 @@ try:
     sys.path.insert(0, str(PROJECT_ROOT))
 
     # 4. Sekarang import absolut 'backend.utils' akan berhasil
-    from backend.utils import EMBEDDING_DIM
+    from backend.utils import EMBEDDING_DIM, VECTOR_INDEXED_TABLES, VECTOR_INDEX_TYPE, vector_index_ddl, vector_index_name
+    from backend.attendance_schema import (
+        ATTENDANCE_PARTITIONING, attendance_table_ddl, ensure_attendance_indexes,
+        ensure_monthly_partitions, migrate_to_partitioned,
+    )
+    from backend.cluster_events import ensure_gallery_notify_trigger
 
 except ImportError as e:
     # Ini akan menangkap jika utils.py benar-benar hilang
@@ -48,10 +56,17 @@ DB_USER = os.getenv("DB_USER", "macbookpro")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "deepfacepass")
 # --------------------------------------------------------
 
+# Partisi log absensi mengikuti tanggal WIB (sama seperti API), bukan zona waktu server
+local_tz = pytz.timezone('Asia/Jakarta')
+
+def today_wib() -> date:
+    return datetime.now(local_tz).date()
+
 DB_TABLE_INTERNS = "interns"
 DB_TABLE_LOGS = "attendance_logs"
 DB_TABLE_EMBEDDINGS = "intern_embeddings"
 DB_TABLE_CENTROIDS = "intern_centroids"
+DB_TABLE_CENTROID_SUMS = "intern_centroid_sums"
 
 
 def connect_db():
@@ -90,6 +105,7 @@ def setup_database():
         cur.execute(f"DROP TABLE IF EXISTS {DB_TABLE_LOGS} CASCADE;") # Gunakan CASCADE
         cur.execute(f"DROP TABLE IF EXISTS {DB_TABLE_EMBEDDINGS} CASCADE;")
         cur.execute(f"DROP TABLE IF EXISTS {DB_TABLE_CENTROIDS} CASCADE;")
+        cur.execute(f"DROP TABLE IF EXISTS {DB_TABLE_CENTROID_SUMS} CASCADE;")
         conn.commit()
         print("✅ Tabel anak dihapus.")
 
@@ -111,18 +127,10 @@ def setup_database():
         print(f"✅ Tabel '{DB_TABLE_INTERNS}' berhasil dibuat.")
 
         print("     -> Membuat ulang tabel 'attendance_logs'...")
-        cur.execute(f"""
-            CREATE TABLE {DB_TABLE_LOGS} (
-                log_id SERIAL PRIMARY KEY,
-                intern_id INTEGER REFERENCES {DB_TABLE_INTERNS}(id) ON DELETE CASCADE,
-                intern_name TEXT NOT NULL,
-                instansi TEXT,
-                kategori TEXT,
-                image_url TEXT,
-                absent_at TIMESTAMP WITHOUT TIME ZONE,
-                type TEXT NOT NULL DEFAULT 'IN'
-            );
-        """)
+        cur.execute(attendance_table_ddl(ATTENDANCE_PARTITIONING, cascade=True))
+        if ATTENDANCE_PARTITIONING:
+            ensure_monthly_partitions(cur, today_wib())
+        ensure_attendance_indexes(cur)
         conn.commit()
         print(f"✅ Tabel '{DB_TABLE_LOGS}' berhasil dibuat.")
 
@@ -135,6 +143,10 @@ def setup_database():
                 instansi VARCHAR(100),
                 kategori VARCHAR(100),
                 file_path TEXT NOT NULL UNIQUE, -- Menambahkan UNIQUE untuk integritas data
+                content_hash TEXT, -- SHA-256 isi file (deteksi foto diganti)
+                file_mtime DOUBLE PRECISION, -- Cek cepat perubahan tanpa hashing
+                file_size BIGINT,
+                pipeline_version SMALLINT, -- Versi pipeline preprocessing (utils.PREPROCESS_PIPELINE_VERSION)
                 embedding vector({EMBEDDING_DIM}) NOT NULL
             );
         """)
@@ -149,12 +161,29 @@ def setup_database():
                 name TEXT NOT NULL UNIQUE,
                 instansi TEXT,
                 kategori TEXT,
-                embedding vector({EMBEDDING_DIM}) NOT NULL
+                embedding vector({EMBEDDING_DIM}) NOT NULL,
+                match_threshold REAL
             );
         """)
+        # NOTIFY gallery_changed ke worker API saat centroid berubah
+        ensure_gallery_notify_trigger(cur)
         conn.commit()
         print(f"✅ Tabel '{DB_TABLE_CENTROIDS}' berhasil dibuat.")
 
+        print("     -> Membuat ulang tabel 'intern_centroid_sums'...")
+        cur.execute(f"""
+            CREATE TABLE {DB_TABLE_CENTROID_SUMS} (
+                intern_id INTEGER PRIMARY KEY REFERENCES {DB_TABLE_INTERNS}(id) ON DELETE CASCADE,
+                embedding_sum BYTEA NOT NULL, -- Jumlah berjalan float64 semua embedding intern
+                embedding_count INTEGER NOT NULL,
+                updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+            );
+        """)
+        conn.commit()
+        print(f"✅ Tabel '{DB_TABLE_CENTROID_SUMS}' berhasil dibuat.")
+
+        create_vector_indexes(conn)
+
     except Exception as e:
         print(f"❌ ERROR FATAL: Gagal membuat/memperbarui tabel database: {e}")
         conn.rollback() # Rollback jika ada error
@@ -166,5 +195,76 @@ def setup_database():
         print("\n🎉 SETUP DATABASE LENGKAP!")
 
 
+def create_vector_indexes(conn, rebuild: bool = False):
+    """
+    Membuat indeks ANN (cosine) untuk kolom embedding sesuai VECTOR_INDEX_TYPE.
+    rebuild=True menghapus semua indeks ANN lama (semua tipe) lalu membangunnya ulang,
+    misalnya setelah data bertambah banyak (IVFFlat dilatih dari data saat build).
+    """
+    cur = conn.cursor()
+    try:
+        for table in VECTOR_INDEXED_TABLES:
+            if rebuild:
+                for index_type in ("hnsw", "ivfflat"):
+                    cur.execute(f"DROP INDEX IF EXISTS {vector_index_name(table, index_type)};")
+            ddl = vector_index_ddl(table)
+            if ddl is None:
+                print(f"     -> Indeks ANN dinonaktifkan (VECTOR_INDEX_TYPE={VECTOR_INDEX_TYPE}) untuk '{table}'.")
+                continue
+            print(f"     -> Membangun indeks {VECTOR_INDEX_TYPE.upper()} untuk '{table}'...")
+            cur.execute(ddl)
+            conn.commit()
+            print(f"✅ Indeks '{vector_index_name(table)}' siap.")
+        conn.commit()
+    finally:
+        cur.close()
+
+
+def rebuild_vector_indexes():
+    conn = connect_db()
+    print("==================================================")
+    print(f"🛠️ REBUILD INDEKS ANN ({VECTOR_INDEX_TYPE.upper()})")
+    print("==================================================")
+    try:
+        create_vector_indexes(conn, rebuild=True)
+    except Exception as e:
+        print(f"❌ ERROR FATAL: Gagal membangun ulang indeks ANN: {e}")
+        conn.rollback()
+        sys.exit(1)
+    finally:
+        conn.close()
+    print("\n🎉 REBUILD INDEKS SELESAI!")
+
+
+def migrate_attendance_partitions():
+    conn = connect_db()
+    print("==================================================")
+    print("🛠️ MIGRASI attendance_logs -> PARTISI BULANAN")
+    print("==================================================")
+    try:
+        copied, skipped = migrate_to_partitioned(conn, today_wib())
+        print(f"✅ {copied} log dipindahkan. Tabel lama disimpan sebagai 'attendance_logs_legacy'.")
+        if skipped:
+            print(f"⚠️ {skipped} log tanpa absent_at dilewati (tetap ada di 'attendance_logs_legacy').")
+    except Exception as e:
+        print(f"❌ ERROR FATAL: Migrasi partisi gagal (tidak ada perubahan): {e}")
+        conn.rollback()
+        sys.exit(1)
+    finally:
+        conn.close()
+    print("\n🎉 MIGRASI SELESAI! Set ATTENDANCE_PARTITIONING=1 untuk API.")
+
+
 if __name__ == "__main__":
-    setup_database()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Setup tabel database absensi (DROP & CREATE) atau kelola indeks ANN.")
+    parser.add_argument("--rebuild-indexes", action="store_true",
+                        help="Hanya bangun ulang indeks HNSW/IVFFlat tanpa menghapus data.")
+    parser.add_argument("--migrate-attendance", action="store_true",
+                        help="Migrasikan attendance_logs yang ada ke partisi bulanan (data dipertahankan).")
+    args = parser.parse_args()
+    if args.rebuild_indexes:
+        rebuild_vector_indexes()
+    elif args.migrate_attendance:
+        migrate_attendance_partitions()
+    else:
+        setup_database()
\ No newline at end of file
@@ -1,7 +1,13 @@
 import numpy as np
 import cv2 
 from deepface import DeepFace
+from deepface.commons import functions as deepface_functions
 import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional
 # import psycopg2 # Hapus import yang tidak digunakan jika koneksi DB di handle di file lain
 
 # --- KONFIGURASI KRITIS (Sumber Tunggal) ---
@@ -13,77 +19,432 @@ EMBEDDING_DIM = 512
 # Batas ambang jarak kosinus (Cosine Distance) untuk penentuan wajah dikenali
 # Wajah dikenali jika jarak <= DISTANCE_THRESHOLD
 DISTANCE_THRESHOLD = 0.40 
+# Mode pencocokan di /recognize:
+#   "centroid"  -> satu vektor rata-rata per intern (intern_centroids)
+#   "prototype" -> beberapa prototipe per intern hasil clustering intern_embeddings;
+#                  keputusan memakai prototipe terdekat (lebih akurat untuk foto yang bervariasi)
+MATCHING_MODE = os.getenv("MATCHING_MODE", "centroid")
+# Jumlah prototipe maksimum per intern (mode "prototype")
+PROTOTYPES_PER_INTERN = 3
+# Prototipe lebih dekat ke foto asli daripada centroid, jadi ambangnya lebih ketat
+PROTOTYPE_DISTANCE_THRESHOLD = 0.35
+# Keputusan open-set: kandidat terbaik juga harus unggul minimal MATCH_MARGIN dari runner-up
+MATCH_MARGIN = float(os.getenv("MATCH_MARGIN", "0.05"))
+# Ambang adaptif per intern (dihitung saat indexing dari sebaran intern_embeddings):
+#   persentil jarak embedding ke centroid-nya + SLACK, dibatasi [FLOOR, ambang global]
+ADAPTIVE_THRESHOLD_PERCENTILE = 95
+ADAPTIVE_THRESHOLD_SLACK = float(os.getenv("ADAPTIVE_THRESHOLD_SLACK", "0.05"))
+ADAPTIVE_THRESHOLD_FLOOR = float(os.getenv("ADAPTIVE_THRESHOLD_FLOOR", "0.25"))
+# Di bawah jumlah foto ini sebaran tidak representatif -> pakai ambang global
+ADAPTIVE_THRESHOLD_MIN_SAMPLES = 3
+# Backend detektor wajah DeepFace (sama dengan yang dipakai saat indexing)
+DETECTOR_BACKEND = 'opencv'
+
+
+# --- KONFIGURASI PREPROCESSING GAMBAR ---
+
+# Faktor reduksi saat decode JPEG dari kiosk (1, 2, 4, 8). Decoder JPEG menskalakan
+# langsung di domain DCT, jadi decode + deteksi jauh lebih murah. 1 = resolusi penuh.
+DECODE_REDUCTION = int(os.getenv("DECODE_REDUCTION", "2"))
+# Sisi terpanjang salinan gambar untuk detektor; kotak wajah dipetakan kembali ke gambar asli. 0 = nonaktif.
+DETECTION_MAX_SIDE = int(os.getenv("DETECTION_MAX_SIDE", "480"))
+# Margin di sekitar kotak wajah (proporsi lebar/tinggi) untuk crop sebelum alignment
+FACE_CROP_MARGIN = float(os.getenv("FACE_CROP_MARGIN", "0.25"))
+# Thumbnail wajah yang disimpan di captured_images (menggantikan frame penuh)
+THUMBNAIL_MAX_SIDE = int(os.getenv("THUMBNAIL_MAX_SIDE", "160"))
+THUMBNAIL_JPEG_QUALITY = int(os.getenv("THUMBNAIL_JPEG_QUALITY", "80"))
+# Versi pipeline preprocessing yang disimpan bersama setiap embedding (intern_embeddings.pipeline_version).
+# Naikkan setiap kali deteksi/crop/alignment berubah: index_data.py meng-embed ulang baris versi lain
+# (NULL = pipeline lama: deteksi + alignment langsung pada frame penuh).
+PREPROCESS_PIPELINE_VERSION = 2
+# Enrollment (/upload_dataset): kotak wajah minimum (piksel, resolusi penuh) agar foto dataset layak dipakai
+ENROLLMENT_MIN_FACE_SIDE = int(os.getenv("ENROLLMENT_MIN_FACE_SIDE", "80"))
+
+_REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+# --- KONFIGURASI INDEKS ANN (pgvector) ---
+
+# Jenis indeks untuk kolom embedding: "hnsw", "ivfflat", atau "none" (sequential scan)
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw")
+# Parameter build HNSW
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+# Parameter build IVFFlat (idealnya ~ jumlah_baris / 1000, minimal 1; bangun ulang setelah data bertambah)
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "100"))
+# Parameter saat query (recall vs kecepatan)
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "10"))
+# Tabel yang kolom `embedding`-nya diberi indeks ANN
+VECTOR_INDEXED_TABLES = ("intern_centroids", "intern_embeddings")
+
+def vector_index_name(table: str, index_type: str = None) -> str:
+    return f"{table}_embedding_{index_type or VECTOR_INDEX_TYPE}_idx"
+
+def vector_index_ddl(table: str) -> Optional[str]:
+    """CREATE INDEX (cosine) untuk kolom embedding sesuai VECTOR_INDEX_TYPE, atau None jika dinonaktifkan."""
+    if VECTOR_INDEX_TYPE == "hnsw":
+        return (f"CREATE INDEX IF NOT EXISTS {vector_index_name(table)} ON {table} "
+                f"USING hnsw (embedding vector_cosine_ops) WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})")
+    if VECTOR_INDEX_TYPE == "ivfflat":
+        return (f"CREATE INDEX IF NOT EXISTS {vector_index_name(table)} ON {table} "
+                f"USING ivfflat (embedding vector_cosine_ops) WITH (lists = {max(1, IVFFLAT_LISTS)})")
+    return None
+
+def vector_search_settings_sql() -> List[str]:
+    """Perintah SET per koneksi untuk parameter query indeks ANN."""
+    if VECTOR_INDEX_TYPE == "hnsw":
+        return [f"SET hnsw.ef_search = {HNSW_EF_SEARCH}"]
+    if VECTOR_INDEX_TYPE == "ivfflat":
+        return [f"SET ivfflat.probes = {IVFFLAT_PROBES}"]
+    return []
+
+
+# --- MODEL & TAHAP INFERENSI ---
+
+# Handle model tingkat modul: dibangun sekali (startup API / awal indexing), dipakai ulang di semua panggilan
+_face_model = None
+_face_model_lock = threading.Lock()
+
+def get_face_model():
+    """Mengembalikan model MODEL_NAME (dibangun sekali, lalu dipakai ulang)."""
+    global _face_model
+    if _face_model is None:
+        with _face_model_lock:
+            if _face_model is None:
+                _face_model = DeepFace.build_model(MODEL_NAME)
+    return _face_model
+
+def warm_up_models() -> float:
+    """
+    Membangun model + detektor dan menjalankan satu inferensi dummy agar graph
+    TensorFlow dan cascade OpenCV sudah siap sebelum scan pertama.
+    Mengembalikan durasi warm-up (detik).
+    """
+    start = time.perf_counter()
+    model = get_face_model()
+    input_shape_x, input_shape_y = deepface_functions.find_input_shape(model)
+
+    # Detektor: enforce_detection=False agar gambar kosong tetap melewati seluruh pipeline
+    blank = np.zeros((input_shape_y * 2, input_shape_x * 2, 3), dtype=np.uint8)
+    dummy_face = deepface_functions.preprocess_face(
+        img=blank,
+        target_size=(input_shape_y, input_shape_x),
+        enforce_detection=False,
+        detector_backend=DETECTOR_BACKEND
+    )
+    embed_face_batch([dummy_face])
+    return time.perf_counter() - start
+
+def get_target_size() -> tuple:
+    """Ukuran input model (tinggi, lebar) untuk preprocess_face."""
+    input_shape_x, input_shape_y = deepface_functions.find_input_shape(get_face_model())
+    return (input_shape_y, input_shape_x)
+
+def preprocess_face(img, target_size: Optional[tuple] = None) -> np.ndarray:
+    """
+    Deteksi + alignment + resize wajah (tahap yang sama dengan DeepFace.represent).
+    `img` boleh berupa array BGR atau path file gambar.
+    Mengembalikan tensor (1, H, W, 3) siap masuk model.
+    Melempar ValueError jika wajah tidak terdeteksi.
+    """
+    face = deepface_functions.preprocess_face(
+        img=img,
+        target_size=target_size or get_target_size(),
+        enforce_detection=True,
+        detector_backend=DETECTOR_BACKEND
+    )
+    return deepface_functions.normalize_input(img=face, normalization='base')
+
+def decode_image(image_bytes: bytes, reduction: int = DECODE_REDUCTION):
+    """Decode bytes gambar ke array BGR, dengan reduksi ukuran saat decode (jika didukung)."""
+    flag = _REDUCED_DECODE_FLAGS.get(reduction, cv2.IMREAD_COLOR)
+    return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), flag)
+
+def locate_face(img) -> tuple:
+    """
+    Mendeteksi kotak wajah (x, y, w, h) pada salinan gambar yang diperkecil
+    (sisi terpanjang <= DETECTION_MAX_SIDE), lalu memetakannya ke koordinat `img`.
+    Melempar ValueError jika wajah tidak terdeteksi.
+    """
+    height, width = img.shape[:2]
+    scale = 1.0
+    if DETECTION_MAX_SIDE > 0 and max(height, width) > DETECTION_MAX_SIDE:
+        scale = DETECTION_MAX_SIDE / max(height, width)
+    small = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else img
+    _, region = deepface_functions.detect_face(
+        img=small,
+        detector_backend=DETECTOR_BACKEND,
+        enforce_detection=True,
+        align=False
+    )
+    return tuple(int(round(value / scale)) for value in region[:4])
+
+def crop_face(img, region: tuple, margin: float = FACE_CROP_MARGIN):
+    """Crop kotak wajah + margin (dibatasi tepi gambar)."""
+    x, y, w, h = region
+    pad_x, pad_y = int(w * margin), int(h * margin)
+    height, width = img.shape[:2]
+    x1, y1 = max(0, x - pad_x), max(0, y - pad_y)
+    x2, y2 = min(width, x + w + pad_x), min(height, y + h + pad_y)
+    return img[y1:y2, x1:x2]
+
+def preprocess_face_image(img, target_size: Optional[tuple] = None, region: Optional[tuple] = None):
+    """
+    Pipeline deteksi bertingkat untuk array BGR:
+    deteksi di salinan kecil -> crop wajah (+margin) dari gambar asli ->
+    deteksi ulang + alignment di dalam crop (murah) -> tensor model.
+    Jika deteksi ulang di crop gagal, deteksi + alignment diulang pada gambar penuh;
+    wajah yang tidak bisa di-align TIDAK pernah di-embed (vektornya tidak sebanding
+    dengan vektor galeri). `region` (hasil locate_face) boleh diberikan agar deteksi awal tidak diulang.
+    Mengembalikan (tensor (1, H, W, 3), crop_wajah_bgr). Melempar ValueError jika tidak ada wajah.
+    """
+    crop = crop_face(img, region or locate_face(img))
+    target_size = target_size or get_target_size()
+    try:
+        face = preprocess_face(crop, target_size)
+    except ValueError:
+        # Detektor kadang gagal pada crop yang ketat (buram, wajah di tepi): ulangi di gambar penuh
+        face = preprocess_face(img, target_size)
+    return face, crop
+
+def encode_thumbnail(img) -> bytes:
+    """JPEG kecil (sisi terpanjang <= THUMBNAIL_MAX_SIDE) untuk disimpan sebagai foto log."""
+    height, width = img.shape[:2]
+    scale = min(1.0, THUMBNAIL_MAX_SIDE / max(height, width))
+    if scale < 1.0:
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    ok, buffer = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_JPEG_QUALITY])
+    return buffer.tobytes() if ok else b""
+
+def preprocess_face_file(task: tuple) -> tuple:
+    """
+    Worker untuk indexing paralel (aman dipanggil di process pool: tidak membangun model).
+    task = (key, path_gambar, target_size) -> (key, tensor_wajah | None, pesan_error | None)
+    """
+    key, image_path, target_size = task
+    try:
+        img = cv2.imread(str(image_path))
+        if img is None:
+            return key, None, "Gagal membaca file gambar."
+        # Pipeline deteksi yang sama dengan /recognize agar embedding enrollment & scan konsisten
+        face, _ = preprocess_face_image(img, target_size)
+        return key, face, None
+    except Exception as e:
+        return key, None, str(e)
+
+def embed_face_batch(faces: List[np.ndarray]) -> List[List[float]]:
+    """Satu forward pass model untuk sekumpulan tensor wajah (masing-masing (1, H, W, 3))."""
+    batch = np.concatenate(faces, axis=0)
+    return get_face_model()(batch, training=False).numpy().tolist()
+
+
+# --- MICRO-BATCHING EMBEDDING ---
+
+class EmbeddingBatcher:
+    """
+    Mengumpulkan crop wajah dari beberapa request yang datang hampir bersamaan,
+    lalu menjalankan SATU forward pass batch dan membagikan hasilnya kembali.
+
+    Batch dikirim ketika sudah berisi max_batch_size wajah atau ketika
+    max_wait_ms sejak wajah pertama di batch sudah lewat (mana yang lebih dulu).
+    submit() tidak menunggu (Future); embed() = submit() yang ditunggu (blocking).
+    API memakai submit() setelah deteksi selesai, sehingga thread worker inferensi tidak
+    tertahan selama batch terkumpul dan batch bisa melebihi jumlah worker.
+    """
+
+    def __init__(self, max_batch_size: int = 8, max_wait_ms: float = 15):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self.stats = {"batches": 0, "faces": 0}
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, face: np.ndarray) -> Future:
+        future = Future()
+        self._queue.put((face, future))
+        return future
+
+    def embed(self, face: np.ndarray) -> List[float]:
+        return self.submit(face).result()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                embeddings = embed_face_batch([face for face, _ in batch])
+                for (_, future), embedding in zip(batch, embeddings):
+                    future.set_result(embedding)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            self.stats["batches"] += 1
+            self.stats["faces"] += len(batch)
 
 
 # --- FUNGSI EKSTRAKSI FITUR ---
 
-def extract_face_features(image_bytes: bytes):
+def detect_face_input(image_bytes: bytes, timings: Optional[dict] = None,
+                      thumbnails: Optional[list] = None) -> Optional[np.ndarray]:
+    """
+    Decode + deteksi + alignment satu gambar (tanpa forward pass model).
+    Mengembalikan tensor wajah siap embed, atau None jika gambar/wajah tidak valid.
+    timings diisi durasi decode & detection; thumbnails diisi JPEG crop wajah.
+    """
+    timings = timings if timings is not None else {}
+    try:
+        stage_start = time.perf_counter()
+        # 1-2. Decode bytes upload ke array BGR (tereduksi DECODE_REDUCTION di decoder JPEG)
+        img_array = decode_image(image_bytes)
+        timings["decode"] = time.perf_counter() - stage_start
+
+        if img_array is None:
+             print("❌ Gagal membaca bytes gambar. Mungkin format file tidak didukung.")
+             return None
+
+        # 3. Deteksi di salinan kecil + alignment pada crop wajah
+        stage_start = time.perf_counter()
+        face, face_crop = preprocess_face_image(img_array)
+        timings["detection"] = time.perf_counter() - stage_start
+        if thumbnails is not None:
+            thumbnails.append(encode_thumbnail(face_crop))
+        return face
+    except ValueError as ve:
+        # Menangani kesalahan DeepFace saat wajah tidak ditemukan
+        if 'Face could not be detected' in str(ve):
+             print(f"⚠️ Peringatan: Tidak ada wajah terdeteksi pada input.")
+        else:
+             print(f"⚠️ Peringatan: DeepFace gagal memproses gambar. Detail: {ve}")
+        return None
+    except Exception as e:
+        # Menangani error umum lainnya
+        print(f"❌ ERROR Ekstraksi Fitur: {e}")
+        return None
+
+def valid_embedding(embedding) -> List[List[float]]:
+    """[embedding] jika dimensinya sesuai EMBEDDING_DIM, selain itu [] (format hasil extract_face_features)."""
+    # Periksa dimensi sebagai validasi tambahan (meskipun deepface harus benar)
+    if len(embedding) != EMBEDDING_DIM:
+         print(f"❌ ERROR: Dimensi embedding ({len(embedding)}) tidak cocok dengan EMBEDDING_DIM ({EMBEDDING_DIM})")
+         return []
+    return [embedding]
+
+def extract_face_features(image_bytes: bytes, batcher: Optional[EmbeddingBatcher] = None, timings: Optional[dict] = None,
+                          thumbnails: Optional[list] = None):
     """
     Ekstraksi fitur wajah (embedding) menggunakan model DeepFace dari data bytes gambar.
     Menggunakan MODEL_NAME yang didefinisikan secara global di utils.py.
     
     Args:
         image_bytes (bytes): Data gambar yang diunggah dari frontend.
+        batcher (EmbeddingBatcher, opsional): Jika diberikan, forward pass digabung
+            dengan request lain yang datang bersamaan (micro-batching).
+        timings (dict, opsional): Diisi durasi tiap tahap (detik): decode, detection, embedding.
+        thumbnails (list, opsional): Diisi JPEG thumbnail crop wajah (untuk disimpan sebagai foto log).
         
     Returns:
         list of list[float]: List dari embedding wajah yang terdeteksi. 
                              Mengembalikan list kosong ([]) jika tidak ada wajah.
     """
     
+    timings = timings if timings is not None else {}
+    face = detect_face_input(image_bytes, timings, thumbnails)
+    if face is None:
+        return []
     try:
-        # 1. Konversi bytes (dari upload FastAPI) ke array numpy mentah
-        np_array = np.frombuffer(image_bytes, np.uint8)
-        # 2. Decode array bytes menjadi array gambar yang dapat dibaca OpenCV (cv2.imdecode)
-        img_array = cv2.imdecode(np_array, cv2.IMREAD_COLOR)
-
-        if img_array is None:
-             print("❌ Gagal membaca bytes gambar. Mungkin format file tidak didukung.")
-             return []
-
-        # 3. DeepFace.represent: menerima numpy array (img_array)
-        results = DeepFace.represent(
-            img_path=img_array, # Menerima NumPy array, bukan path file
-            model_name=MODEL_NAME, # Menggunakan konstanta global
-            enforce_detection=True, 
-            detector_backend='opencv' 
-        )
-    except ValueError as ve:
-        # Menangani kesalahan DeepFace saat wajah tidak ditemukan
-        if 'Face could not be detected' in str(ve):
-             print(f"⚠️ Peringatan: Tidak ada wajah terdeteksi pada input.")
+        # 4. Forward pass (batch jika ada batcher)
+        stage_start = time.perf_counter()
+        if batcher is not None:
+            embedding = batcher.embed(face)
         else:
-             print(f"⚠️ Peringatan: DeepFace gagal memproses gambar. Detail: {ve}")
-        return []
+            embedding = embed_face_batch([face])[0]
+        timings["embedding"] = time.perf_counter() - stage_start
     except Exception as e:
-        # Menangani error umum lainnya
         print(f"❌ ERROR Ekstraksi Fitur: {e}")
         return []
+    return valid_embedding(embedding)
+
+def extract_face_features_burst(frames: List[bytes], timings: Optional[dict] = None,
+                                thumbnails: Optional[list] = None) -> List[List[float]]:
+    """
+    Ekstraksi embedding dari beberapa frame burst (untuk fusi multi-frame).
+    Decode + deteksi per frame (frame tanpa wajah dilewati), lalu SEMUA wajah
+    di-embed dalam satu forward pass batch. Urutan hasil mengikuti urutan frame.
+
+    Returns:
+        list of list[float]: Embedding per frame yang berisi wajah ([] jika tidak ada).
+    """
+    timings = timings if timings is not None else {}
+    faces = []
+    for image_bytes in frames:
+        stage_start = time.perf_counter()
+        img_array = decode_image(image_bytes)
+        timings["decode"] = timings.get("decode", 0.0) + time.perf_counter() - stage_start
+        if img_array is None:
+            continue
 
+        stage_start = time.perf_counter()
+        try:
+            face, face_crop = preprocess_face_image(img_array)
+        except ValueError:
+            continue  # Frame buram / tanpa wajah: lewati, frame lain masih bisa dipakai
+        finally:
+            timings["detection"] = timings.get("detection", 0.0) + time.perf_counter() - stage_start
+        faces.append(face)
+        if thumbnails is not None and not thumbnails:
+            thumbnails.append(encode_thumbnail(face_crop))
 
-    if not results:
+    if not faces:
+        print("⚠️ Peringatan: Tidak ada wajah terdeteksi pada frame burst.")
         return []
 
-    # --- PERBAIKAN BUG 'float' object is not subscriptable ---
-    embeddings_list = []
-    if isinstance(results, list) and len(results) > 0:
-        if isinstance(results[0], dict):
-            # Kasus Normal: [ {'embedding': [...]}, {'embedding': [...]} ]
-            embeddings_list = [res["embedding"] for res in results]
-        elif isinstance(results[0], (float, np.float32)):
-            # Kasus Bug (1 wajah): [0.1, 0.2, 0.3, ...]
-            embeddings_list = [results] # Bungkus flat list menjadi list of lists
-        else:
-            print(f"❌ ERROR: Format output DeepFace tidak dikenal di utils.py. Tipe: {type(results[0])}")
-            return []
-    else:
-         # Kasus aneh lainnya
-         print(f"⚠️ Peringatan: DeepFace mengembalikan format tidak terduga: {results}")
-         return []
-    # --- AKHIR PERBAIKAN ---
-    
-    # Periksa dimensi sebagai validasi tambahan (meskipun deepface harus benar)
-    if embeddings_list and len(embeddings_list[0]) != EMBEDDING_DIM:
-         print(f"❌ ERROR: Dimensi embedding ({len(embeddings_list[0])}) tidak cocok dengan EMBEDDING_DIM ({EMBEDDING_DIM})")
-         return []
-         
-    return embeddings_list
\ No newline at end of file
+    stage_start = time.perf_counter()
+    try:
+        embeddings = embed_face_batch(faces)
+    except Exception as e:
+        print(f"❌ ERROR Ekstraksi Fitur (burst): {e}")
+        return []
+    timings["embedding"] = time.perf_counter() - stage_start
+    return [embedding for embedding in embeddings if len(embedding) == EMBEDDING_DIM]
+
+def extract_enrollment_embedding(image_bytes: bytes) -> List[float]:
+    """
+    Embedding satu foto enrollment (/upload_dataset) dengan model yang sudah dimuat.
+    Decode resolusi penuh dan pipeline deteksi yang sama dengan index_data.py, sehingga
+    vektornya identik dengan hasil indexing file yang sama.
+    Melempar ValueError (pesan untuk pengguna) jika foto tidak layak dijadikan dataset.
+    """
+    img = decode_image(image_bytes, reduction=1)
+    if img is None:
+        raise ValueError("File bukan gambar yang valid.")
+    try:
+        region = locate_face(img)
+    except ValueError:
+        raise ValueError("Wajah tidak terdeteksi pada gambar.")
+    if min(region[2], region[3]) < ENROLLMENT_MIN_FACE_SIDE:
+        raise ValueError(f"Wajah terlalu kecil ({region[2]}x{region[3]} px), dekatkan wajah ke kamera.")
+
+    face, _ = preprocess_face_image(img, region=region)
+    embedding = embed_face_batch([face])[0]
+    if len(embedding) != EMBEDDING_DIM:
+        raise ValueError(f"Dimensi embedding ({len(embedding)}) tidak cocok dengan EMBEDDING_DIM ({EMBEDDING_DIM}).")
+    return embedding
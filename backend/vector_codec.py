@@ -0,0 +1,52 @@
+import numpy as np
+
+# --- CODEC VEKTOR pgvector ---
+#
+# Format biner pgvector (vector_send/vector_recv):
+#   int16 dim | int16 unused | dim x float4 (big-endian)
+#
+# psycopg2 selalu menerima hasil dalam format teks, jadi kolom vector dibaca
+# lewat `vector_send(embedding)` (bytea) lalu dibungkus np.frombuffer tanpa
+# parsing string. Untuk tulis, format biner yang sama dipakai langsung oleh
+# COPY ... (FORMAT binary) (lihat backend/bulk_copy.py). Parameter query
+# (vektor kueri) tetap dikirim sebagai literal teks yang dibuat sekali dari float32.
+
+VECTOR_HEADER_BYTES = 4
+VECTOR_WIRE_DTYPE = np.dtype('>f4')
+
+
+def vector_send_sql(column: str = "embedding") -> str:
+    """Ekspresi SQL untuk membaca kolom vector dalam format biner (bytea)."""
+    return f"vector_send({column})"
+
+
+def decode_vector_binary(data) -> np.ndarray:
+    """
+    Mengubah bytea hasil vector_send() menjadi array float32 big-endian
+    (view tanpa salin di atas buffer hasil query).
+    """
+    if data is None:
+        return None
+    buf = memoryview(data)
+    dim = int.from_bytes(buf[:2], "big")
+    return np.frombuffer(buf, dtype=VECTOR_WIRE_DTYPE, count=dim, offset=VECTOR_HEADER_BYTES)
+
+
+def decode_vector_matrix(rows) -> np.ndarray:
+    """Menumpuk banyak bytea vector_send() menjadi satu matriks float32 (N x dim) native."""
+    return np.stack([decode_vector_binary(r) for r in rows]).astype(np.float32)
+
+
+def encode_vector_text(vector) -> str:
+    """
+    Literal teks pgvector ('[x1,x2,...]') dari float32.
+    9 digit signifikan cukup untuk round-trip float32 tanpa kehilangan presisi.
+    """
+    arr = np.asarray(vector, dtype=np.float32)
+    return "[" + ",".join(f"{x:.9g}" for x in arr.tolist()) + "]"
+
+
+def encode_vector_binary(vector) -> bytes:
+    """Format biner pgvector (input vector_recv / COPY binary) dari satu vektor."""
+    arr = np.asarray(vector, dtype=VECTOR_WIRE_DTYPE)
+    return len(arr).to_bytes(2, "big") + b"\x00\x00" + arr.tobytes()
@@ -0,0 +1,333 @@
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# --- ANTREAN WRITE-BEHIND (SPOOL LOKAL) ---
+#
+# Pekerjaan tulis (simpan gambar + insert log absensi) tidak lagi dikerjakan
+# sebelum respons /recognize. Setiap record ditambahkan (append) ke file spool
+# JSONL lalu diproses per batch oleh satu thread latar belakang. Setelah batch
+# berhasil, ditulis baris penanda {"done": [...]}. Saat start, record yang belum
+# punya penanda done diputar ulang (replay), sehingga crash tidak menghilangkan log.
+#
+# Handler harus idempoten (record bisa diputar ulang jika crash terjadi
+# setelah handler selesai tetapi sebelum penanda done ditulis).
+#
+# Batch yang gagal `max_attempts` kali berturut-turut dipecah per record: record
+# yang tetap gagal dipindah ke file dead-letter (<spool>.dead.jsonl) agar tidak
+# menahan record lain di belakangnya selamanya. Error sementara (`is_transient`,
+# misal DB mati) tidak dihitung: batch dicoba ulang terus tanpa dibuang.
+#
+# Multi-worker: setiap proses memakai spool sendiri (<prefix>-<slot>.jsonl) yang
+# dikunci flock. Spool milik worker yang mati (lock-nya bebas) diadopsi oleh
+# worker berikutnya yang start, sehingga record-nya tetap ditulis.
+
+MAX_SPOOL_SLOTS = 64
+_slot_lock_files = []  # File lock slot milik proses ini (dilepas OS saat proses mati)
+
+
+def caused_by(exc: BaseException, types: Tuple[type, ...]) -> bool:
+    """True jika `exc` atau salah satu penyebabnya (__cause__ / __context__) bertipe `types`."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        if isinstance(exc, types):
+            return True
+        seen.add(id(exc))
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+def _try_flock(path: Path):
+    f = open(path, "a")
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def claim_spool_slot(directory: Path, prefix: str) -> Tuple[Path, List[Path], Callable[[], None]]:
+    """
+    Memilih slot spool bebas untuk proses ini. Mengembalikan (spool milik proses ini,
+    spool yatim untuk diadopsi, fungsi pelepas lock spool yatim). Slot 0 juga
+    mengadopsi spool lama tanpa slot (<prefix>.jsonl, sebelum multi-worker).
+    """
+    directory = Path(directory)
+    os.makedirs(directory, exist_ok=True)
+    own_slot = None
+    orphan_locks = []
+    orphans: List[Path] = []
+    for slot in range(MAX_SPOOL_SLOTS):
+        spool_path = directory / f"{prefix}-{slot}.jsonl"
+        if own_slot is not None and not spool_path.exists():
+            continue
+        lock_file = _try_flock(directory / f"{prefix}-{slot}.lock")
+        if lock_file is None:
+            continue  # Dipakai worker lain yang masih hidup
+        if own_slot is None:
+            own_slot = slot
+            _slot_lock_files.append(lock_file)
+        else:
+            orphan_locks.append(lock_file)
+            orphans.append(spool_path)
+    if own_slot is None:
+        raise RuntimeError(f"Semua {MAX_SPOOL_SLOTS} slot spool '{prefix}' sedang dipakai.")
+    if own_slot == 0 and (directory / f"{prefix}.jsonl").exists():
+        orphans.append(directory / f"{prefix}.jsonl")
+
+    def release_orphans():
+        for lock_file in orphan_locks:
+            lock_file.close()
+        orphan_locks.clear()
+
+    return directory / f"{prefix}-{own_slot}.jsonl", orphans, release_orphans
+
+
+class WriteBehindQueue:
+    """Antrean tulis tahan-crash dengan spool append-only dan flush per batch."""
+
+    def __init__(self, spool_path: Path, handler: Callable[[List[dict]], None],
+                 batch_size: int = 50, flush_interval_ms: float = 200, fsync: bool = False,
+                 adopt_paths: Iterable[Path] = (), max_attempts: int = 5,
+                 is_transient: Callable[[Exception], bool] = lambda e: False):
+        self.spool_path = Path(spool_path)
+        self.dead_letter_path = self.spool_path.with_suffix(".dead.jsonl")
+        self.handler = handler
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.fsync = fsync
+        self.max_attempts = max(1, max_attempts)
+        self.is_transient = is_transient
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._file_lock = threading.Lock()
+        self._stopping = False
+        self._paused = 0         # > 0: thread tidak mengambil batch baru (lihat paused())
+        self._inflight = False   # True selama handler sedang menulis batch
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"enqueued": 0, "written": 0, "replayed": 0, "failed_batches": 0, "dead_lettered": 0}
+
+        os.makedirs(self.spool_path.parent, exist_ok=True)
+        self._replay(list(adopt_paths))
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def pending_records(self) -> List[dict]:
+        """Salinan record yang belum ditulis (untuk pembacaan konsisten sebelum flush)."""
+        with self._cond:
+            return list(self._pending)
+
+    @staticmethod
+    def _read_pending(spool_path: Path) -> Dict[str, dict]:
+        """Record di spool yang belum punya penanda done."""
+        records: Dict[str, dict] = {}
+        if not spool_path.exists():
+            return records
+        with open(spool_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Baris terakhir terpotong saat crash
+                if "done" in entry:
+                    for record_id in entry["done"]:
+                        records.pop(record_id, None)
+                else:
+                    records[entry["id"]] = entry
+        return records
+
+    def _replay(self, adopt_paths: List[Path]):
+        """
+        Memuat record yang belum selesai dari spool sendiri (setelah crash / restart)
+        dan dari spool yatim worker lain. Spool yatim dihapus setelah record-nya
+        tersimpan di spool sendiri.
+        """
+        records = self._read_pending(self.spool_path)
+        own = len(records)
+        for path in adopt_paths:
+            records.update(self._read_pending(path))
+        self._pending.extend(records.values())
+        self.stats["replayed"] = len(records)
+        # Tulis ulang spool hanya berisi record yang masih pending
+        self._rewrite_spool(list(records.values()))
+        for path in adopt_paths:
+            os.remove(path)
+        if records:
+            adopted = f" ({len(records) - own} dari spool worker lain)" if len(records) > own else ""
+            print(f"♻️ Write-behind: {len(records)} record dari spool diputar ulang{adopted}.")
+
+    def _rewrite_spool(self, records: List[dict]):
+        tmp_path = self.spool_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        os.replace(tmp_path, self.spool_path)
+
+    def _append(self, entry: dict):
+        """Append satu baris ke spool. Pemanggil wajib memegang _file_lock."""
+        with open(self.spool_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def enqueue(self, record: dict) -> str:
+        """Menambahkan record ke spool + antrean memori. Mengembalikan id record."""
+        record = dict(record)
+        record.setdefault("id", uuid.uuid4().hex)
+        # Urutan kunci: _file_lock -> _cond (sama dengan _mark_done)
+        with self._file_lock:
+            self._append(record)
+            with self._cond:
+                self._pending.append(record)
+                self.stats["enqueued"] += 1
+                if len(self._pending) >= self.batch_size:
+                    self._cond.notify_all()
+        return record["id"]
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    @contextmanager
+    def paused(self):
+        """
+        Menahan penulisan: menunggu batch yang sedang ditulis selesai, lalu tidak ada
+        batch baru sampai blok selesai. enqueue tetap berjalan. Dipakai reset harian
+        agar log yang masih di antrean tidak masuk ke DB setelah DELETE.
+        """
+        with self._cond:
+            self._paused += 1
+            while self._inflight:
+                self._cond.wait()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._paused -= 1
+                self._cond.notify_all()
+
+    def discard(self, predicate: Callable[[dict], bool]) -> int:
+        """
+        Membuang record pending yang cocok `predicate` (ditandai done di spool agar tidak
+        diputar ulang). Wajib dipanggil di dalam paused(). Mengembalikan jumlah record.
+        """
+        with self._file_lock:
+            with self._cond:
+                if not self._paused:
+                    raise RuntimeError("discard() harus dipanggil di dalam paused().")
+                kept, dropped = deque(), []
+                for record in self._pending:
+                    (dropped if predicate(record) else kept).append(record)
+                if not dropped:
+                    return 0
+                self._pending = kept
+                drained = not kept
+            if drained:
+                open(self.spool_path, "w").close()
+            else:
+                self._append({"done": [record["id"] for record in dropped]})
+        return len(dropped)
+
+    def _take_batch(self) -> List[dict]:
+        with self._cond:
+            if (not self._pending or self._paused) and not self._stopping:
+                self._cond.wait(self.flush_interval)
+            if self._paused:
+                return []
+            batch = [self._pending[i] for i in range(min(self.batch_size, len(self._pending)))]
+            self._inflight = bool(batch)
+            return batch
+
+    def _finish_batch(self):
+        with self._cond:
+            self._inflight = False
+            self._cond.notify_all()
+
+    def _isolate_failures(self, batch: List[dict]):
+        """Batch terus gagal: tulis per record, record yang gagal dipindah ke dead-letter."""
+        for index, record in enumerate(batch):
+            try:
+                self.handler([record])
+                self.stats["written"] += 1
+            except Exception as e:
+                if self.is_transient(e):
+                    # Bukan record rusak: record yang sudah selesai (tertulis / dead-letter) ditandai
+                    # done agar tidak dikirim & dihitung ulang, sisanya dicoba ulang sebagai batch
+                    if index:
+                        self._mark_done(batch[:index], written=0)
+                    raise
+                with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"error": str(e), "failed_at": time.time(), "record": record}) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                self.stats["dead_lettered"] += 1
+                print(f"☠️ Write-behind: record {record['id']} dipindah ke {self.dead_letter_path.name} ({e}).")
+
+    def _run(self):
+        backoff = 1.0
+        attempts = 0
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                if self._stopping:
+                    return
+                continue
+            try:
+                if attempts >= self.max_attempts:
+                    self._isolate_failures(batch)
+                    written = 0  # Sudah dihitung per record
+                else:
+                    self.handler(batch)
+                    written = len(batch)
+            except Exception as e:
+                self._finish_batch()
+                self.stats["failed_batches"] += 1
+                if not self.is_transient(e):
+                    attempts += 1
+                print(f"❌ Write-behind: batch {len(batch)} record gagal ({e}), percobaan {attempts}/{self.max_attempts}. "
+                      f"Coba lagi dalam {backoff:.0f}s.")
+                if self._stopping:
+                    return  # Biarkan di spool; diputar ulang saat start berikutnya
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            backoff = 1.0
+            attempts = 0
+            try:
+                self._mark_done(batch, written)
+            finally:
+                self._finish_batch()
+
+    def _mark_done(self, batch: List[dict], written: int):
+        done_ids = [record["id"] for record in batch]
+        with self._file_lock:
+            with self._cond:
+                for _ in batch:
+                    self._pending.popleft()
+                self.stats["written"] += written
+                drained = not self._pending
+            if drained:
+                # Semua sudah tertulis -> kosongkan spool agar tidak tumbuh terus
+                open(self.spool_path, "w").close()
+            else:
+                self._append({"done": done_ids})
+
+    def stop(self, timeout: float = 5.0):
+        """Menghentikan thread setelah mencoba mengosongkan antrean (sisa tetap di spool)."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
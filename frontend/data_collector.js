@@ -57,10 +57,15 @@ async function captureFrame() {
 
   canvas.toBlob(async (blob) => {
     const res = await uploadImage(blob);
+    if (res.status !== "success") {
+      // Foto ditolak server (wajah tidak terdeteksi / terlalu kecil): tidak dihitung
+      updateStatus(`Gambar ditolak: ${res.detail || res.message}`, "warning");
+      return;
+    }
     capturedCount++;
     updateStatus(
       `Gambar ke-${capturedCount} tersimpan (${res.message})`,
-      "success"
+      res.enrolled === false ? "warning" : "success"
     );
 
     if (capturedCount >= TARGET_COUNT) {
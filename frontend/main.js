@@ -13,6 +13,89 @@ const resultCardBody = document.getElementById("resultCardBody");
 let stream = null;
 let isProcessing = false; // Mencegah klik ganda
 
+// --- WebSocket /ws/recognize (satu koneksi per kiosk, fallback ke POST /recognize) ---
+const WS_RECOGNIZE_URL = `${API_BASE_URL.replace(/^http/, "ws")}/ws/recognize`;
+const WS_RESULT_TIMEOUT_MS = 15000;
+let recognizeSocket = null;
+let wsFrameSeq = 0; // Cermin penghitung "frame" server per koneksi (naik setiap pesan biner)
+let pendingWsResult = null; // { frame, resolve, reject, timer } untuk frame yang sedang ditunggu
+
+function settlePendingWsResult() {
+  const pending = pendingWsResult;
+  if (pending) {
+    clearTimeout(pending.timer);
+    pendingWsResult = null;
+  }
+  return pending;
+}
+
+function connectRecognizeSocket() {
+  const socket = new WebSocket(WS_RECOGNIZE_URL);
+  socket.binaryType = "arraybuffer";
+  socket.onmessage = (event) => {
+    const data = JSON.parse(event.data);
+    if (data.event === "result") {
+      // Hasil frame lama (misal datang setelah timeout) dibuang, bukan dipakai untuk orang berikutnya
+      if (!pendingWsResult || data.frame !== pendingWsResult.frame) {
+        console.warn(`Hasil WebSocket frame ${data.frame} diabaikan (tidak sedang ditunggu).`);
+        return;
+      }
+      settlePendingWsResult().resolve(data);
+    } else if (data.event === "error") {
+      console.error("WebSocket recognize error:", data.message);
+    }
+  };
+  socket.onclose = () => {
+    if (recognizeSocket === socket) recognizeSocket = null;
+    const pending = settlePendingWsResult();
+    if (pending) pending.reject(new Error("Koneksi WebSocket terputus."));
+    setTimeout(connectRecognizeSocket, 3000); // Sambung ulang otomatis
+  };
+  socket.onopen = () => {
+    wsFrameSeq = 0; // Server memulai hitungan frame dari awal untuk setiap koneksi
+    recognizeSocket = socket;
+  };
+}
+
+async function recognizeViaWebSocket(imageBlob, typeAbsensi) {
+  const buffer = await imageBlob.arrayBuffer();
+  const socket = recognizeSocket;
+  const previous = settlePendingWsResult();
+  if (previous) previous.reject(new Error("Digantikan oleh frame baru."));
+
+  return new Promise((resolve, reject) => {
+    const frame = wsFrameSeq + 1;
+    const timer = setTimeout(() => {
+      if (pendingWsResult && pendingWsResult.frame === frame) pendingWsResult = null;
+      reject(new Error("Timeout menunggu hasil WebSocket."));
+    }, WS_RESULT_TIMEOUT_MS);
+    pendingWsResult = { frame, resolve, reject, timer };
+    try {
+      socket.send(JSON.stringify({ type_absensi: typeAbsensi }));
+      socket.send(buffer);
+      wsFrameSeq = frame;
+    } catch (error) {
+      settlePendingWsResult();
+      reject(error);
+    }
+  });
+}
+
+async function recognizeViaHttp(imageBlob, typeAbsensi) {
+  const formData = new FormData();
+  formData.append("file", imageBlob, "capture.jpg");
+  formData.append("type_absensi", typeAbsensi);
+
+  const response = await fetch(`${API_BASE_URL}/recognize`, {
+    method: "POST",
+    body: formData,
+  });
+  if (!response.ok) {
+    throw new Error(`HTTP error! status: ${response.status}`);
+  }
+  return response.json();
+}
+
 // --- Variabel untuk Liveness Detection ---
 let faceMesh = null;
 let livenessCheckActive = false; // Status apakah kita sedang mencari kedipan
@@ -203,18 +286,10 @@ async function performAbsensi(typeAbsensi) {
     if (!imageBlob) {
       throw new Error("Gagal mengambil gambar setelah liveness check.");
     }
-    const formData = new FormData();
-    formData.append("file", imageBlob, "capture.jpg");
-    formData.append("type_absensi", typeAbsensi);
-
-    const response = await fetch(`${API_BASE_URL}/recognize`, {
-      method: "POST",
-      body: formData,
-    });
-    if (!response.ok) {
-      throw new Error(`HTTP error! status: ${response.status}`);
-    }
-    const data = await response.json();
+    const data =
+      recognizeSocket && recognizeSocket.readyState === WebSocket.OPEN
+        ? await recognizeViaWebSocket(imageBlob, typeAbsensi)
+        : await recognizeViaHttp(imageBlob, typeAbsensi);
     handleAbsensiResult(data);
   } catch (error) {
     console.error("Error Absensi:", error);
@@ -340,6 +415,7 @@ function handleAbsensiResult(data) {
 window.onload = () => {
   initializeMediaPipe();
   startCamera();
+  connectRecognizeSocket();
   absenMasukBtn.addEventListener("click", () => startLivenessCheck("IN"));
   absenPulangBtn.addEventListener("click", () => startLivenessCheck("OUT"));
 };
@@ -141,19 +141,22 @@ async function runIndexing(indexingButton) { // Terima tombol sebagai argumen
 
   try {
     const res = await fetch(`${API_BASE_URL}/run_indexing`, { method: "POST" });
+    const data = await res.json();
 
-    if (!res.ok) {
-      const errData = await res.json();
-      throw new Error(errData.detail || `HTTP Error ${res.status}`);
+    // 409 = job lain sedang berjalan: ikuti progresnya saja
+    if (!res.ok && res.status !== 409) {
+      throw new Error(data.detail || `HTTP Error ${res.status}`);
     }
 
-    const data = await res.json();
-
-    updateStatus(
-      data.message +
-        " Silakan tunggu beberapa menit, lalu klik 'Sinkronisasi Database' untuk memuat hasil baru.",
-      "success"
-    );
+    const finalStatus = await pollIndexingStatus();
+    if (finalStatus.state === "succeeded") {
+      updateStatus(`Indexing selesai: ${finalStatus.images_done} gambar diproses, ${finalStatus.images_failed} gagal.`, "success");
+      fetchRegisteredFaces(document.getElementById("facesTableBody"));
+    } else if (finalStatus.state === "cancelled") {
+      updateStatus("Indexing dibatalkan. Data yang sudah selesai tetap tersimpan.", "warning");
+    } else {
+      updateStatus(`Indexing gagal: ${finalStatus.error || "lihat log server"}`, "error");
+    }
   } catch (error) {
     console.error("Error starting indexing:", error);
     updateStatus(`Gagal memulai indexing: ${error.message}`, "error");
@@ -163,6 +166,24 @@ async function runIndexing(indexingButton) { // Terima tombol sebagai argumen
   }
 }
 
+// Memantau /indexing/status sampai job selesai (berhasil, gagal, atau dibatalkan)
+async function pollIndexingStatus() {
+  while (true) {
+    const res = await fetch(`${API_BASE_URL}/indexing/status`);
+    const status = await res.json();
+    if (!["running", "cancelling"].includes(status.state)) {
+      return status;
+    }
+    const eta = status.eta_seconds != null ? `, sisa ±${Math.ceil(status.eta_seconds)} detik` : "";
+    updateStatus(
+      `Indexing (${status.phase}): ${status.images_done}/${status.total_images} gambar ` +
+        `(${status.images_per_second} gambar/s${eta}). Error: ${status.errors.length}.`,
+      "warning"
+    );
+    await new Promise((resolve) => setTimeout(resolve, 1000));
+  }
+}
+
 // --- EKSEKUSI UTAMA (SETELAH HALAMAN SIAP) ---
 window.onload = () => {
   // 1. Ambil semua elemen penting SEKARANG (setelah HTML ada)
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Modul backend diimpor sebagai paket `backend.*` (sama seperti saat API berjalan)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
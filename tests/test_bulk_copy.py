@@ -0,0 +1,48 @@
+import struct
+
+import numpy as np
+
+from backend.bulk_copy import PGCOPY_HEADER, PGCOPY_TRAILER, encode_binary_copy
+
+
+def _read_fields(row: bytes):
+    """Memecah satu tuple COPY binary menjadi daftar field (None untuk NULL)."""
+    (count,) = struct.unpack(">h", row[:2])
+    fields, offset = [], 2
+    for _ in range(count):
+        (length,) = struct.unpack(">i", row[offset:offset + 4])
+        offset += 4
+        if length == -1:
+            fields.append(None)
+            continue
+        fields.append(row[offset:offset + length])
+        offset += length
+    assert offset == len(row)
+    return fields
+
+
+def test_header_and_trailer():
+    chunks = list(encode_binary_copy([], ["int4"]))
+    assert chunks == [PGCOPY_HEADER, PGCOPY_TRAILER]
+    # Signature 11 byte + flags int32 + panjang ekstensi header int32
+    assert PGCOPY_HEADER == b"PGCOPY\n\xff\r\n\x00" + b"\x00" * 8
+    assert PGCOPY_TRAILER == b"\xff\xff"
+
+
+def test_scalar_fields_and_null():
+    chunks = list(encode_binary_copy([(7, None, "Budi", 1.5, 2)], ["int4", "text", "text", "float8", "int2"]))
+    assert len(chunks) == 3
+    fields = _read_fields(chunks[1])
+    assert fields[0] == struct.pack(">i", 7)
+    assert fields[1] is None
+    assert fields[2] == "Budi".encode("utf-8")
+    assert fields[3] == struct.pack(">d", 1.5)
+    assert fields[4] == struct.pack(">h", 2)
+
+
+def test_vector_layout():
+    vector = np.array([1.0, -0.5, 0.25], dtype=np.float32)
+    (payload,) = _read_fields(list(encode_binary_copy([(vector,)], ["vector"]))[1])
+    # Format vector_recv pgvector: int16 dim | int16 unused | dim x float4 big-endian
+    assert payload[:4] == struct.pack(">hh", 3, 0)
+    np.testing.assert_array_equal(np.frombuffer(payload[4:], dtype=">f4"), vector)
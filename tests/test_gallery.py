@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from backend.gallery import CentroidIndex, fuse_matches, is_confident
+
+
+def _index():
+    index = CentroidIndex(dim=3)
+    index.load([
+        (1, "Andi", "A", "Intern", [1.0, 0.0, 0.0]),
+        (2, "Budi", "B", "Intern", [0.0, 1.0, 0.0]),
+        (2, "Budi", "B", "Intern", [0.0, 0.8, 0.6]),  # Prototipe kedua intern yang sama
+        (3, "Citra", "C", "Intern", [0.0, 0.0, 1.0]),
+    ])
+    return index
+
+
+def test_search_topk_orders_unique_interns_by_distance():
+    topk = _index().search_topk(np.array([0.1, 1.0, 0.2]), k=2)
+
+    assert [entry[0] for entry in topk] == [2, 3]
+    assert topk[0][1:4] == ("Budi", "B", "Intern")
+    assert topk[0][-1] < topk[1][-1]
+    # Jarak cosine = 1 - cos(q, baris terdekat intern)
+    q = np.array([0.1, 1.0, 0.2]) / np.linalg.norm([0.1, 1.0, 0.2])
+    assert topk[0][-1] == pytest.approx(1.0 - max(q[1], 0.8 * q[1] + 0.6 * q[2]), abs=1e-6)
+
+
+def test_search_topk_empty_gallery_and_large_k():
+    assert CentroidIndex(dim=3).search_topk(np.ones(3), k=5) == []
+    assert len(_index().search_topk(np.ones(3), k=10)) == 3
+
+
+def _confident(topk):
+    return is_confident(topk, threshold=0.3, margin=0.1)
+
+
+@pytest.mark.parametrize("method", ["mean", "vote"])
+def test_fuse_matches_stops_at_first_confident_frame(method):
+    frames = [np.array([1.0, 0.05, 0.0]), np.array([1.0, 0.0, 0.05]), np.array([0.0, 1.0, 0.0])]
+    topk, used = fuse_matches(_index().search_topk, frames, 2, _confident, method=method)
+
+    assert used == 1
+    assert topk[0][0] == 1
+
+
+@pytest.mark.parametrize("method", ["mean", "vote"])
+def test_fuse_matches_uses_every_frame_when_never_confident(method):
+    # Tiap frame ambigu di antara Andi dan Citra
+    frames = [np.array([1.0, 0.0, 0.9]), np.array([0.9, 0.0, 1.0])]
+    topk, used = fuse_matches(_index().search_topk, frames, 2, _confident, method=method)
+
+    assert used == 2
+    assert {entry[0] for entry in topk} == {1, 3}
+
+
+def test_fuse_matches_mean_averages_normalized_frames():
+    index = _index()
+    frames = [np.array([2.0, 0.0, 0.0]), np.array([0.0, 0.0, 1.0])]
+    topk, used = fuse_matches(index.search_topk, frames, 3, lambda topk: False, method="mean")
+
+    assert used == 2
+    expected = index.search_topk(np.array([0.5, 0.0, 0.5]), 3)
+    assert [entry[:-1] for entry in topk] == [entry[:-1] for entry in expected]
+    assert [entry[-1] for entry in topk] == pytest.approx([entry[-1] for entry in expected], abs=1e-6)
+
+
+def test_fuse_matches_without_frames():
+    assert fuse_matches(_index().search_topk, [], 2, _confident) == ([], 0)
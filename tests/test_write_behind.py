@@ -0,0 +1,122 @@
+import json
+import threading
+import time
+
+from backend import write_behind
+from backend.write_behind import WriteBehindQueue, caused_by
+
+
+def _write_spool(path, entries):
+    with open(path, "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+
+
+def test_replay_skips_records_with_done_marker(tmp_path):
+    spool = tmp_path / "attendance-0.jsonl"
+    _write_spool(spool, [
+        {"id": "a", "name": "Andi"},
+        {"id": "b", "name": "Budi"},
+        {"done": ["a"]},
+        {"id": "c", "name": "Citra"},
+    ])
+    with open(spool, "a", encoding="utf-8") as f:
+        f.write('{"id": "d", "na')  # Baris terakhir terpotong saat crash
+
+    queue = WriteBehindQueue(spool, handler=lambda batch: None)
+
+    assert [record["id"] for record in queue.pending_records()] == ["b", "c"]
+    assert queue.stats["replayed"] == 2
+    # Spool ditulis ulang hanya berisi record yang masih pending
+    assert [json.loads(line)["id"] for line in spool.read_text().splitlines()] == ["b", "c"]
+
+
+def test_replay_adopts_orphan_spool(tmp_path):
+    spool, orphan = tmp_path / "attendance-0.jsonl", tmp_path / "attendance-1.jsonl"
+    _write_spool(spool, [{"id": "a"}])
+    _write_spool(orphan, [{"id": "b"}, {"id": "c"}, {"done": ["c"]}])
+
+    queue = WriteBehindQueue(spool, handler=lambda batch: None, adopt_paths=[orphan])
+
+    assert [record["id"] for record in queue.pending_records()] == ["a", "b"]
+    assert not orphan.exists()
+
+
+def test_flushed_records_are_not_replayed(tmp_path):
+    spool = tmp_path / "attendance-0.jsonl"
+    written = []
+    queue = WriteBehindQueue(spool, handler=written.extend, batch_size=2)
+    for name in ("Andi", "Budi", "Citra"):
+        queue.enqueue({"name": name})
+    queue.start()
+    queue.stop()
+
+    assert [record["name"] for record in written] == ["Andi", "Budi", "Citra"]
+    assert queue.depth == 0
+    assert WriteBehindQueue(spool, handler=lambda batch: None).pending_records() == []
+
+
+class _OutageError(Exception):
+    """Pengganti psycopg2.OperationalError (DB mati)."""
+
+
+def _run_until_written(queue, written, count):
+    queue.start()
+    deadline = time.monotonic() + 5
+    while len(written) < count and time.monotonic() < deadline:
+        threading.Event().wait(0.01)  # time.sleep di-monkeypatch pada tes ini
+    queue.stop()
+
+
+def test_db_outage_is_retried_without_dead_letter(tmp_path, monkeypatch):
+    monkeypatch.setattr(write_behind.time, "sleep", lambda seconds: None)
+    written, calls = [], []
+
+    def connect_db():
+        # Seperti main.connect_db: error psycopg2 dibungkus Exception biasa
+        try:
+            raise _OutageError("connection refused")
+        except _OutageError as e:
+            raise Exception("Database PostgreSQL tidak terhubung/konfigurasi salah.") from e
+
+    def handler(batch):
+        calls.append(len(batch))
+        if len(calls) <= 3:
+            connect_db()
+        written.extend(batch)
+
+    queue = WriteBehindQueue(tmp_path / "attendance-0.jsonl", handler, max_attempts=1,
+                             is_transient=lambda e: caused_by(e, (_OutageError,)))
+    for name in ("Andi", "Budi"):
+        queue.enqueue({"name": name})
+    _run_until_written(queue, written, 2)
+
+    assert [record["name"] for record in written] == ["Andi", "Budi"]
+    assert queue.stats["dead_lettered"] == 0
+    assert not queue.dead_letter_path.exists()
+
+
+def test_isolation_does_not_resend_written_records(tmp_path, monkeypatch):
+    monkeypatch.setattr(write_behind.time, "sleep", lambda seconds: None)
+    written, outage = [], {"on": False}
+
+    def handler(batch):
+        if len(batch) > 1:
+            raise ValueError("batch ditolak")  # Paksa isolasi per record
+        if batch[0]["name"] == "Citra" and not outage["on"]:
+            outage["on"] = True
+            raise _OutageError("connection reset")
+        if batch[0]["name"] == "Budi":
+            raise ValueError("record rusak")
+        written.extend(batch)
+
+    queue = WriteBehindQueue(tmp_path / "attendance-0.jsonl", handler, max_attempts=1,
+                             is_transient=lambda e: isinstance(e, _OutageError))
+    for name in ("Andi", "Budi", "Citra"):
+        queue.enqueue({"name": name})
+    _run_until_written(queue, written, 2)
+
+    assert [record["name"] for record in written] == ["Andi", "Citra"]
+    assert queue.stats["written"] == 2
+    assert queue.stats["dead_lettered"] == 1
+    assert len(queue.dead_letter_path.read_text().splitlines()) == 1